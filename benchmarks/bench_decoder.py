@@ -0,0 +1,59 @@
+#
+# benchmarks/bench_decoder.py
+#
+# Decode + OrderBook throughput of the synthetic full channel feed for each
+# WebsocketClient decoder setting.
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_decoder.py [--messages 200000]
+
+from __future__ import print_function
+import argparse
+import json
+import time
+from decimal import Decimal
+
+from cbpro.order_book import OrderBook, fixed_point_parser
+from cbpro.websocket_client import WebsocketClient
+
+from bench_order_book import make_book_and_feed, load_snapshot
+
+PRODUCT = {'id': 'BTC-USD', 'quote_increment': '0.01',
+           'base_increment': '0.00000001'}
+
+
+def run(frames, snapshot, book, **decoder_kwargs):
+    decode = WebsocketClient(channels=['full'], **decoder_kwargs)._decode
+    load_snapshot(book, snapshot)
+    start = time.perf_counter()
+    for frame in frames:
+        book.process_message(decode(frame))
+    return len(frames) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Decode + OrderBook throughput per decoder setting")
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    snapshot, feed = make_book_and_feed(200, 200, args.messages)
+    frames = [json.dumps(msg) for msg in feed]
+    to_ticks = fixed_point_parser(PRODUCT['quote_increment'])
+    to_lots = fixed_point_parser(PRODUCT['base_increment'])
+    ticks = {'price': to_ticks, 'size': to_lots, 'remaining_size': to_lots,
+             'new_size': to_lots}
+    cases = [
+        ('json', OrderBook(compact=True), {'decoder': 'json'}),
+        ('fastest installed', OrderBook(compact=True), {}),
+        ('fastest installed, Decimal', OrderBook(compact=True),
+         {'parse_numbers': Decimal}),
+        ('json, fixed point book', OrderBook(compact=True, fixed_point=PRODUCT),
+         {'decoder': 'json'}),
+        ('fastest installed, ticks, fixed point book',
+         OrderBook(compact=True, fixed_point=PRODUCT),
+         {'parse_numbers': ticks}),
+    ]
+    for name, book, kwargs in cases:
+        print('{}: {:,.0f} messages/sec'.format(
+            name, run(frames, snapshot, book, **kwargs)))
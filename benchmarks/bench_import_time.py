@@ -0,0 +1,44 @@
+#
+# benchmarks/bench_import_time.py
+#
+# Cumulative import time of `cbpro` and the modules it pulls in, from
+# `python -X importtime`.
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_import_time.py [--runs 5] [--top 10]
+
+from __future__ import print_function
+import argparse
+import subprocess
+import sys
+
+
+def import_times(statement):
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--statement', default='import cbpro')
+    args = parser.parse_args()
+
+    runs = [import_times(args.statement) for _ in range(args.runs)]
+    # the first run pays for cold bytecode caches
+    best = {}
+    for times in runs:
+        for name, us in times.items():
+            best[name] = min(best.get(name, us), us)
+    print('{!r}: best of {} runs'.format(args.statement, args.runs))
+    for name, us in sorted(best.items(), key=lambda i: -i[1])[:args.top]:
+        print('{:>10.1f} ms  {}'.format(us / 1000.0, name))
@@ -0,0 +1,92 @@
+#
+# benchmarks/bench_l2_order_book.py
+#
+# Throughput of L2OrderBook against OrderBook on equivalent feeds: the
+# level2 feed is derived from the synthetic full channel feed by
+# aggregating every level-3 message into the l2update it would cause.
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_l2_order_book.py [--messages 200000]
+
+from __future__ import print_function
+import argparse
+import time
+
+from cbpro.order_book import OrderBook, L2OrderBook
+
+from bench_order_book import make_book_and_feed, run
+
+
+def lots(size):
+    return int(round(float(size) * 10 ** 8))
+
+
+def make_l2_feed(snapshot, feed):
+    """Aggregate a level-3 snapshot and feed into level2 messages."""
+    totals = {}
+    sides = {}
+    for side, key in (('buy', 'bids'), ('sell', 'asks')):
+        for price, size, order_id in snapshot[key]:
+            totals[side, price] = totals.get((side, price), 0) + lots(size)
+            sides[order_id] = (side, price, lots(size))
+
+    def levels(side):
+        return [[p, '{:.8f}'.format(t / 10.0 ** 8)]
+                for (s, p), t in totals.items() if s == side]
+
+    l2_snapshot = {'type': 'snapshot', 'product_id': 'BTC-USD',
+                   'bids': levels('buy'), 'asks': levels('sell')}
+    l2_feed = []
+    for msg in feed:
+        msg_type = msg['type']
+        if msg_type == 'open':
+            side, price, size = msg['side'], msg['price'], \
+                lots(msg['remaining_size'])
+            sides[msg['order_id']] = (side, price, size)
+            delta = size
+        elif msg_type == 'done':
+            side, price, size = sides.pop(msg['order_id'])
+            delta = -size
+        elif msg_type == 'match':
+            side, price, size = sides[msg['maker_order_id']]
+            delta = -lots(msg['size'])
+            if size + delta == 0:
+                del sides[msg['maker_order_id']]
+            else:
+                sides[msg['maker_order_id']] = (side, price, size + delta)
+        else:
+            side, price, size = sides[msg['order_id']]
+            delta = lots(msg['new_size']) - size
+            sides[msg['order_id']] = (side, price, size + delta)
+        total = totals.get((side, price), 0) + delta
+        if total:
+            totals[side, price] = total
+        else:
+            totals.pop((side, price), None)
+        l2_feed.append({'type': 'l2update', 'product_id': 'BTC-USD',
+                        'changes': [[side, price,
+                                     '{:.8f}'.format(total / 10.0 ** 8)]]})
+    return l2_snapshot, l2_feed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Throughput of L2OrderBook against OrderBook")
+    parser.add_argument('--levels', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    snapshot, feed = make_book_and_feed(args.levels, args.depth, args.messages)
+    l2_snapshot, l2_feed = make_l2_feed(snapshot, feed)
+
+    rate = run(OrderBook(product_id='BTC-USD'), snapshot, feed)
+    print('OrderBook (full): {:,.0f} messages/sec'.format(rate))
+
+    book = L2OrderBook(product_id='BTC-USD')
+    book.process_message(l2_snapshot)
+    start = time.perf_counter()
+    for msg in l2_feed:
+        book.process_message(msg)
+    rate = len(l2_feed) / (time.perf_counter() - start)
+    print('L2OrderBook (level2): {:,.0f} messages/sec'.format(rate))
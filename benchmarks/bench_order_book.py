@@ -0,0 +1,164 @@
+#
+# benchmarks/bench_order_book.py
+#
+# Synthetic level-3 feed benchmark for cbpro.OrderBook.
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_order_book.py [--levels 200] [--depth 200]
+#                                                      [--messages 200000]
+#
+# Also times canceling and re-adding the last order of a single deep
+# level, whose cost should not grow with the number of orders on it.
+
+from __future__ import print_function
+import argparse
+import random
+import time
+import uuid
+
+from cbpro.order_book import OrderBook
+
+
+def make_book_and_feed(levels=200, depth=200, messages=200000, seed=1):
+    """Build a synthetic resting book and a stream of full channel messages.
+
+    The stream is a mix of `open`, `done`, `match` and `change` messages that
+    only ever reference orders resting in the book, so every message does
+    real work.
+
+    Returns:
+        tuple: (snapshot, messages) where `snapshot` has the same shape as
+            a level-3 `get_product_order_book` response.
+
+    """
+    rng = random.Random(seed)
+    resting = {'buy': {}, 'sell': {}}
+    snapshot = {'sequence': 0, 'bids': [], 'asks': []}
+
+    def new_order(side, tick):
+        order_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        size = '{:.8f}'.format(rng.randint(1, 10 ** 8) / 10 ** 8)
+        price = '{:.2f}'.format(tick / 100.0)
+        resting[side].setdefault(price, []).append([order_id, size])
+        return price, size, order_id
+
+    for i in range(levels):
+        for _ in range(depth):
+            snapshot['bids'].append(list(new_order('buy', 1000000 - i)))
+            snapshot['asks'].append(list(new_order('sell', 1000001 + i)))
+
+    feed = []
+    for sequence in range(1, messages + 1):
+        side = rng.choice(('buy', 'sell'))
+        book = resting[side]
+        kind = rng.random()
+        msg = {'sequence': sequence, 'product_id': 'BTC-USD', 'side': side}
+        if kind < 0.4 or not book:
+            offset = rng.randrange(levels)
+            tick = 1000000 - offset if side == 'buy' else 1000001 + offset
+            price, size, order_id = new_order(side, tick)
+            msg.update(type='open', order_id=order_id, price=price,
+                       remaining_size=size)
+        else:
+            price = rng.choice(list(book))
+            level = book[price]
+            if kind < 0.75:
+                order_id, size = level.pop(rng.randrange(len(level)))
+                msg.update(type='done', order_id=order_id, price=price,
+                           remaining_size=size, reason='canceled')
+            elif kind < 0.9:
+                order_id, size = level[0]
+                msg.update(type='match', maker_order_id=order_id,
+                           taker_order_id=str(uuid.uuid4()), price=price)
+                if rng.random() < 0.5:
+                    level.pop(0)
+                    msg['size'] = size
+                else:
+                    fill = int(round(float(size) * 10 ** 8)) // 2 or 1
+                    left = int(round(float(size) * 10 ** 8)) - fill
+                    if left == 0:
+                        level.pop(0)
+                    else:
+                        level[0][1] = '{:.8f}'.format(left / 10 ** 8)
+                    msg['size'] = '{:.8f}'.format(fill / 10 ** 8)
+            else:
+                entry = level[rng.randrange(len(level))]
+                new_size = '{:.8f}'.format(rng.randint(1, 10 ** 8) / 10 ** 8)
+                msg.update(type='change', order_id=entry[0], price=price,
+                           old_size=entry[1], new_size=new_size)
+                entry[1] = new_size
+            if not level:
+                del book[price]
+        feed.append(msg)
+    return snapshot, feed
+
+
+def load_snapshot(book, snapshot):
+    for bid in snapshot['bids']:
+        book.add({'id': bid[2], 'side': 'buy', 'price': bid[0],
+                  'size': bid[1]})
+    for ask in snapshot['asks']:
+        book.add({'id': ask[2], 'side': 'sell', 'price': ask[0],
+                  'size': ask[1]})
+    book._sequence = snapshot['sequence']
+
+
+def run(book, snapshot, feed):
+    load_snapshot(book, snapshot)
+    start = time.perf_counter()
+    for msg in feed:
+        book.process_message(msg)
+    elapsed = time.perf_counter() - start
+    return len(feed) / elapsed
+
+
+def run_deep_level_cancel(book, depth, rounds=20000):
+    """Microseconds per `done`+`open` pair at the back of one level of
+    `depth` orders."""
+    ids = [str(uuid.UUID(int=i)) for i in range(depth)]
+    for order_id in ids:
+        book.add({'id': order_id, 'side': 'buy', 'price': '100.00',
+                  'size': '1.00000000'})
+    book._sequence = 0
+    sequence = 0
+    last = ids[-1]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        book.process_message({'sequence': sequence + 1, 'type': 'done',
+                              'product_id': 'BTC-USD', 'side': 'buy',
+                              'order_id': last, 'price': '100.00',
+                              'remaining_size': '1.00000000',
+                              'reason': 'canceled'})
+        book.process_message({'sequence': sequence + 2, 'type': 'open',
+                              'product_id': 'BTC-USD', 'side': 'buy',
+                              'order_id': last, 'price': '100.00',
+                              'remaining_size': '1.00000000'})
+        sequence += 2
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Synthetic level-3 feed benchmark for OrderBook")
+    parser.add_argument('--levels', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    snapshot, feed = make_book_and_feed(args.levels, args.depth, args.messages)
+    product = {'id': 'BTC-USD', 'quote_increment': '0.01',
+               'base_increment': '0.00000001'}
+    for name, kwargs in [('OrderBook', {}),
+                         ('OrderBook(compact)', {'compact': True}),
+                         ('OrderBook(fixed_point)', {'fixed_point': product}),
+                         ('OrderBook(compact, fixed_point)',
+                          {'compact': True, 'fixed_point': product})]:
+        rate = run(OrderBook(product_id='BTC-USD', **kwargs), snapshot, feed)
+        print('{}: {:,.0f} messages/sec ({} levels x {} orders per side)'
+              .format(name, rate, args.levels, args.depth))
+
+    for depth in (10, 500, 2000):
+        print('OrderBook: {:.1f} us per cancel+open at the back of a level '
+              'of {} orders'.format(
+                  run_deep_level_cancel(OrderBook(product_id='BTC-USD'),
+                                        depth), depth))
@@ -0,0 +1,49 @@
+#
+# benchmarks/bench_order_book_memory.py
+#
+# Memory used by a synthetic level-3 OrderBook in each storage mode.
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_order_book_memory.py [--orders 200000]
+
+from __future__ import print_function
+import argparse
+import gc
+import tracemalloc
+
+from cbpro.order_book import OrderBook
+
+from bench_order_book import make_book_and_feed, load_snapshot
+
+
+def measure(snapshot, **kwargs):
+    gc.collect()
+    tracemalloc.start()
+    book = OrderBook(product_id='BTC-USD', **kwargs)
+    load_snapshot(book, snapshot)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return book, used
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Memory used by a synthetic level-3 OrderBook")
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--depth', type=int, default=200)
+    args = parser.parse_args()
+
+    levels = max(1, args.orders // (2 * args.depth))
+    snapshot, _ = make_book_and_feed(levels, args.depth, messages=0)
+    orders = len(snapshot['bids']) + len(snapshot['asks'])
+    product = {'id': 'BTC-USD', 'quote_increment': '0.01',
+               'base_increment': '0.00000001'}
+    for name, kwargs in [('OrderBook', {}),
+                         ('OrderBook(compact)', {'compact': True}),
+                         ('OrderBook(compact, fixed_point)',
+                          {'compact': True, 'fixed_point': product})]:
+        book, used = measure(snapshot, **kwargs)
+        print('{}: {:,} orders, {:.1f} MiB ({:.0f} bytes/order)'.format(
+            name, orders, used / 2.0 ** 20, used / float(orders)))
+        del book
@@ -0,0 +1,93 @@
+#
+# benchmarks/bench_order_book_pool.py
+#
+# Synthetic level-3 feeds for several products, decoded and applied in the
+# receiving process (OrderBookManager) vs. in OrderBookPool workers.
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_order_book_pool.py [--products 4]
+#       [--workers 4] [--messages 50000]
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from cbpro.order_book import OrderBook, OrderBookManager
+from cbpro.order_book_pool import OrderBookPool
+from cbpro.websocket_client import get_json_decoder
+
+from bench_order_book import make_book_and_feed, load_snapshot
+
+
+def make_frames(product_ids, levels, depth, messages):
+    """ Interleaved raw frames for every product, and a snapshot each. """
+    snapshot, feed = make_book_and_feed(levels, depth, messages)
+    feeds = []
+    for product_id in product_ids:
+        frames = []
+        for msg in feed:
+            msg = dict(msg, product_id=product_id)
+            frames.append(json.dumps(msg, separators=(',', ':')))
+        feeds.append(frames)
+    return snapshot, [f for frames in zip(*feeds) for f in frames]
+
+
+def run_inline(product_ids, snapshot, frames):
+    manager = OrderBookManager(product_ids, compact=True)
+    for product_id in product_ids:
+        load_snapshot(manager.get_book(product_id), snapshot)
+    decode = get_json_decoder()
+    start = time.perf_counter()
+    for frame in frames:
+        manager.process_message(decode(frame))
+    return len(frames) / (time.perf_counter() - start)
+
+
+def run_pool(product_ids, snapshot, frames, workers, last_sequence):
+    directory = tempfile.mkdtemp()
+    paths = {}
+    for product_id in product_ids:
+        book = OrderBook(product_id=product_id)
+        load_snapshot(book, snapshot)
+        paths[product_id] = os.path.join(directory, product_id)
+        book.save_snapshot(paths[product_id])
+    pool = OrderBookPool(product_ids, workers=workers, snapshots=paths,
+                         compact=True)
+    pool.start()
+    while any(pool.get_top(p)['sequence'] != snapshot['sequence']
+              for p in product_ids):
+        time.sleep(0.01)
+    start = time.perf_counter()
+    for frame in frames:
+        pool.put_frame(frame)
+    while any(pool.get_top(p)['sequence'] != last_sequence
+              for p in product_ids):
+        time.sleep(0.0005)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return len(frames) / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--levels', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=50000,
+                        help='messages per product')
+    args = parser.parse_args()
+
+    product_ids = ['P{}-USD'.format(i) for i in range(args.products)]
+    snapshot, frames = make_frames(product_ids, args.levels, args.depth,
+                                   args.messages)
+    print('{} products, {:,} frames, {} CPUs'.format(
+        args.products, len(frames), os.cpu_count()))
+    print('inline OrderBookManager: {:,.0f} messages/sec'.format(
+        run_inline(product_ids, snapshot, frames)))
+    print('OrderBookPool({} workers): {:,.0f} messages/sec'.format(
+        args.workers, run_pool(product_ids, snapshot, frames, args.workers,
+                               args.messages)))
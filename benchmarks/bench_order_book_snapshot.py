@@ -0,0 +1,53 @@
+#
+# benchmarks/bench_order_book_snapshot.py
+#
+# Time to restore a synthetic level-3 OrderBook from a binary snapshot,
+# against rebuilding it from a level-3 REST response already in memory.
+#
+# Usage:
+#   PYTHONPATH=. python benchmarks/bench_order_book_snapshot.py [--orders 200000]
+
+from __future__ import print_function
+import argparse
+import os
+import tempfile
+import time
+
+from cbpro.order_book import OrderBook
+
+from bench_order_book import make_book_and_feed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="OrderBook binary snapshot save/load timings")
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--depth', type=int, default=200)
+    args = parser.parse_args()
+
+    levels = max(1, args.orders // (2 * args.depth))
+    snapshot, _ = make_book_and_feed(levels, args.depth, messages=0)
+    product = {'id': 'BTC-USD', 'quote_increment': '0.01',
+               'base_increment': '0.00000001'}
+    path = os.path.join(tempfile.mkdtemp(), 'book.bin')
+    for name, kwargs in [('OrderBook', {}),
+                         ('OrderBook(compact, fixed_point)',
+                          {'compact': True, 'fixed_point': product})]:
+        book = OrderBook(product_id='BTC-USD', **kwargs)
+        start = time.perf_counter()
+        book._apply_snapshot(snapshot)
+        rebuild = time.perf_counter() - start
+
+        start = time.perf_counter()
+        book.save_snapshot(path)
+        save = time.perf_counter() - start
+
+        restored = OrderBook(product_id='BTC-USD', **kwargs)
+        start = time.perf_counter()
+        restored.load_snapshot(path)
+        load = time.perf_counter() - start
+        print('{}: rebuild from REST response {:.0f} ms, save {:.0f} ms, '
+              'load {:.0f} ms, {:.1f} MiB on disk'.format(
+                  name, rebuild * 1e3, save * 1e3, load * 1e3,
+                  os.path.getsize(path) / 2.0 ** 20))
+    os.remove(path)
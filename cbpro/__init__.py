@@ -1,5 +1,41 @@
 from cbpro.authenticated_client import AuthenticatedClient
 from cbpro.public_client import PublicClient
-from cbpro.websocket_client import WebsocketClient
-from cbpro.order_book import OrderBook
 from cbpro.cbpro_auth import CBProAuth
+from cbpro.rate_limiter import RateLimiter, TokenBucket, RateLimitExceeded
+from cbpro.retry import RetryPolicy
+
+# The websocket clients and order books pull in websocket-client,
+# sortedcontainers and friends, so they are imported on first access
+# instead of with the package (PEP 562).
+_LAZY = {
+    'AsyncPublicClient': 'cbpro.async_client',
+    'AsyncAuthenticatedClient': 'cbpro.async_client',
+    'WebsocketClient': 'cbpro.websocket_client',
+    'AsyncWebsocketClient': 'cbpro.async_websocket_client',
+    'ShardedWebsocketFeed': 'cbpro.sharded_feed',
+    'OrderBook': 'cbpro.order_book',
+    'L2OrderBook': 'cbpro.order_book',
+    'OrderBookManager': 'cbpro.order_book',
+    'OrderBookPool': 'cbpro.order_book_pool',
+    'PooledWebsocketClient': 'cbpro.order_book_pool',
+    'MessageLogWriter': 'cbpro.message_log',
+    'read_message_log': 'cbpro.message_log',
+    'MongoSink': 'cbpro.mongo_sink',
+}
+
+__all__ = ['AuthenticatedClient', 'PublicClient', 'CBProAuth', 'RateLimiter',
+           'TokenBucket', 'RateLimitExceeded', 'RetryPolicy'] + list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(
+            "module 'cbpro' has no attribute '{}'".format(name))
+    import importlib
+    value = getattr(importlib.import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,228 @@
+#
+# cbpro/async_client.py
+#
+# asyncio variants of PublicClient and AuthenticatedClient, so many REST
+# calls can be in flight at once over a pool of keep-alive connections
+
+import asyncio
+from urllib.parse import urlencode, urlsplit
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+from cbpro.authenticated_client import AuthenticatedClient
+from cbpro.cbpro_auth import CBProAuth
+from cbpro.public_client import (PublicClient, get_candle_columns,
+                                 get_candle_windows, _get_range_pacer,
+                                 _to_iso)
+from cbpro.retry import DEFAULT_RETRY
+
+
+class AsyncPublicClient(PublicClient):
+    """ cbpro public client API for asyncio.
+
+    Has every endpoint method of `PublicClient`, but they return
+    coroutines, and the paginated ones (`get_product_trades`, ...) async
+    generators. Requests share one `aiohttp` session whose connector keeps
+    up to `pool_size` connections alive, so independent calls can be
+    issued concurrently. Requires `aiohttp` (`pip install cbpro[async]`).
+
+    Example::
+        async with AsyncPublicClient() as client:
+            tickers = await asyncio.gather(
+                *[client.get_product_ticker(p) for p in products])
+            async for trade in client.get_product_trades('BTC-USD'):
+                ...
+    """
+    def __init__(self, api_url='https://api.pro.coinbase.com', timeout=30,
+                 pool_size=100, session=None, rate_limiter=None,
+                 retry=DEFAULT_RETRY, keep_alive=True):
+        """ Create an asyncio cbpro API public client.
+
+        Args:
+            api_url (Optional[str]): API URL. Defaults to cbpro API.
+            timeout (Optional[float or tuple]): Seconds allowed per
+                request, or a (connect, read) tuple to limit connecting and
+                each read instead.
+            pool_size (Optional[int]): Most connections kept open at once.
+            session (Optional[aiohttp.ClientSession]): Session to send
+                requests with, e.g. to share one pool between clients. It
+                is left open by `close`.
+            rate_limiter (Optional[RateLimiter]): Wait for a token from
+                this limiter before every request; can be shared with
+                blocking clients.
+            retry (Optional[RetryPolicy]): Retry policy for idempotent
+                requests; None disables retries.
+            keep_alive (Optional[bool]): Reuse connections between requests.
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncPublicClient requires the aiohttp '
+                              'package: pip install cbpro[async]')
+        self.url = api_url.rstrip('/')
+        self.auth = None
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.session = session
+        self._owns_session = session is None
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+
+    def _get_session(self):
+        # created on first use, since it must belong to the running loop
+        if self.session is None:
+            if isinstance(self.timeout, tuple):
+                connect, read = self.timeout
+                timeout = aiohttp.ClientTimeout(sock_connect=connect,
+                                                sock_read=read)
+            else:
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size, force_close=not self.keep_alive),
+                timeout=timeout)
+        return self.session
+
+    async def close(self):
+        """ Close the connection pool, unless the session was passed in. """
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get_historic_rates_range(self, product_id, start, end,
+                                       granularity, workers=4):
+        """ See `PublicClient.get_historic_rates_range`; up to `workers`
+        requests are in flight at once. """
+        semaphore = asyncio.Semaphore(workers)
+        pacer = _get_range_pacer(self)
+
+        async def fetch(window):
+            async with semaphore:
+                if pacer is not None:
+                    wait = pacer.reserve('get', '/products/{}/candles'.format(
+                        product_id), self.auth is not None)
+                    if wait:
+                        await asyncio.sleep(wait)
+                return await self.get_product_historic_rates(
+                    product_id, _to_iso(window[0]), _to_iso(window[1]),
+                    granularity)
+        windows = get_candle_windows(start, end, granularity)
+        return get_candle_columns(
+            await asyncio.gather(*[fetch(w) for w in windows]))
+
+    async def _request(self, method, endpoint, params=None, data=None):
+        # encode the query ourselves so the signature covers exactly the
+        # URL that is sent
+        params = dict((k, v) for k, v in (params or {}).items()
+                      if v is not None)
+        url = self.url + endpoint
+        if params:
+            url += '?' + urlencode(params, doseq=True)
+        limiter = self.rate_limiter
+        retry = self.retry
+        private = self.auth is not None
+        attempt = 0
+        while True:
+            attempt += 1
+            can_retry = retry is not None and retry.can_retry(method, attempt)
+            if limiter is not None:
+                wait = limiter.reserve(method, endpoint, private)
+                if wait:
+                    await asyncio.sleep(wait)
+            headers = None
+            if private:
+                # signed after any wait, so the timestamp is fresh
+                parts = urlsplit(url)
+                path_url = parts.path + ('?' + parts.query
+                                         if parts.query else '')
+                headers = self.auth.get_headers(method.upper(), path_url,
+                                                data)
+            try:
+                async with self._get_session().request(
+                        method.upper(), yarl.URL(url, encoded=True),
+                        data=data, headers=headers) as r:
+                    if limiter is not None and r.status == 429:
+                        limiter.record_throttled(method, endpoint, private)
+                    if not can_retry or r.status not in retry.statuses:
+                        return await r.json(content_type=None), r.headers
+                    delay = retry.get_delay(attempt,
+                                            r.headers.get('Retry-After'))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not can_retry:
+                    raise
+                delay = retry.get_delay(attempt)
+            await asyncio.sleep(delay)
+
+    async def _send_message(self, method, endpoint, params=None, data=None):
+        """Send API request.
+
+        Args:
+            method (str): HTTP method (get, post, delete, etc.)
+            endpoint (str): Endpoint (to be added to base URL)
+            params (Optional[dict]): HTTP request parameters
+            data (Optional[str]): JSON-encoded string payload for POST
+
+        Returns:
+            dict/list: JSON response
+
+        """
+        result, _ = await self._request(method, endpoint, params, data)
+        return result
+
+    async def _send_paginated_message(self, endpoint, params=None):
+        """ Send API message that results in a paginated response.
+
+        See `PublicClient._send_paginated_message`; pages are requested as
+        the async generator is iterated over.
+
+        Args:
+            endpoint (str): Endpoint (to be added to base URL)
+            params (Optional[dict]): HTTP request parameters
+
+        Yields:
+            dict: API response objects
+
+        """
+        params = dict(params or {})
+        while True:
+            results, headers = await self._request('get', endpoint, params)
+            for result in results:
+                yield result
+            if not headers.get('cb-after') or \
+                    params.get('before') is not None:
+                break
+            params['after'] = headers['cb-after']
+
+
+class AsyncAuthenticatedClient(AsyncPublicClient, AuthenticatedClient):
+    """ `AuthenticatedClient` for asyncio; see `AsyncPublicClient`.
+
+    Requests are signed with the same `CBProAuth` as the blocking client.
+
+    Example::
+        async with AsyncAuthenticatedClient(key, b64secret, passphrase) as c:
+            orders = await asyncio.gather(*[c.get_order(i) for i in ids])
+    """
+    def __init__(self, key, b64secret, passphrase,
+                 api_url="https://api.pro.coinbase.com", **kwargs):
+        """ Create an instance of the AsyncAuthenticatedClient class.
+
+        Args:
+            key (str): Your API key.
+            b64secret (str): The secret key matching your API key.
+            passphrase (str): Passphrase chosen when setting up key.
+            api_url (Optional[str]): API URL. Defaults to cbpro API.
+            kwargs: `timeout`, `pool_size`, `session`, `rate_limiter`,
+                `retry` or `keep_alive`, as for `AsyncPublicClient`.
+        """
+        AsyncPublicClient.__init__(self, api_url, **kwargs)
+        self.auth = CBProAuth(key, b64secret, passphrase)
@@ -0,0 +1,162 @@
+#
+# cbpro/async_websocket_client.py
+#
+# asyncio variant of the WebsocketClient template, so many feed
+# connections can share one event loop instead of two threads each
+
+from __future__ import print_function
+import asyncio
+import json
+import time
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+from cbpro.websocket_client import WebsocketClient
+
+
+class AsyncWebsocketClient(WebsocketClient):
+    """ Coinbase Pro websocket feed client for asyncio.
+
+    Takes the same arguments and sends the same subscription (including
+    authentication) as `WebsocketClient`, but `start` and `close` are
+    coroutines and so are the `on_open`, `on_message`, `on_error` and
+    `on_close` hooks. Keepalive pings are handled by the `websockets`
+    package, which must be installed (`pip install cbpro[async]`); a
+    connection that does not answer them within `stale_timeout` is closed
+    and reported through `on_error`. There is no automatic reconnect.
+
+    Example::
+        class Feed(AsyncWebsocketClient):
+            async def on_message(self, msg):
+                ...
+
+        async def main():
+            feeds = [Feed(products=p, channels=['ticker']) for p in products]
+            for feed in feeds:
+                await feed.start()
+            ...
+            for feed in feeds:
+                await feed.close()
+    """
+    def __init__(self, *args, **kwargs):
+        super(AsyncWebsocketClient, self).__init__(*args, **kwargs)
+        self.task = None
+
+    async def start(self):
+        """ Connect, subscribe and start receiving on a background task. """
+        self.stop = False
+        await self.on_open()
+        await self._connect()
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        try:
+            await self._listen()
+        finally:
+            await self._disconnect()
+
+    async def _connect(self):
+        if websockets is None:
+            raise ImportError('AsyncWebsocketClient requires the websockets '
+                              'package: pip install cbpro[async]')
+        sub_params = self._subscribe_params()
+
+        options = {}
+        if self.stale_timeout is not None:
+            options['ping_timeout'] = self.stale_timeout
+        self.ws = await websockets.connect(
+            self.url, ping_interval=self.heartbeat_interval, max_size=None,
+            **options)
+        self.last_message = time.time()
+
+        await self.ws.send(json.dumps(sub_params))
+
+    async def _listen(self):
+        while not self.stop:
+            try:
+                if self.heartbeat and self.stale_timeout is not None:
+                    data = await asyncio.wait_for(self.ws.recv(),
+                                                  self.stale_timeout)
+                else:
+                    data = await self.ws.recv()
+                received = self.last_message = time.time()
+                msg = self._decode(data)
+            except Exception as e:
+                if self.stop:
+                    # closed by close()
+                    break
+                await self.on_error(e)
+            else:
+                if self.feed_stats is not None:
+                    self.feed_stats.record(msg, received)
+                if self.heartbeat and msg.get('type') == 'heartbeat':
+                    self.last_heartbeat[msg.get('product_id')] = msg
+                    continue
+                await self.on_message(msg)
+
+    async def _disconnect(self):
+        if self.ws is not None:
+            await self.ws.close()
+        await self.on_close()
+
+    async def close(self):
+        """ Stop receiving, close the connection and wait for the task. """
+        self.stop = True
+        if self.ws is not None:
+            await self.ws.close()
+        if self.task is not None:
+            await self.task
+
+    async def on_open(self):
+        if self.should_print:
+            print("-- Subscribed! --\n")
+
+    async def on_close(self):
+        if self.should_print:
+            print("\n-- Socket Closed --")
+
+    async def on_message(self, msg):
+        if self.should_print:
+            print(msg)
+        if self.mongo_collection is not None:  # dump JSON to given mongo collection
+            self.mongo_collection.insert_one(msg)
+
+    async def on_error(self, e, data=None):
+        self.error = e
+        self.stop = True
+        print('{} - data: {}'.format(e, data))
+
+
+if __name__ == "__main__":
+    import sys
+
+    class MyWebsocketClient(AsyncWebsocketClient):
+        async def on_open(self):
+            self.message_count = 0
+            print("Let's count the messages!")
+
+        async def on_message(self, msg):
+            self.message_count += 1
+
+        async def on_close(self):
+            print("-- Goodbye! --")
+
+    async def main():
+        clients = [MyWebsocketClient(products=product_id, channels=['ticker'])
+                   for product_id in ['BTC-USD', 'ETH-USD', 'LTC-USD']]
+        for client in clients:
+            await client.start()
+        try:
+            for _ in range(10):
+                await asyncio.sleep(1)
+                print(', '.join('{}: {}'.format(c.products[0], c.message_count)
+                                for c in clients))
+        finally:
+            for client in clients:
+                await client.close()
+        return any(client.error for client in clients)
+
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -7,7 +7,6 @@
 import hmac
 import hashlib
 import time
-import requests
 import base64
 import json
 from requests.auth import AuthBase
@@ -27,7 +26,7 @@ class AuthenticatedClient(PublicClient):
         session (requests.Session): Persistent HTTP connection object.
     """
     def __init__(self, key, b64secret, passphrase,
-                 api_url="https://api.pro.coinbase.com"):
+                 api_url="https://api.pro.coinbase.com", **kwargs):
         """ Create an instance of the AuthenticatedClient class.
 
         Args:
@@ -35,10 +34,12 @@ class AuthenticatedClient(PublicClient):
             b64secret (str): The secret key matching your API key.
             passphrase (str): Passphrase chosen when setting up key.
             api_url (Optional[str]): API URL. Defaults to cbpro API.
+            kwargs: `timeout`, `rate_limiter`, `retry`, `session`,
+                `pool_size`, `keep_alive` or `adapter`, as for
+                `PublicClient`.
         """
-        super(AuthenticatedClient, self).__init__(api_url)
+        super(AuthenticatedClient, self).__init__(api_url, **kwargs)
         self.auth = CBProAuth(key, b64secret, passphrase)
-        self.session = requests.Session()
 
     def get_account(self, account_id):
         """ Get information for a single account.
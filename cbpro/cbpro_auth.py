@@ -13,15 +13,25 @@ class CBProAuth(AuthBase):
         self.passphrase = passphrase
 
     def __call__(self, request):
-        timestamp = str(time.time())
-        message = ''.join([timestamp, request.method,
-                           request.path_url, (request.body or '')])
-        request.headers.update(get_auth_headers(timestamp, message,
-                                                self.api_key,
-                                                self.secret_key,
-                                                self.passphrase))
+        request.headers.update(self.get_headers(request.method,
+                                                request.path_url,
+                                                request.body))
         return request
 
+    def get_headers(self, method, path_url, body=None):
+        """ Signed headers for a request, for HTTP clients other than
+        requests.
+
+        Args:
+            method (str): Upper case HTTP method.
+            path_url (str): Path and query string, e.g. '/orders?limit=5'.
+            body (Optional[str]): Request body.
+        """
+        timestamp = str(time.time())
+        message = ''.join([timestamp, method, path_url, (body or '')])
+        return get_auth_headers(timestamp, message, self.api_key,
+                                self.secret_key, self.passphrase)
+
 
 def get_auth_headers(timestamp, message, api_key, secret_key, passphrase):
     message = message.encode('ascii')
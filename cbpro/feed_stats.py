@@ -0,0 +1,286 @@
+#
+# cbpro/feed_stats.py
+#
+# Latency histograms, message rates and sequence gaps for websocket feeds
+
+import calendar
+import time
+from threading import RLock
+
+# Message types of the level-3 (full) channel, whose sequence numbers are
+# contiguous per product. match, open and done also arrive on the matches
+# and user channels, but there they skip the numbers of the messages not
+# sent, so sequences are only checked when subscribed to full.
+_FULL_CHANNEL_TYPES = frozenset(['received', 'open', 'done', 'match',
+                                 'change', 'activate'])
+
+
+class LatencyHistogram(object):
+    """ Log-linear histogram of non-negative durations, in the spirit of
+    HdrHistogram.
+
+    Values are kept in microseconds. Below `2**significant_bits` every
+    microsecond has its own bucket; above, each power of two is split into
+    `2**(significant_bits - 1)` buckets, so a recorded value is known to
+    within 1 part in `2**(significant_bits - 1)` (under 1% by default)
+    whatever its magnitude. Memory grows with the number of distinct
+    buckets hit, not with the number of samples.
+    """
+    def __init__(self, significant_bits=7):
+        self._bits = significant_bits
+        self._direct = 1 << significant_bits
+        self._half = 1 << (significant_bits - 1)
+        self.reset()
+
+    def reset(self):
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        """ Add one duration, in seconds. Negative values count as 0. """
+        value = int(seconds * 1000000) if seconds > 0 else 0
+        if value < self._direct:
+            index = value
+        else:
+            shift = value.bit_length() - self._bits
+            index = shift * self._half + (value >> shift)
+        counts = self._counts
+        counts[index] = counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def _bucket_value(self, index):
+        """ Midpoint of bucket `index`, in microseconds. """
+        if index < self._direct:
+            return index
+        shift = index // self._half - 1
+        lower = (index - shift * self._half) << shift
+        return lower + ((1 << shift) - 1) / 2.0
+
+    def percentile(self, p):
+        """ Duration in seconds below which `p` percent of samples fall. """
+        if not self.count:
+            return 0.0
+        target = max(1, p / 100.0 * self.count)
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= target:
+                value = self._bucket_value(index)
+                return min(max(value, self.min), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def summary(self):
+        """ Count, mean, min, max and common percentiles, in seconds. """
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': self.total / 1000000.0 / self.count,
+            'min': self.min / 1000000.0,
+            'max': self.max / 1000000.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+        }
+
+
+def parse_feed_time(value, _cache={}):
+    """ Seconds since the epoch for a feed timestamp such as
+    '2014-11-07T08:19:27.028459Z'.
+
+    Messages arrive many per second, so the conversion of the whole-second
+    prefix is cached and only the fraction is parsed each time.
+    """
+    whole = value[:19]
+    seconds = _cache.get(whole)
+    if seconds is None:
+        if len(_cache) > 1024:
+            _cache.clear()
+        seconds = calendar.timegm(time.strptime(whole, '%Y-%m-%dT%H:%M:%S'))
+        _cache[whole] = seconds
+    frac = value[19:].rstrip('Z')
+    return seconds + float(frac) if frac else float(seconds)
+
+
+class FeedStats(object):
+    """ Counters and latency histograms for a websocket feed.
+
+    For every message `record` tracks:
+
+    - exchange latency: from the message's `time` field to receipt of the
+      frame. It includes the clock offset between the exchange and this
+      host, so keep the clock synchronized (NTP) when reading it.
+    - dispatch latency: from receipt to the `on_message` call, which is
+      decoding plus any time spent queued for a worker.
+    - message counts per type. The feed does not label messages with their
+      channel, so the type (`ticker`, `l2update`, `match`, ...) stands in
+      for it.
+    - sequence gaps per product on the full channel, if `check_sequences`.
+
+    Enable it with `WebsocketClient(..., stats=True)`, which checks
+    sequences only when subscribed to the full channel.
+    """
+    def __init__(self, check_sequences=True):
+        """
+        Args:
+            check_sequences (Optional[bool]): Count sequence gaps. Only
+                meaningful when the feed includes the full channel.
+        """
+        self.check_sequences = check_sequences
+        self._lock = RLock()
+        self.exchange_latency = LatencyHistogram()
+        self.dispatch_latency = LatencyHistogram()
+        self.reset()
+
+    def reset(self):
+        """ Start a new measurement window. """
+        with self._lock:
+            self.exchange_latency.reset()
+            self.dispatch_latency.reset()
+            self._types = {}
+            self._sequences = {}
+            self._gaps = {}
+            self._missed = {}
+            self.clock_skew = 0
+            self._since = time.time()
+
+    def record(self, msg, received, dispatched=None):
+        """ Account for `msg`, received at `received` (epoch seconds) and
+        handed to `on_message` at `dispatched` (now if None).
+        """
+        if dispatched is None:
+            dispatched = time.time()
+        msg_type = msg.get('type')
+        feed_time = msg.get('time')
+        with self._lock:
+            self._types[msg_type] = self._types.get(msg_type, 0) + 1
+            self.dispatch_latency.record(dispatched - received)
+            if feed_time:
+                try:
+                    latency = received - parse_feed_time(feed_time)
+                except ValueError:
+                    pass
+                else:
+                    if latency < 0:
+                        self.clock_skew += 1
+                    self.exchange_latency.record(latency)
+            if self.check_sequences and msg_type in _FULL_CHANNEL_TYPES:
+                self._check_sequence(msg)
+
+    def _check_sequence(self, msg):
+        product_id = msg.get('product_id')
+        sequence = msg.get('sequence')
+        if sequence is None:
+            return
+        last = self._sequences.get(product_id)
+        if last is not None and sequence > last + 1:
+            self._gaps[product_id] = self._gaps.get(product_id, 0) + 1
+            self._missed[product_id] = \
+                self._missed.get(product_id, 0) + sequence - last - 1
+        if last is None or sequence > last:
+            self._sequences[product_id] = sequence
+
+    def snapshot(self):
+        """ Current statistics.
+
+        Returns:
+            dict: `seconds` since the window started, total `messages`,
+                `message_rates` (type -> messages/sec), `message_counts`,
+                `exchange_latency` and `dispatch_latency` summaries (see
+                `LatencyHistogram.summary`), `sequence_gaps` and
+                `messages_missed` per product, and `clock_skew`, the number
+                of messages stamped later than they were received.
+        """
+        with self._lock:
+            elapsed = max(time.time() - self._since, 1e-9)
+            return {
+                'seconds': elapsed,
+                'messages': sum(self._types.values()),
+                'message_counts': dict(self._types),
+                'message_rates': dict((t, n / elapsed)
+                                      for t, n in self._types.items()),
+                'exchange_latency': self.exchange_latency.summary(),
+                'dispatch_latency': self.dispatch_latency.summary(),
+                'sequence_gaps': dict(self._gaps),
+                'messages_missed': dict(self._missed),
+                'clock_skew': self.clock_skew,
+            }
+
+    def to_prometheus(self, prefix='cbpro_feed', labels=None):
+        """ The statistics in the Prometheus text exposition format.
+
+        Latencies are exported as summaries with 0.5, 0.9, 0.99 and 0.999
+        quantiles.
+
+        Args:
+            prefix (Optional[str]): Metric name prefix.
+            labels (Optional[dict]): Labels added to every sample, e.g.
+                `{'feed': 'btc'}`.
+        """
+        with self._lock:
+            return self._to_prometheus(prefix, labels)
+
+    def _to_prometheus(self, prefix, labels):
+        stats = self.snapshot()
+        base = dict(labels or {})
+        lines = []
+
+        def sample(name, value, **extra):
+            all_labels = dict(base, **extra)
+            if all_labels:
+                name += '{' + ','.join(
+                    '{}="{}"'.format(k, _escape(all_labels[k]))
+                    for k in sorted(all_labels)) + '}'
+            lines.append('{} {}'.format(name, repr(float(value))))
+
+        def header(name, kind, text):
+            lines.append('# HELP {} {}'.format(name, text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+
+        for key, text in [
+                ('exchange_latency',
+                 'Exchange timestamp to frame receipt, in seconds.'),
+                ('dispatch_latency',
+                 'Frame receipt to on_message, in seconds.')]:
+            name = '{}_{}_seconds'.format(prefix, key)
+            histogram = getattr(self, key)
+            header(name, 'summary', text)
+            for q, p in [('0.5', 50), ('0.9', 90), ('0.99', 99),
+                         ('0.999', 99.9)]:
+                sample(name, histogram.percentile(p), quantile=q)
+            sample(name + '_sum', histogram.total / 1000000.0)
+            sample(name + '_count', histogram.count)
+
+        name = prefix + '_messages_total'
+        header(name, 'counter', 'Messages received, by type.')
+        for msg_type, count in sorted(stats['message_counts'].items(),
+                                      key=lambda i: str(i[0])):
+            sample(name, count, type=msg_type)
+
+        for key, text in [
+                ('sequence_gaps', 'Sequence gaps on the full channel.'),
+                ('messages_missed', 'Sequence numbers skipped by gaps.')]:
+            name = '{}_{}_total'.format(prefix, key)
+            header(name, 'counter', text)
+            for product_id, count in sorted(stats[key].items()):
+                sample(name, count, product_id=product_id)
+
+        name = prefix + '_clock_skew_total'
+        header(name, 'counter',
+               'Messages stamped by the exchange after they were received.')
+        sample(name, stats['clock_skew'])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
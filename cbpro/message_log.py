@@ -0,0 +1,189 @@
+#
+# cbpro/message_log.py
+#
+# Buffered, length-prefixed log of websocket feed messages
+
+import gzip
+import json
+import os
+import struct
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+
+_FRAME_HEADER = struct.Struct('>I')
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+class MessageLogWriter(object):
+    """ Records feed messages to disk from a background thread.
+
+    `log` only appends the message to an in-memory queue, so it is cheap
+    enough to call from the websocket thread. The queue is written out in
+    batches when `batch_size` messages are pending or every
+    `flush_interval` seconds. Each message is stored as a 4 byte
+    big-endian length followed by its JSON encoding.
+
+    With `max_bytes` or `max_age` set, the log rotates: the first segment
+    is `path`, later segments are `path.1`, `path.2`, ... An existing log
+    at `path` is replaced, including all of its segments. Use
+    `read_message_log(path)` to iterate over all segments.
+
+    Example::
+        log = MessageLogWriter('btc-usd.log', compress=True)
+        book = OrderBook('BTC-USD', log_to=log)
+        ...
+        log.close()
+    """
+    def __init__(self, path, batch_size=1000, flush_interval=1.0,
+                 compress=False, max_bytes=None, max_age=None):
+        """ Open the log and start the writer thread.
+
+        Args:
+            path (str): File for the first segment.
+            batch_size (Optional[int]): Pending messages that trigger a
+                write before `flush_interval` has passed.
+            flush_interval (Optional[float]): Seconds between writes.
+            compress (Optional[bool]): gzip each segment.
+            max_bytes (Optional[int]): Rotate once a segment holds this
+                many (uncompressed) bytes.
+            max_age (Optional[float]): Rotate once a segment is this many
+                seconds old.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.paths = []
+        self.messages_written = 0
+        self.bytes_written = 0
+        self._pending = deque()
+        self._wake = Event()
+        self._write_lock = Lock()
+        self._closed = False
+        self._file = None
+        _remove_segments(path)
+        self._open_segment()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def log(self, message):
+        """ Queue `message` (a JSON-serializable dict) for writing. """
+        self._pending.append(message)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """ Write all pending messages now, from the calling thread. """
+        self._write_pending()
+
+    def close(self):
+        """ Write pending messages, stop the thread and close the file. """
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._write_pending()
+        self._write_pending()
+
+    def _write_pending(self):
+        with self._write_lock:
+            self._write_batch()
+
+    def _write_batch(self):
+        pending = self._pending
+        frames = []
+        for _ in range(len(pending)):
+            payload = json.dumps(pending.popleft(), separators=(',', ':'),
+                                 default=str).encode('utf-8')
+            frames.append(_FRAME_HEADER.pack(len(payload)))
+            frames.append(payload)
+        if not frames:
+            return
+        data = b''.join(frames)
+        if self._should_rotate():
+            self._file.close()
+            self._open_segment()
+        self._file.write(data)
+        self._file.flush()
+        self._segment_bytes += len(data)
+        self.bytes_written += len(data)
+        self.messages_written += len(frames) // 2
+
+    def _should_rotate(self):
+        if self._segment_bytes == 0:
+            return False
+        if self.max_bytes is not None and \
+                self._segment_bytes >= self.max_bytes:
+            return True
+        return self.max_age is not None and \
+            time.time() - self._segment_opened >= self.max_age
+
+    def _open_segment(self):
+        path = _segment_path(self.path, len(self.paths))
+        if self.compress:
+            self._file = gzip.open(path, 'wb')
+        else:
+            self._file = open(path, 'wb')
+        self.paths.append(path)
+        self._segment_bytes = 0
+        self._segment_opened = time.time()
+
+
+def _segment_path(path, index):
+    return path if index == 0 else '{}.{}'.format(path, index)
+
+
+def _remove_segments(path):
+    # rotated segments of an earlier, longer log would otherwise be read
+    # after the new ones
+    index = 1
+    while os.path.exists(_segment_path(path, index)):
+        os.remove(_segment_path(path, index))
+        index += 1
+
+
+def read_message_log(path):
+    """ Iterate lazily over the messages of a `MessageLogWriter` log.
+
+    Reads `path` and then its rotated segments `path.1`, `path.2`, ...
+    for as long as they exist. Compressed segments are detected
+    automatically.
+
+    Args:
+        path (str): First segment of the log.
+
+    Yields:
+        dict: Messages in the order they were logged.
+    """
+    index = 0
+    while os.path.exists(_segment_path(path, index)):
+        for message in _read_segment(_segment_path(path, index)):
+            yield message
+        index += 1
+
+
+def _read_segment(path):
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == _GZIP_MAGIC
+    f = gzip.open(path, 'rb') if compressed else open(path, 'rb')
+    with f:
+        header_size = _FRAME_HEADER.size
+        while True:
+            header = f.read(header_size)
+            if len(header) < header_size:
+                # end of file, or a frame cut short by a crash
+                return
+            size, = _FRAME_HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size:
+                return
+            yield json.loads(payload.decode('utf-8'))
@@ -0,0 +1,136 @@
+#
+# cbpro/mongo_sink.py
+#
+# Batched, asynchronous MongoDB writer for websocket feed messages
+
+from collections import deque
+from threading import Condition, Lock, Thread
+import time
+
+
+class MongoSink(object):
+    """ Writes documents to a MongoDB collection in batches from a thread.
+
+    `insert_one` only queues the document, so a `MongoSink` can be passed
+    as the `mongo_collection` of a `WebsocketClient` without stalling the
+    socket on a database round trip. Queued documents are written with an
+    unordered `insert_many` once `batch_size` are pending or every
+    `flush_interval` seconds.
+
+    At most `max_pending` documents are held in memory. When the queue is
+    full, new documents are dropped (`overflow='drop'`) or `insert_one`
+    blocks until the writer catches up (`overflow='block'`).
+
+    Example::
+        sink = MongoSink(MongoClient().cryptocurrency_database.BTC_collection)
+        wsClient = cbpro.WebsocketClient(products="BTC-USD",
+                                         channels=["matches"],
+                                         mongo_collection=sink)
+        wsClient.start()
+        ...
+        wsClient.close()
+        sink.close()
+
+    Attributes:
+        inserted (int): Documents written.
+        dropped (int): Documents discarded because the queue was full.
+        failed (int): Documents in batches the server rejected.
+        blocked (float): Seconds `insert_one` spent waiting for room.
+        last_error (Exception): Most recent write error, if any.
+    """
+    def __init__(self, collection, batch_size=500, flush_interval=1.0,
+                 max_pending=100000, overflow='drop'):
+        """ Start the writer thread.
+
+        Args:
+            collection (pymongo.collection.Collection): Target collection.
+            batch_size (Optional[int]): Documents per `insert_many`.
+            flush_interval (Optional[float]): Longest time in seconds a
+                document waits before being written.
+            max_pending (Optional[int]): Queue size limit.
+            overflow (Optional[str]): 'drop' or 'block' when full.
+        """
+        if overflow not in ('drop', 'block'):
+            raise ValueError('overflow must be drop or block, not {}'.format(
+                overflow))
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.inserted = 0
+        self.dropped = 0
+        self.failed = 0
+        self.blocked = 0.0
+        self.last_error = None
+        self._pending = deque()
+        self._cond = Condition()
+        self._write_lock = Lock()
+        self._closed = False
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def insert_one(self, document):
+        """ Queue `document` for the next batch. """
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                if self.overflow == 'drop':
+                    self.dropped += 1
+                    return
+                start = time.time()
+                while len(self._pending) >= self.max_pending and \
+                        not self._closed:
+                    self._cond.wait()
+                self.blocked += time.time() - start
+            self._pending.append(document)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def get_pending(self):
+        """ Documents queued but not yet written. """
+        return len(self._pending)
+
+    def flush(self):
+        """ Write everything queued so far before returning. """
+        with self._write_lock:
+            while self._write_batch():
+                pass
+
+    def close(self):
+        """ Write the remaining documents and stop the writer thread. """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def _write_batch(self):
+        with self._cond:
+            batch = [self._pending.popleft()
+                     for _ in range(min(self.batch_size, len(self._pending)))]
+            self._cond.notify_all()
+        if not batch:
+            return False
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            # with ordered=False the server still inserts the rest of the
+            # batch; BulkWriteError reports how many made it
+            details = getattr(e, 'details', None) or {}
+            inserted = details.get('nInserted', 0)
+            self.inserted += inserted
+            self.failed += len(batch) - inserted
+            self.last_error = e
+        else:
+            self.inserted += len(batch)
+        return True
@@ -6,60 +6,259 @@
 
 from sortedcontainers import SortedDict
 from decimal import Decimal
+from bisect import bisect_left
+from array import array
+import gc
+import mmap
 import pickle
+import struct
+import sys
+import time
+from threading import Thread
 
+from cbpro.message_log import MessageLogWriter
 from cbpro.public_client import PublicClient
 from cbpro.websocket_client import WebsocketClient
 
 
+class OrderRecord(object):
+    """ A resting order stored by an OrderBook created with `compact=True`.
+
+    Supports the same item access as the order dicts of a regular book
+    (`order['size']`, `order['price']`, ...) at a fraction of the memory.
+    """
+    __slots__ = ('id', 'side', 'price', 'size')
+
+    def __init__(self, id, side, price, size):
+        self.id = id
+        self.side = side
+        self.price = price
+        self.size = size
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return 'OrderRecord(id={!r}, side={!r}, price={!r}, size={!r})'.format(
+            self.id, self.side, self.price, self.size)
+
+
+_SNAPSHOT_MAGIC = b'CBOB'
+_SNAPSHOT_VERSION = 1
+# magic, version, price exponent, size exponent, sequence, number of bids,
+# number of asks, product id length, padding to 40 bytes
+_SNAPSHOT_HEADER = struct.Struct('<4sHbbqQQH6x')
+
+
+def _padded(n):
+    """ Round `n` up to a multiple of 8 so the int64 columns stay aligned. """
+    return (n + 7) // 8 * 8
+
+
+def fixed_point_parser(increment):
+    """ Parser turning decimal strings into integer multiples of 10**-n,
+    where n is the number of decimal places of `increment`.
+
+    Matches the ticks of an `OrderBook` created with `fixed_point`, so it
+    can be handed to `WebsocketClient(parse_numbers=...)` to decode prices
+    and sizes straight into ticks::
+        parse_numbers={'price': fixed_point_parser('0.01'),
+                       'size': fixed_point_parser('0.00000001'), ...}
+    """
+    return _fixed_point_parser(_decimal_places(increment))
+
+
+def _snapshot_parser(exp, places=None, to_fixed_point=None):
+    """ Return a function converting a snapshot column value scaled by
+    10**`exp` to a book value: `Decimal`, or fixed-point with `places`.
+    """
+    if places is None:
+        return lambda value: Decimal(value).scaleb(exp)
+    if exp == -places:
+        return int
+    return lambda value: to_fixed_point(Decimal(value).scaleb(exp))
+
+
+def _order_dict(id, side, price, size):
+    return {'id': id, 'side': side, 'price': price, 'size': size}
+
+
+def _decimal_places(increment):
+    """ Number of decimal places in an increment such as '0.00000001'. """
+    return len(str(increment).partition('.')[2].rstrip('0'))
+
+
+def _fixed_point_parser(places):
+    """ Return a function parsing decimal strings into `places` fixed-point
+    integers, e.g. '101.5' -> 10150 for `places=2`, without going through
+    `Decimal`.
+    """
+    def parse(value):
+        if not isinstance(value, str):
+            if isinstance(value, int):
+                # already scaled, e.g. by a WebsocketClient decoder
+                return value
+            value = '{:f}'.format(value)
+        whole, _, frac = value.partition('.')
+        if len(frac) > places:
+            if frac[places:].strip('0'):
+                raise ValueError('{} has more than {} decimal places'.format(
+                    value, places))
+            frac = frac[:places]
+        return int(whole + frac.ljust(places, '0'))
+    return parse
+
+
 class OrderBook(object):
-    def __init__(self, product_id='BTC-USD', log_to=None):
+    def __init__(self, product_id='BTC-USD', log_to=None, compact=False,
+                 fixed_point=False, buffered_resync=False):
+        """ Create a level-3 order book for `product_id`.
+
+        Args:
+            product_id (Optional[str]): Product to track.
+            log_to (Optional[file or MessageLogWriter]): Where to record
+                every message: a `MessageLogWriter`, which writes framed
+                batches from a background thread, or a file object each
+                message is pickled to as it arrives.
+            compact (Optional[bool]): Store resting orders as `OrderRecord`
+                objects instead of dicts, which cuts the memory of a full
+                book by about a third. `get_bids`/`get_asks` levels then hold
+                `OrderRecord`s, which support the same `order['size']`
+                style access.
+            fixed_point (Optional[bool or dict]): Keep prices and sizes as
+                integer multiples of the product's `quote_increment` and
+                `base_increment` instead of `Decimal`. Pass True to look the
+                increments up with `PublicClient.get_products`, or a product
+                dict from that call. In this mode `get_bids`, `get_asks` and
+                friends work with the integer keys and order sizes, while
+                `get_bid`, `get_ask` and `get_current_book` still return
+                `Decimal` values. Integer prices and sizes in messages are
+                taken as already scaled (see `fixed_point_parser`).
+            buffered_resync (Optional[bool]): Download the level-3 snapshot
+                and build the new book from it on a background thread when
+                the book (re)synchronizes, and queue incoming messages
+                meanwhile. Once the book is built it is swapped in and the
+                queued messages newer than it are replayed, so the websocket
+                thread never blocks on the REST call or the rebuild.
+        """
+        # price -> {order id: order}, in queue order
         self._asks = SortedDict()
         self._bids = SortedDict()
+        self._orders = {}  # order id -> order resting in _bids/_asks
+        self._bid_sizes = {}  # price -> total size resting at that price
+        self._ask_sizes = {}
+        self._new_order = OrderRecord if compact else _order_dict
         self._client = PublicClient()
+        self._fixed_point = bool(fixed_point)
+        if fixed_point:
+            if not isinstance(fixed_point, dict):
+                fixed_point = self._get_product(product_id)
+            self._price_places = _decimal_places(fixed_point['quote_increment'])
+            self._size_places = _decimal_places(fixed_point['base_increment'])
+            self._to_price = _fixed_point_parser(self._price_places)
+            self._to_size = _fixed_point_parser(self._size_places)
+        else:
+            self._to_price = self._to_size = Decimal
         self._sequence = -1
+        self._buffered_resync = buffered_resync
+        self._resync_thread = None
+        self._resync_result = None
+        self._resync_buffer = []
         self._log_to = log_to
-        if self._log_to:
-            assert hasattr(self._log_to, 'write')
+        if isinstance(log_to, MessageLogWriter):
+            self._log_message = log_to.log
+        elif log_to:
+            assert hasattr(log_to, 'write')
+            self._log_message = lambda message: pickle.dump(message, log_to)
         self._current_ticker = None
         self.product_id = product_id
 
+    def _get_product(self, product_id):
+        for product in self._client.get_products():
+            if product['id'] == product_id:
+                return product
+        raise ValueError('Unknown product: {}'.format(product_id))
+
     def reset_book(self):
-        self._asks = SortedDict()
-        self._bids = SortedDict()
         res = self._client.get_product_order_book(product_id=self.product_id, level=3)
-        for bid in res['bids']:
-            self.add({
-                'id': bid[2],
-                'side': 'buy',
-                'price': Decimal(bid[0]),
-                'size': Decimal(bid[1])
-            })
-        for ask in res['asks']:
-            self.add({
-                'id': ask[2],
-                'side': 'sell',
-                'price': Decimal(ask[0]),
-                'size': Decimal(ask[1])
-            })
-        self._sequence = res['sequence']
+        self._apply_snapshot(res)
+
+    def _apply_snapshot(self, res):
+        self._install_book(self._build_book(res), res['sequence'])
+
+    def _build_book(self, res):
+        """ Build the trees, size maps and order index for a level-3
+        snapshot without touching the live book, so that a buffered resync
+        can do it on the download thread.
+
+        Returns:
+            tuple: (bids, bid sizes, asks, ask sizes, orders)
+        """
+        new_order = self._new_order
+        to_price, to_size = self._to_price, self._to_size
+        orders = {}
+        built = []
+        # the cyclic GC would otherwise rescan the growing book every few
+        # hundred allocations
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for side, entries in (('buy', res['bids']), ('sell', res['asks'])):
+                levels, depth = {}, {}
+                for entry in entries:
+                    price, size, order_id = \
+                        to_price(entry[0]), to_size(entry[1]), entry[2]
+                    level = levels.get(price)
+                    if level is None:
+                        level = levels[price] = {}
+                        depth[price] = size
+                    else:
+                        # share a single price object between all orders
+                        # on a level
+                        price = next(iter(level.values()))['price']
+                        depth[price] += size
+                    order = new_order(order_id, side, price, size)
+                    orders[order_id] = order
+                    level[order_id] = order
+                built.append(SortedDict(levels))
+                built.append(depth)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        built.append(orders)
+        return tuple(built)
+
+    def _install_book(self, built, sequence):
+        (self._bids, self._bid_sizes, self._asks, self._ask_sizes,
+         self._orders) = built
+        self._sequence = sequence
 
     def process_message(self, message):
         if message.get('product_id') == self.product_id:
             if self._log_to:
-                pickle.dump(message, self._log_to)
-
-            sequence = message.get('sequence', -1)
-            if self._sequence == -1:
-                self.reset_book()
-                return
-            if sequence <= self._sequence:
-                # ignore older messages (e.g. before order book initialization from getProductOrderBook)
-                return
-            elif sequence > self._sequence + 1:
-                self.on_sequence_gap(self._sequence, sequence)
-                return
+                self._log_message(message)
+            self._process(message)
 
+    def _process(self, message):
+        if self._resync_thread is not None:
+            self._buffer_message(message)
+            return
+
+        sequence = message.get('sequence', -1)
+        if self._sequence == -1:
+            self._resync()
+        elif sequence <= self._sequence:
+            # ignore older messages (e.g. before order book initialization from getProductOrderBook)
+            return
+        elif sequence > self._sequence + 1:
+            self.on_sequence_gap(self._sequence, sequence)
+        else:
             msg_type = message['type']
             if msg_type == 'open':
                 self.add(message)
@@ -72,107 +271,284 @@ class OrderBook(object):
                 self.change(message)
 
             self._sequence = sequence
+            return
+
+        if self._resync_thread is not None:
+            # keep the message that triggered the resync for replay
+            self._resync_buffer.append(message)
 
     def on_sequence_gap(self, gap_start, gap_end):
-        self.reset_book()
+        self._resync()
+
+    def resync(self):
+        """ Reload the book from a level-3 snapshot when the next message
+        arrives, e.g. after the feed reconnected. """
+        self._sequence = -1
+
+    def _resync(self):
+        """ Reload the book from a level-3 snapshot.
+
+        Blocks on the REST download and rebuild unless the book was
+        created with `buffered_resync=True`, in which case both run on a
+        background thread while incoming messages are buffered.
+        """
+        if not self._buffered_resync:
+            self.reset_book()
+            return
+
+        def _fetch():
+            # download and build the new book here, so the websocket thread
+            # only has to swap it in
+            try:
+                res = self._client.get_product_order_book(
+                    product_id=self.product_id, level=3)
+                self._resync_result = (self._build_book(res),
+                                       res['sequence'])
+            except Exception as e:
+                # includes error responses, which have no bids or sequence
+                self._resync_result = e
+
+        self._resync_result = None
+        self._resync_buffer = []
+        self._resync_thread = Thread(target=_fetch)
+        self._resync_thread.daemon = True
+        self._resync_thread.start()
+
+    def _buffer_message(self, message):
+        self._resync_buffer.append(message)
+        if self._resync_thread.is_alive():
+            return
+
+        self._resync_thread = None
+        res, buffered = self._resync_result, self._resync_buffer
+        self._resync_result, self._resync_buffer = None, []
+        if isinstance(res, Exception):
+            # failed download (or error response), try again
+            self._sequence = -1
+            self._resync()
+            self._resync_buffer = buffered
+            return
+
+        self._install_book(*res)
+        for message in buffered:
+            self._process(message)
 
     def add(self, order):
-        order = {
-            'id': order.get('order_id') or order['id'],
-            'side': order['side'],
-            'price': Decimal(order['price']),
-            'size': Decimal(order.get('size') or order['remaining_size'])
-        }
-        if order['side'] == 'buy':
-            bids = self.get_bids(order['price'])
-            if bids is None:
-                bids = [order]
-            else:
-                bids.append(order)
-            self.set_bids(order['price'], bids)
+        self._add(order.get('order_id') or order['id'],
+                  order['side'],
+                  self._to_price(order['price']),
+                  self._to_size(order.get('size') or order['remaining_size']))
+
+    def _add(self, order_id, side, price, size):
+        if side == 'buy':
+            tree, depth = self._bids, self._bid_sizes
         else:
-            asks = self.get_asks(order['price'])
-            if asks is None:
-                asks = [order]
-            else:
-                asks.append(order)
-            self.set_asks(order['price'], asks)
+            tree, depth = self._asks, self._ask_sizes
+        level = tree.get(price)
+        depth[price] = depth.get(price, 0) + size
+        if level:
+            # share a single price object between all orders on a level
+            price = next(iter(level.values()))['price']
+        order = self._new_order(order_id, side, price, size)
+        self._orders[order_id] = order
+        if level is not None:
+            level[order_id] = order
+        else:
+            tree[price] = {order_id: order}
 
     def remove(self, order):
-        price = Decimal(order['price'])
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is not None:
-                bids = [o for o in bids if o['id'] != order['order_id']]
-                if len(bids) > 0:
-                    self.set_bids(price, bids)
-                else:
-                    self.remove_bids(price)
-        else:
-            asks = self.get_asks(price)
-            if asks is not None:
-                asks = [o for o in asks if o['id'] != order['order_id']]
-                if len(asks) > 0:
-                    self.set_asks(price, asks)
-                else:
-                    self.remove_asks(price)
+        order = self._orders.pop(order['order_id'], None)
+        if order is None:
+            # never rested on the book (e.g. filled on arrival)
+            return
+        self._remove_from_level(order)
 
     def match(self, order):
-        size = Decimal(order['size'])
-        price = Decimal(order['price'])
-
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if not bids:
-                return
-            assert bids[0]['id'] == order['maker_order_id']
-            if bids[0]['size'] == size:
-                self.set_bids(price, bids[1:])
-            else:
-                bids[0]['size'] -= size
-                self.set_bids(price, bids)
+        maker = self._orders.get(order['maker_order_id'])
+        if maker is None:
+            return
+        size = self._to_size(order['size'])
+        if maker['size'] == size:
+            del self._orders[maker['id']]
+            self._remove_from_level(maker)
         else:
-            asks = self.get_asks(price)
-            if not asks:
-                return
-            assert asks[0]['id'] == order['maker_order_id']
-            if asks[0]['size'] == size:
-                self.set_asks(price, asks[1:])
+            maker['size'] -= size
+            if maker['side'] == 'buy':
+                self._bid_sizes[maker['price']] -= size
             else:
-                asks[0]['size'] -= size
-                self.set_asks(price, asks)
+                self._ask_sizes[maker['price']] -= size
 
     def change(self, order):
         try:
-            new_size = Decimal(order['new_size'])
+            new_size = self._to_size(order['new_size'])
         except KeyError:
             return
 
-        try:
-            price = Decimal(order['price'])
-        except KeyError:
+        if 'price' not in order:
             return
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is None or not any(o['id'] == order['order_id'] for o in bids):
-                return
-            index = [b['id'] for b in bids].index(order['order_id'])
-            bids[index]['size'] = new_size
-            self.set_bids(price, bids)
+        node = self._orders.get(order['order_id'])
+        if node is None:
+            return
+        if node['side'] == 'buy':
+            self._bid_sizes[node['price']] += new_size - node['size']
         else:
-            asks = self.get_asks(price)
-            if asks is None or not any(o['id'] == order['order_id'] for o in asks):
-                return
-            index = [a['id'] for a in asks].index(order['order_id'])
-            asks[index]['size'] = new_size
-            self.set_asks(price, asks)
-
-        tree = self._asks if order['side'] == 'sell' else self._bids
-        node = tree.get(price)
+            self._ask_sizes[node['price']] += new_size - node['size']
+        node['size'] = new_size
 
-        if node is None or not any(o['id'] == order['order_id'] for o in node):
+    def _remove_from_level(self, order):
+        # levels are dicts keyed by order id in queue (insertion) order, so
+        # this does not depend on how many orders rest on the level
+        price = order['price']
+        if order['side'] == 'buy':
+            tree, depth = self._bids, self._bid_sizes
+        else:
+            tree, depth = self._asks, self._ask_sizes
+        level = tree.get(price)
+        if level is None or level.pop(order['id'], None) is None:
             return
+        if level:
+            depth[price] -= order['size']
+        else:
+            del tree[price]
+            del depth[price]
+
+    def save_snapshot(self, path):
+        """ Write the book to `path` in a compact binary format.
+
+        After a 40 byte header holding the sequence number, prices and
+        sizes are stored as little-endian int64 columns scaled by a power
+        of ten, followed by the 36 character order ids. Bids come first,
+        in ascending price and queue order, then asks.
+
+        Args:
+            path (str): File to write.
+
+        Raises:
+            ValueError: If an order id is not a 36 character UUID string.
+        """
+        prices, sizes, ids = array('q'), array('q'), []
+        if self._fixed_point:
+            price_exp, size_exp = -self._price_places, -self._size_places
+        else:
+            price_exp = min([p.as_tuple().exponent
+                             for tree in (self._bids, self._asks)
+                             for p in tree] or [0])
+            size_exp = min([o['size'].as_tuple().exponent
+                            for o in self._orders.values()] or [0])
+        for tree in (self._bids, self._asks):
+            for price, level in tree.items():
+                if not self._fixed_point:
+                    price = int(price.scaleb(-price_exp))
+                for order in level.values():
+                    size = order['size']
+                    if not self._fixed_point:
+                        size = int(size.scaleb(-size_exp))
+                    prices.append(price)
+                    sizes.append(size)
+                    ids.append(order['id'])
+        ids = ''.join(ids).encode('ascii')
+        if len(ids) != 36 * len(prices):
+            raise ValueError('Snapshots require 36 character order ids')
+        if sys.byteorder != 'little':
+            prices.byteswap()
+            sizes.byteswap()
+
+        product_id = self.product_id.encode('utf-8')
+        n_bids = sum(len(level) for level in self._bids.values())
+        with open(path, 'wb') as f:
+            f.write(_SNAPSHOT_HEADER.pack(
+                _SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, price_exp, size_exp,
+                self._sequence, n_bids, len(prices) - n_bids,
+                len(product_id)))
+            f.write(product_id.ljust(_padded(len(product_id)), b'\0'))
+            f.write(prices.tobytes())
+            f.write(sizes.tobytes())
+            f.write(ids)
+
+    def load_snapshot(self, path):
+        """ Replace the book with one written by `save_snapshot`.
+
+        The sequence number is restored too, so messages recorded after
+        the snapshot can be replayed straight into `process_message`.
+
+        Args:
+            path (str): File to read.
+
+        Raises:
+            ValueError: If `path` is not a snapshot of this product.
+        """
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, price_exp, size_exp, sequence, n_bids, n_asks,
+             id_len) = _SNAPSHOT_HEADER.unpack_from(data)
+            if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+                raise ValueError('{} is not an order book snapshot'.format(path))
+            offset = _SNAPSHOT_HEADER.size
+            product_id = data[offset:offset + id_len].decode('utf-8')
+            if product_id != self.product_id:
+                raise ValueError('Snapshot is for {}, not {}'.format(
+                    product_id, self.product_id))
+            offset += _padded(id_len)
+            n = n_bids + n_asks
+            prices, sizes = array('q'), array('q')
+            prices.frombytes(data[offset:offset + 8 * n])
+            offset += 8 * n
+            sizes.frombytes(data[offset:offset + 8 * n])
+            offset += 8 * n
+            ids = data[offset:offset + 36 * n].decode('ascii')
+        finally:
+            data.close()
+        if sys.byteorder != 'little':
+            prices.byteswap()
+            sizes.byteswap()
+
+        if self._fixed_point:
+            to_price = _snapshot_parser(price_exp, self._price_places,
+                                        self._to_price)
+            to_size = _snapshot_parser(size_exp, self._size_places,
+                                       self._to_size)
+        else:
+            to_price = _snapshot_parser(price_exp)
+            to_size = _snapshot_parser(size_exp)
+        if to_size is int:
+            sizes = sizes.tolist()
+        else:
+            sizes = list(map(to_size, sizes))
+
+        # the columns are already grouped by level in price order, so the
+        # trees are built in one pass without going through add(). The
+        # cyclic GC is paused meanwhile: it would otherwise rescan the
+        # growing book every few hundred allocations.
+        new_order = self._new_order
+        orders = {}
+        trees = []
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for side, start, stop in (('buy', 0, n_bids), ('sell', n_bids, n)):
+                levels, depth = [], {}
+                key = None
+                for i in range(start, stop):
+                    if prices[i] != key:
+                        key = prices[i]
+                        price = to_price(key)
+                        level = {}
+                        levels.append((price, level))
+                        depth[price] = 0
+                    order_id = ids[36 * i:36 * i + 36]
+                    order = new_order(order_id, side, price, sizes[i])
+                    orders[order_id] = order
+                    level[order_id] = order
+                    depth[price] += sizes[i]
+                trees.append((SortedDict(levels), depth))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self._orders = orders
+        (self._bids, self._bid_sizes), (self._asks, self._ask_sizes) = trees
+        self._sequence = sequence
 
     def get_current_ticker(self):
         return self._current_ticker
@@ -190,7 +566,7 @@ class OrderBook(object):
                 this_ask = self._asks[ask]
             except KeyError:
                 continue
-            for order in this_ask:
+            for order in this_ask.values():
                 result['asks'].append([order['price'], order['size'], order['id']])
         for bid in self._bids:
             try:
@@ -200,38 +576,302 @@ class OrderBook(object):
             except KeyError:
                 continue
 
-            for order in this_bid:
+            for order in this_bid.values():
                 result['bids'].append([order['price'], order['size'], order['id']])
+        if self._fixed_point:
+            for entry in result['asks'] + result['bids']:
+                entry[0] = self._from_price(entry[0])
+                entry[1] = self._from_size(entry[1])
         return result
 
+    def _from_price(self, price):
+        if self._fixed_point:
+            return Decimal(price).scaleb(-self._price_places)
+        return price
+
+    def _from_size(self, size):
+        if self._fixed_point:
+            return Decimal(size).scaleb(-self._size_places)
+        return size
+
     def get_ask(self):
-        return self._asks.peekitem(0)[0]
+        return self._from_price(self._asks.peekitem(0)[0])
 
     def get_asks(self, price):
-        return self._asks.get(price)
+        """ Orders resting at `price`, in queue order, or None. """
+        level = self._asks.get(price)
+        return None if level is None else list(level.values())
 
     def remove_asks(self, price):
         del self._asks[price]
 
     def set_asks(self, price, asks):
-        self._asks[price] = asks
+        self._asks[price] = dict((order['id'], order) for order in asks)
 
     def get_bid(self):
-        return self._bids.peekitem(-1)[0]
+        return self._from_price(self._bids.peekitem(-1)[0])
+
+    def best_bid_size(self):
+        """ Total size resting at the best bid. """
+        return self._from_size(self._bid_sizes[self._bids.peekitem(-1)[0]])
+
+    def best_ask_size(self):
+        """ Total size resting at the best ask. """
+        return self._from_size(self._ask_sizes[self._asks.peekitem(0)[0]])
+
+    def spread(self):
+        return self.get_ask() - self.get_bid()
+
+    def mid(self):
+        return (self.get_ask() + self.get_bid()) / 2
+
+    def get_depth(self, side, n=None):
+        """ Top `n` price levels of one side (all if None), best first.
+
+        Uses the per-level aggregates, so the cost depends on the number of
+        levels returned, not on the number of orders resting on them.
+
+        Args:
+            side (str): 'buy' for bids, 'sell' for asks.
+            n (Optional[int]): Number of levels.
+
+        Returns:
+            list: `[price, size, num-orders]` entries, the same shape as a
+                level-2 `get_product_order_book` response.
+        """
+        if side == 'buy':
+            tree, depth = self._bids, self._bid_sizes
+            start = 0 if n is None else max(len(tree) - n, 0)
+            prices = tree.islice(start, None, reverse=True)
+        else:
+            tree, depth = self._asks, self._ask_sizes
+            prices = tree.islice(0, n)
+        return [[self._from_price(price), self._from_size(depth[price]),
+                 len(tree[price])] for price in prices]
 
     def get_bids(self, price):
-        return self._bids.get(price)
+        """ Orders resting at `price`, in queue order, or None. """
+        level = self._bids.get(price)
+        return None if level is None else list(level.values())
 
     def remove_bids(self, price):
         del self._bids[price]
 
     def set_bids(self, price, bids):
-        self._bids[price] = bids
+        self._bids[price] = dict((order['id'], order) for order in bids)
+
+
+class L2OrderBook(object):
+    """ Aggregated (level-2) order book fed by the `level2` channel.
+
+    Keeps one aggregated size per price in parallel sorted lists. Both
+    sides are keyed so that the best price is at the end of the list
+    (asks are stored negated), which keeps inserts and deletes near the
+    top of the book cheap.
+
+    Subscribe a `WebsocketClient` with `channels=['level2']` and pass
+    each message to `process_message`.
+    """
+    def __init__(self, product_id='BTC-USD'):
+        self.product_id = product_id
+        self._bid_keys = []  # ascending prices, best bid last
+        self._bid_sizes = []
+        self._ask_keys = []  # ascending negated prices, best ask last
+        self._ask_sizes = []
+        self._synced = True
+
+    def process_message(self, message):
+        if message.get('product_id') == self.product_id:
+            msg_type = message['type']
+            if msg_type == 'l2update':
+                if self._synced:
+                    for side, price, size in message['changes']:
+                        self.update(side, price, size)
+            elif msg_type == 'snapshot':
+                self.reset(message['bids'], message['asks'])
+                self._synced = True
+
+    def resync(self):
+        """ Empty the book and ignore updates until the next `snapshot`.
+
+        The level-2 snapshot is only sent when subscribing, so the feed
+        must (re)subscribe for the book to fill again; `WebsocketClient`
+        does so when it reconnects.
+        """
+        self.reset([], [])
+        self._synced = False
+
+    def reset(self, bids, asks):
+        """ Replace the book with `[price, size]` lists (any order). """
+        bids = sorted((Decimal(p), Decimal(s)) for p, s in bids)
+        asks = sorted((-Decimal(p), Decimal(s)) for p, s in asks)
+        self._bid_keys = [p for p, _ in bids]
+        self._bid_sizes = [s for _, s in bids]
+        self._ask_keys = [p for p, _ in asks]
+        self._ask_sizes = [s for _, s in asks]
+
+    def update(self, side, price, size):
+        """ Set the aggregated size at `price`; a size of 0 removes it. """
+        size = Decimal(size)
+        if side == 'buy':
+            key = Decimal(price)
+            keys, sizes = self._bid_keys, self._bid_sizes
+        else:
+            key = -Decimal(price)
+            keys, sizes = self._ask_keys, self._ask_sizes
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            if size:
+                sizes[i] = size
+            else:
+                del keys[i]
+                del sizes[i]
+        elif size:
+            keys.insert(i, key)
+            sizes.insert(i, size)
+
+    def get_bid(self):
+        return self._bid_keys[-1]
+
+    def get_ask(self):
+        return -self._ask_keys[-1]
+
+    def best_bid_size(self):
+        return self._bid_sizes[-1]
+
+    def best_ask_size(self):
+        return self._ask_sizes[-1]
+
+    def spread(self):
+        return self.get_ask() - self.get_bid()
+
+    def mid(self):
+        return (self.get_ask() + self.get_bid()) / 2
+
+    def get_depth(self, side, n=None):
+        """ Top `n` levels of one side (all if None), best first.
+
+        Args:
+            side (str): 'buy' for bids, 'sell' for asks.
+            n (Optional[int]): Number of levels.
+
+        Returns:
+            list: `[price, size]` pairs.
+        """
+        if side == 'buy':
+            keys, sizes = self._bid_keys, self._bid_sizes
+        else:
+            keys, sizes = self._ask_keys, self._ask_sizes
+        start = 0 if n is None else max(len(keys) - n, 0)
+        levels = [[k, s] for k, s in zip(keys[start:], sizes[start:])]
+        levels.reverse()
+        if side != 'buy':
+            for level in levels:
+                level[0] = -level[0]
+        return levels
+
+    def get_cumulative_depth(self, side, n=None):
+        """ Like `get_depth`, but each size is the running total from the
+        best price down to that level.
+        """
+        levels = self.get_depth(side, n)
+        total = Decimal(0)
+        for level in levels:
+            total += level[1]
+            level[1] = total
+        return levels
+
+    def get_size_to_price(self, side, price):
+        """ Total size resting at prices at least as good as `price`. """
+        price = Decimal(price)
+        if side == 'buy':
+            keys, sizes = self._bid_keys, self._bid_sizes
+            i = bisect_left(keys, price)
+        else:
+            keys, sizes = self._ask_keys, self._ask_sizes
+            i = bisect_left(keys, -price)
+        return sum(sizes[i:], Decimal(0))
+
+    def get_current_book(self):
+        return {
+            'bids': self.get_depth('buy'),
+            'asks': self.get_depth('sell'),
+        }
+
+
+class OrderBookManager(object):
+    """ Keeps one order book per product and routes feed messages to it.
+
+    Each message is dispatched with a single dict lookup on its
+    `product_id`, instead of being offered to every book in turn. Books
+    resynchronize independently of each other.
+
+    Example::
+        manager = OrderBookManager(['BTC-USD', 'ETH-USD'])
+
+        class Feed(WebsocketClient):
+            def on_message(self, msg):
+                manager.process_message(msg)
+    """
+    def __init__(self, product_ids, book_class=OrderBook, **book_kwargs):
+        """ Create the books.
+
+        Args:
+            product_ids (list): Products to keep a book for.
+            book_class (Optional[type]): `OrderBook`, `L2OrderBook` or a
+                subclass. Called as `book_class(product_id=..., **book_kwargs)`.
+            book_kwargs: Extra arguments for every book, e.g. `compact=True`.
+        """
+        self._books = dict((product_id,
+                            book_class(product_id=product_id, **book_kwargs))
+                           for product_id in product_ids)
+        self._counts = dict.fromkeys(self._books, 0)
+        self._counts_since = time.time()
+
+    def process_message(self, message):
+        product_id = message.get('product_id')
+        book = self._books.get(product_id)
+        if book is not None:
+            self._counts[product_id] += 1
+            book.process_message(message)
+
+    def get_book(self, product_id):
+        return self._books[product_id]
+
+    def get_products(self):
+        return list(self._books)
+
+    def resync(self, product_id=None):
+        """ Resynchronize one book (all if None); see `OrderBook.resync`
+        and `L2OrderBook.resync`. Level-3 books reload on their next
+        message, level-2 books on the next snapshot, which needs a
+        (re)subscription.
+        """
+        product_ids = self._books if product_id is None else [product_id]
+        for product_id in product_ids:
+            self._books[product_id].resync()
+
+    def get_message_rates(self, reset=True):
+        """ Messages per second routed to each product.
+
+        Args:
+            reset (Optional[bool]): Start a new measurement window.
+
+        Returns:
+            dict: product_id -> messages/sec since the window started.
+        """
+        now = time.time()
+        elapsed = max(now - self._counts_since, 1e-9)
+        rates = dict((product_id, count / elapsed)
+                     for product_id, count in self._counts.items())
+        if reset:
+            self._counts = dict.fromkeys(self._books, 0)
+            self._counts_since = now
+        return rates
 
 
 if __name__ == '__main__':
     import sys
-    import time
     import datetime as dt
 
     class OrderBookConsole(OrderBook):
@@ -253,11 +893,9 @@ if __name__ == '__main__':
                 try:
                     # Calculate newest bid-ask spread
                     bid = self.get_bid()
-                    bids = self.get_bids(bid)
-                    bid_depth = sum([b['size'] for b in bids])
+                    bid_depth = self.best_bid_size()
                     ask = self.get_ask()
-                    asks = self.get_asks(ask)
-                    ask_depth = sum([a['size'] for a in asks])
+                    ask_depth = self.best_ask_size()
 
                     if self._bid == bid and self._ask == ask and self._bid_depth == bid_depth and self._ask_depth == ask_depth:
                         # If there are no changes to the bid-ask spread since the last update, no need to print
@@ -276,14 +914,13 @@ if __name__ == '__main__':
     class WebsocketConsole(WebsocketClient):
         def on_open(self):
             self.products = ['BTC-USD', 'ETH-USD']
-            self.order_book_btc = OrderBookConsole(product_id='BTC-USD')
-            self.order_book_eth = OrderBookConsole(product_id='ETH-USD')
+            self.order_books = OrderBookManager(self.products,
+                                                book_class=OrderBookConsole)
 
         def on_message(self, msg):
-            self.order_book_btc.process_message(msg)
-            self.order_book_eth.process_message(msg)
+            self.order_books.process_message(msg)
 
-    wsClient = WebsocketConsole()
+    wsClient = WebsocketConsole(channels=['full'])
     wsClient.start()
     time.sleep(10)
     try:
@@ -0,0 +1,407 @@
+#
+# cbpro/order_book_pool.py
+#
+# Order books maintained by worker processes, fed raw websocket frames
+# through shared-memory ring buffers
+
+from __future__ import print_function
+import json
+import math
+import multiprocessing
+import struct
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+from cbpro.order_book import OrderBook
+from cbpro.websocket_client import WebsocketClient, get_json_decoder
+
+# Ring header: write counter, capacity, and the read counter on its own
+# cache line. Counters only grow; offsets are taken modulo the capacity.
+_RING_HEADER = 128
+_RING_WRITE = 0
+_RING_CAPACITY = 8
+_RING_READ = 64
+_U64 = struct.Struct('<Q')
+_FRAME_LENGTH = struct.Struct('<I')
+_WRAP = 0xFFFFFFFF
+
+# Top-of-book slot: version, then sequence, bid, bid size, ask, ask size
+# and the time of the last update, padded to 64 bytes.
+_TOP_VERSION = struct.Struct('<Q')
+_TOP_VALUES = struct.Struct('<qddddd')
+_TOP_SLOT = 64
+
+_PRODUCT_ID_KEY = '"product_id"'
+
+
+class FrameRing(object):
+    """ Single-producer, single-consumer ring of byte frames in shared
+    memory.
+
+    Each frame is a 4 byte length followed by the payload. A frame never
+    wraps around the end of the buffer; the writer skips the tail instead.
+    The writer publishes a frame by advancing the write counter after
+    copying it, and the reader frees space by advancing the read counter,
+    so no lock is taken on either side. This relies on aligned 8 byte
+    stores being atomic and on stores becoming visible in program order,
+    as on x86-64.
+    """
+    def __init__(self, size=1 << 20, name=None):
+        """ Create a ring of `size` bytes, or attach to ring `name`. """
+        if name is None:
+            self._shm = SharedMemory(create=True, size=_RING_HEADER + size)
+            _U64.pack_into(self._shm.buf, _RING_CAPACITY, size)
+        else:
+            self._shm = SharedMemory(name=name)
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        self.capacity, = _U64.unpack_from(self._buf, _RING_CAPACITY)
+        self._write, = _U64.unpack_from(self._buf, _RING_WRITE)
+        self._read, = _U64.unpack_from(self._buf, _RING_READ)
+
+    def put(self, frame):
+        """ Append `frame` (bytes). Returns False if the ring is full. """
+        buf = self._buf
+        capacity = self.capacity
+        size = len(frame)
+        needed = _FRAME_LENGTH.size + size
+        if needed > capacity:
+            raise ValueError('frame of {} bytes does not fit a ring of {} '
+                             'bytes'.format(size, capacity))
+        write = self._write
+        pos = write % capacity
+        tail = capacity - pos
+        skip = tail if needed > tail else 0
+        read, = _U64.unpack_from(buf, _RING_READ)
+        if write + skip + needed - read > capacity:
+            return False
+        if skip:
+            if tail >= _FRAME_LENGTH.size:
+                _FRAME_LENGTH.pack_into(buf, _RING_HEADER + pos, _WRAP)
+            write += skip
+            pos = 0
+        start = _RING_HEADER + pos + _FRAME_LENGTH.size
+        buf[start:start + size] = frame
+        _FRAME_LENGTH.pack_into(buf, _RING_HEADER + pos, size)
+        write += needed
+        _U64.pack_into(buf, _RING_WRITE, write)
+        self._write = write
+        return True
+
+    def get_many(self, limit=1000):
+        """ Remove and return up to `limit` frames, oldest first. """
+        buf = self._buf
+        capacity = self.capacity
+        read = self._read
+        write, = _U64.unpack_from(buf, _RING_WRITE)
+        frames = []
+        while read < write and len(frames) < limit:
+            pos = read % capacity
+            tail = capacity - pos
+            if tail < _FRAME_LENGTH.size:
+                read += tail
+                continue
+            size, = _FRAME_LENGTH.unpack_from(buf, _RING_HEADER + pos)
+            if size == _WRAP:
+                read += tail
+                continue
+            start = _RING_HEADER + pos + _FRAME_LENGTH.size
+            frames.append(bytes(buf[start:start + size]))
+            read += _FRAME_LENGTH.size + size
+        if read != self._read:
+            _U64.pack_into(buf, _RING_READ, read)
+            self._read = read
+        return frames
+
+    def get_used(self):
+        """ Bytes written but not yet read. """
+        write, = _U64.unpack_from(self._buf, _RING_WRITE)
+        read, = _U64.unpack_from(self._buf, _RING_READ)
+        return write - read
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class TopOfBookTable(object):
+    """ Best bid and ask per product in shared memory.
+
+    One process publishes, any number read without locking: each slot
+    carries a version that is odd while an update is in progress, and a
+    reader retries until it sees the same even version before and after
+    copying the values (a seqlock).
+
+    Another process can attach with `TopOfBookTable(products, name=...)`
+    using the same product list.
+    """
+    def __init__(self, product_ids, name=None):
+        self.product_ids = list(product_ids)
+        self._index = dict((p, i) for i, p in enumerate(self.product_ids))
+        if name is None:
+            self._shm = SharedMemory(
+                create=True, size=_TOP_SLOT * len(self.product_ids))
+            for i in range(len(self.product_ids)):
+                self._publish(i, -1, math.nan, math.nan, math.nan, math.nan,
+                              0.0)
+        else:
+            self._shm = SharedMemory(name=name)
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+
+    def publish(self, product_id, sequence, bid, bid_size, ask, ask_size):
+        self._publish(self._index[product_id], sequence, bid, bid_size, ask,
+                      ask_size, time.time())
+
+    def _publish(self, index, *values):
+        buf = self._shm.buf
+        offset = index * _TOP_SLOT
+        version, = _TOP_VERSION.unpack_from(buf, offset)
+        _TOP_VERSION.pack_into(buf, offset, version + 1)
+        _TOP_VALUES.pack_into(buf, offset + _TOP_VERSION.size, *values)
+        _TOP_VERSION.pack_into(buf, offset, version + 2)
+
+    def get(self, product_id):
+        """ Latest top of book for `product_id`.
+
+        Returns:
+            dict: `sequence` (-1 before the first update or for level-2
+                books), `bid`, `bid_size`, `ask`, `ask_size` (NaN for an
+                empty side) and `time` of the update.
+        """
+        buf = self._buf
+        offset = self._index[product_id] * _TOP_SLOT
+        while True:
+            version, = _TOP_VERSION.unpack_from(buf, offset)
+            if version & 1:
+                continue
+            values = _TOP_VALUES.unpack_from(buf, offset + _TOP_VERSION.size)
+            if _TOP_VERSION.unpack_from(buf, offset)[0] == version:
+                break
+        sequence, bid, bid_size, ask, ask_size, updated = values
+        return {'sequence': sequence, 'bid': bid, 'bid_size': bid_size,
+                'ask': ask, 'ask_size': ask_size, 'time': updated}
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+def _top_of_book(book):
+    try:
+        bid, bid_size = float(book.get_bid()), float(book.best_bid_size())
+    except IndexError:
+        bid = bid_size = math.nan
+    try:
+        ask, ask_size = float(book.get_ask()), float(book.best_ask_size())
+    except IndexError:
+        ask = ask_size = math.nan
+    return (getattr(book, '_sequence', -1), bid, bid_size, ask, ask_size)
+
+
+def _run_worker(assignments, top_name, product_ids, stop, book_class,
+                book_kwargs, snapshots, batch_size, poll_interval):
+    decode = get_json_decoder()
+    top = TopOfBookTable(product_ids, name=top_name)
+    books = []
+    for product_id, ring_name in assignments:
+        book = book_class(product_id=product_id, **book_kwargs)
+        if product_id in snapshots:
+            book.load_snapshot(snapshots[product_id])
+            top.publish(product_id, *_top_of_book(book))
+        books.append((product_id, FrameRing(name=ring_name), book))
+    try:
+        while True:
+            idle = True
+            for product_id, ring, book in books:
+                frames = ring.get_many(batch_size)
+                if not frames:
+                    continue
+                idle = False
+                for frame in frames:
+                    try:
+                        book.process_message(decode(frame))
+                    except Exception as e:
+                        print('{} - product: {} data: {}'.format(
+                            e, product_id, frame))
+                top.publish(product_id, *_top_of_book(book))
+            if idle:
+                # rings are drained before the worker exits
+                if stop.is_set():
+                    return
+                time.sleep(poll_interval)
+    finally:
+        for _, ring, _ in books:
+            ring.close()
+        top.close()
+
+
+class OrderBookPool(object):
+    """ Order books spread over worker processes.
+
+    `put_frame` routes each raw websocket frame by its `product_id` into
+    that product's `FrameRing`, without decoding it. Every worker process
+    owns the books of a share of the products and drains their rings,
+    decoding and applying the messages off the receiving process's GIL.
+    After each batch a worker publishes the product's best bid and ask to
+    a `TopOfBookTable` that `get_top` reads straight from shared memory.
+
+    The books themselves live in the workers. Use `PooledWebsocketClient`
+    to feed the pool from the websocket feed.
+
+    Example::
+        pool = OrderBookPool(products, workers=4, buffered_resync=True)
+        pool.start()
+        client = PooledWebsocketClient(pool, products=products,
+                                       channels=['full'])
+        client.start()
+        ...
+        pool.get_top('BTC-USD')['bid']
+        ...
+        client.close()
+        pool.close()
+    """
+    def __init__(self, product_ids, workers=2, book_class=OrderBook,
+                 ring_size=1 << 22, overflow='block', snapshots=None,
+                 batch_size=1000, poll_interval=0.0005, **book_kwargs):
+        """
+        Args:
+            product_ids (list): Products to keep a book for.
+            workers (Optional[int]): Number of worker processes.
+            book_class (Optional[type]): `OrderBook`, `L2OrderBook` or a
+                subclass, created in the workers as
+                `book_class(product_id=..., **book_kwargs)`.
+            ring_size (Optional[int]): Bytes of frame buffer per product.
+            overflow (Optional[str]): When a ring is full, 'block' until
+                its worker catches up or 'drop' the frame (a level-3 book
+                then resynchronizes on the sequence gap).
+            snapshots (Optional[dict]): product id -> `save_snapshot` file
+                to load instead of starting from a REST snapshot.
+            batch_size (Optional[int]): Frames a worker takes from one ring
+                before publishing its top of book and moving on.
+            poll_interval (Optional[float]): Seconds an idle worker sleeps.
+            book_kwargs: Extra arguments for every book.
+        """
+        if overflow not in ('block', 'drop'):
+            raise ValueError('overflow must be block or drop, not {}'.format(
+                overflow))
+        self.product_ids = list(product_ids)
+        self.workers = max(1, min(workers, len(self.product_ids)))
+        self.book_class = book_class
+        self.ring_size = ring_size
+        self.overflow = overflow
+        self.snapshots = snapshots or {}
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.book_kwargs = book_kwargs
+        self.frames_dropped = 0
+        self.frames_unrouted = 0
+        self._rings = {}
+        self._top = None
+        self._stop = None
+        self._processes = []
+
+    def start(self):
+        """ Allocate the shared memory and start the workers. """
+        self._rings = dict((p, FrameRing(self.ring_size))
+                           for p in self.product_ids)
+        self._top = TopOfBookTable(self.product_ids)
+        self._stop = multiprocessing.Event()
+        self._processes = []
+        for i in range(self.workers):
+            assignments = [(p, self._rings[p].name)
+                           for p in self.product_ids[i::self.workers]]
+            process = multiprocessing.Process(
+                target=_run_worker,
+                args=(assignments, self._top.name, self.product_ids,
+                      self._stop, self.book_class, self.book_kwargs,
+                      self.snapshots, self.batch_size, self.poll_interval))
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+
+    def put_frame(self, frame):
+        """ Route a raw feed frame (str or bytes) to its product's worker.
+
+        Frames for products outside the pool, and frames without a
+        `product_id` such as subscription confirmations, are ignored.
+        """
+        if isinstance(frame, bytes):
+            frame = frame.decode('utf-8')
+        start = frame.find(_PRODUCT_ID_KEY)
+        if start < 0:
+            self.frames_unrouted += 1
+            return
+        # the value is the next string after the key, whatever the spacing
+        start = frame.find('"', start + len(_PRODUCT_ID_KEY)) + 1
+        ring = self._rings.get(frame[start:frame.find('"', start)])
+        if ring is None:
+            self.frames_unrouted += 1
+            return
+        data = frame.encode('utf-8')
+        while not ring.put(data):
+            if self.overflow == 'drop':
+                self.frames_dropped += 1
+                return
+            time.sleep(self.poll_interval)
+
+    def put_message(self, message):
+        """ Route an already decoded message, e.g. from a recorded feed. """
+        self.put_frame(json.dumps(message, separators=(',', ':')))
+
+    def get_top(self, product_id):
+        """ Latest top of book published for `product_id`; see
+        `TopOfBookTable.get`.
+        """
+        return self._top.get(product_id)
+
+    def get_backlog(self):
+        """ Bytes of frames waiting in each product's ring. """
+        return dict((p, ring.get_used()) for p, ring in self._rings.items())
+
+    def close(self):
+        """ Let the workers drain their rings, stop them and free the
+        shared memory.
+        """
+        self._stop.set()
+        for process in self._processes:
+            process.join()
+        for ring in self._rings.values():
+            ring.close()
+            ring.unlink()
+        self._top.close()
+        self._top.unlink()
+
+
+def _raw_frame(data):
+    return data
+
+
+class PooledWebsocketClient(WebsocketClient):
+    """ Websocket client that hands raw frames to an `OrderBookPool`
+    instead of decoding them.
+
+    `stats` and `heartbeat` need decoded messages, so they are not
+    supported; `stale_timeout` still detects dead connections by their
+    pongs.
+    """
+    def __init__(self, pool, **kwargs):
+        for option in ('stats', 'heartbeat'):
+            if kwargs.get(option):
+                raise ValueError('PooledWebsocketClient does not decode '
+                                 'messages, so {} is not supported'.format(
+                                     option))
+        kwargs['decoder'] = _raw_frame
+        kwargs.pop('parse_numbers', None)
+        kwargs.setdefault('should_print', False)
+        super(PooledWebsocketClient, self).__init__(**kwargs)
+        self.pool = pool
+
+    def on_message(self, msg):
+        self.pool.put_frame(msg)
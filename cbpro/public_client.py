@@ -4,7 +4,13 @@
 #
 # For public requests to the Coinbase exchange
 
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import requests
+from cbpro.rate_limiter import RateLimiter
+from cbpro.retry import DEFAULT_RETRY
 
 
 class PublicClient(object):
@@ -15,19 +21,48 @@ class PublicClient(object):
 
     Attributes:
         url (Optional[str]): API URL. Defaults to cbpro API.
+        timeout (float or tuple): Seconds to wait for the server.
+        session (requests.Session): Persistent HTTP connection pool.
+        rate_limiter (Optional[RateLimiter]): Throttles requests.
+        retry (Optional[RetryPolicy]): Retries transient failures.
 
     """
 
-    def __init__(self, api_url='https://api.pro.coinbase.com', timeout=30):
+    def __init__(self, api_url='https://api.pro.coinbase.com', timeout=30,
+                 rate_limiter=None, retry=DEFAULT_RETRY, session=None,
+                 pool_size=10, keep_alive=True, adapter=None):
         """Create cbpro API public client.
 
         Args:
             api_url (Optional[str]): API URL. Defaults to cbpro API.
+            timeout (Optional[float or tuple]): Seconds to wait for the
+                server, or a (connect, read) tuple to set them apart.
+            rate_limiter (Optional[RateLimiter]): Wait for a token from
+                this limiter before every request. Share one instance
+                between clients to limit their combined rate.
+            retry (Optional[RetryPolicy]): Retry idempotent requests that
+                fail with a connection error, timeout, 429 or 5xx. Defaults
+                to 3 attempts; None disables retries.
+            session (Optional[requests.Session]): Session to send requests
+                with, e.g. to share one connection pool between clients.
+                `pool_size`, `keep_alive` and `adapter` are ignored if
+                given.
+            pool_size (Optional[int]): Connections kept open for reuse;
+                more threads than this sharing the client open extra
+                connections that are closed after each request.
+            keep_alive (Optional[bool]): Reuse connections between requests.
+            adapter (Optional[requests.adapters.HTTPAdapter]): Transport
+                adapter to mount instead of one sized by `pool_size`.
 
         """
         self.url = api_url.rstrip('/')
         self.auth = None
-        self.session = requests.Session()
+        self.timeout = timeout
+        if session is None:
+            session = create_session(pool_size, keep_alive, adapter)
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.retry = retry
 
     def get_products(self):
         """Get a list of available currency pairs for trading.
@@ -199,6 +234,49 @@ class PublicClient(object):
                                   '/products/{}/candles'.format(product_id),
                                   params=params)
 
+    def get_historic_rates_range(self, product_id, start, end, granularity,
+                                 workers=4):
+        """Historic rates for a product over any time range.
+
+        The range is split into requests of at most 200 candles, which are
+        sent from `workers` threads at once, paced by the client's rate
+        limiter or, if it has none, by one at the default rates. Candles are deduplicated by time and returned in
+        ascending order, one `array.array` per field. They convert to
+        NumPy without copying, e.g. `numpy.frombuffer(rates['close'])`.
+
+        Args:
+            product_id (str): Product
+            start (str, datetime or float): Start time in ISO 8601, as a
+                datetime (UTC if naive) or in seconds since the epoch
+            end (str, datetime or float): End time, like `start`
+            granularity (int): Desired time slice in seconds
+            workers (Optional[int]): Requests in flight at once
+
+        Returns:
+            dict: Columns by name. Example::
+                {
+                    'time': array('q', [1415398740, 1415398800, ...]),
+                    'low': array('d', [0.32, 0.35, ...]),
+                    'high': ..., 'open': ..., 'close': ..., 'volume': ...
+                }
+
+        Raises:
+            ValueError: A request was answered with an error message.
+
+        """
+        windows = get_candle_windows(start, end, granularity)
+        pacer = _get_range_pacer(self)
+
+        def fetch(window):
+            if pacer is not None:
+                pacer.acquire('get', '/products/{}/candles'.format(
+                    product_id), self.auth is not None)
+            return self.get_product_historic_rates(
+                product_id, _to_iso(window[0]), _to_iso(window[1]),
+                granularity)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return get_candle_columns(executor.map(fetch, windows))
+
     def get_product_24hr_stats(self, product_id):
         """Get 24 hr stats for the product.
 
@@ -264,11 +342,47 @@ class PublicClient(object):
             dict/list: JSON response
 
         """
-        url = self.url + endpoint
-        r = self.session.request(method, url, params=params, data=data,
-                                 auth=self.auth, timeout=30)
+        r = self._request(method, endpoint, params=params, data=data)
         return r.json()
 
+    def _request(self, method, endpoint, params=None, data=None):
+        """Send one HTTP request, under the rate limiter if there is one,
+        retrying transient failures according to the retry policy.
+
+        Returns:
+            requests.Response: The last response, which may be an error if
+                retries ran out.
+
+        Raises:
+            requests.RequestException: The last attempt could not connect
+                or timed out.
+
+        """
+        limiter = self.rate_limiter
+        retry = self.retry
+        private = self.auth is not None
+        attempt = 0
+        while True:
+            attempt += 1
+            can_retry = retry is not None and retry.can_retry(method, attempt)
+            if limiter is not None:
+                limiter.acquire(method, endpoint, private)
+            try:
+                r = self.session.request(method, self.url + endpoint,
+                                         params=params, data=data,
+                                         auth=self.auth,
+                                         timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if not can_retry:
+                    raise
+                time.sleep(retry.get_delay(attempt))
+                continue
+            if limiter is not None and r.status_code == 429:
+                limiter.record_throttled(method, endpoint, private)
+            if not can_retry or r.status_code not in retry.statuses:
+                return r
+            time.sleep(retry.get_delay(attempt, r.headers.get('Retry-After')))
+
     def _send_paginated_message(self, endpoint, params=None):
         """ Send API message that results in a paginated response.
 
@@ -284,6 +398,9 @@ class PublicClient(object):
             `limit`: Set amount of data per HTTP response. Default (and
                 maximum) of 100.
 
+        Each page is retried on its own, so a transient failure resumes from
+        the last page's cursor rather than starting over.
+
         Args:
             endpoint (str): Endpoint (to be added to base URL)
             params (Optional[dict]): HTTP request parameters
@@ -294,9 +411,8 @@ class PublicClient(object):
         """
         if params is None:
             params = dict()
-        url = self.url + endpoint
         while True:
-            r = self.session.get(url, params=params, auth=self.auth, timeout=30)
+            r = self._request('get', endpoint, params=params)
             results = r.json()
             for result in results:
                 yield result
@@ -309,3 +425,84 @@ class PublicClient(object):
                 break
             else:
                 params['after'] = r.headers['cb-after']
+
+
+def create_session(pool_size=10, keep_alive=True, adapter=None):
+    """ Create a `requests.Session` for one or more clients to share.
+
+    Args:
+        pool_size (Optional[int]): Connections kept open per host.
+        keep_alive (Optional[bool]): Reuse connections between requests.
+        adapter (Optional[requests.adapters.HTTPAdapter]): Transport adapter
+            to mount instead of one sized by `pool_size`.
+
+    Returns:
+        requests.Session
+
+    """
+    session = requests.Session()
+    if adapter is None:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+CANDLE_FIELDS = ('time', 'low', 'high', 'open', 'close', 'volume')
+MAX_CANDLES = 200
+
+
+def get_candle_windows(start, end, granularity):
+    """ Split a time range into (start, end) epoch seconds windows of at
+    most `MAX_CANDLES` candles each.
+
+    The start is rounded down to a multiple of `granularity`, where the
+    exchange's candles begin, so no candle falls between two windows.
+    """
+    start, end = int(_to_timestamp(start)), int(_to_timestamp(end))
+    start -= start % granularity
+    windows = []
+    while start <= end:
+        windows.append((start, min(start + (MAX_CANDLES - 1) * granularity,
+                                   end)))
+        start += MAX_CANDLES * granularity
+    return windows
+
+
+def get_candle_columns(pages):
+    """ Merge pages of candles into sorted, deduplicated columns; see
+    `PublicClient.get_historic_rates_range`. """
+    candles = {}
+    for page in pages:
+        if isinstance(page, dict):
+            raise ValueError('Historic rates request failed: {}'.format(
+                page.get('message', page)))
+        for candle in page:
+            candles[candle[0]] = candle
+    rows = [candles[t] for t in sorted(candles)]
+    columns = list(zip(*rows)) or [()] * len(CANDLE_FIELDS)
+    return dict((name, array('q' if name == 'time' else 'd', column))
+                for name, column in zip(CANDLE_FIELDS, columns))
+
+
+def _get_range_pacer(client):
+    # clients without a rate limiter would send every window at once and
+    # run into 429s; pace them at the default rates instead
+    return RateLimiter() if client.rate_limiter is None else None
+
+
+def _to_timestamp(value):
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _to_iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
@@ -0,0 +1,152 @@
+#
+# cbpro/rate_limiter.py
+#
+# Client-side token buckets for the REST API rate limits
+
+import time
+from threading import Lock
+
+
+class RateLimitExceeded(Exception):
+    """ A request would have waited longer than `max_wait` for a token. """
+
+
+class TokenBucket(object):
+    """ Thread-safe token bucket: `rate` tokens per second, holding at most
+    `burst`.
+
+    `reserve` takes a token immediately and returns how long the caller has
+    to wait before using it. The balance may go negative, so concurrent
+    callers queue up in the order they reserved instead of racing for
+    each refill.
+
+    Attributes:
+        acquired (int): Tokens handed out.
+        waited (int): Reservations that had to wait.
+        wait_time (float): Total seconds callers were told to wait.
+        rejected (int): Reservations refused for exceeding `max_wait`.
+        throttled (int): 429 responses seen despite the limiter.
+    """
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (Optional[float]): Bucket size. Defaults to `rate`.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = Lock()
+        self.acquired = 0
+        self.waited = 0
+        self.wait_time = 0.0
+        self.rejected = 0
+        self.throttled = 0
+
+    def reserve(self, tokens=1, max_wait=None):
+        """ Take `tokens` and return the seconds to wait before using them.
+
+        Raises:
+            RateLimitExceeded: The wait would exceed `max_wait`; nothing is
+                taken.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (tokens - self._tokens) / self.rate \
+                if self._tokens < tokens else 0.0
+            if max_wait is not None and wait > max_wait:
+                self.rejected += 1
+                raise RateLimitExceeded(
+                    'rate limit: would wait {:.3f}s'.format(wait))
+            self._tokens -= tokens
+            self.acquired += tokens
+            if wait:
+                self.waited += 1
+                self.wait_time += wait
+            return wait
+
+    def acquire(self, tokens=1, max_wait=None):
+        """ Block until `tokens` are available. """
+        wait = self.reserve(tokens, max_wait)
+        if wait:
+            time.sleep(wait)
+
+    def get_metrics(self):
+        with self._lock:
+            tokens = min(self.burst, self._tokens +
+                         (time.monotonic() - self._updated) * self.rate)
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': tokens,
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'wait_time': self.wait_time,
+                'rejected': self.rejected,
+                'throttled': self.throttled,
+            }
+
+
+class RateLimiter(object):
+    """ Token buckets for the public, private and order endpoints.
+
+    Pass one instance as `rate_limiter` to any number of `PublicClient`,
+    `AuthenticatedClient` (or async) instances, in any number of threads,
+    to keep their combined request rate under the exchange's limits.
+    Placing and canceling orders draws from `orders`, other authenticated
+    requests from `private` and unauthenticated ones from `public`. To
+    count orders against the private limit as well, pass the same bucket
+    for both.
+
+    Example::
+        limiter = RateLimiter(public=TokenBucket(3, 6))
+        clients = [PublicClient(rate_limiter=limiter) for _ in range(8)]
+        ...
+        limiter.get_metrics()['public']['wait_time']
+    """
+    def __init__(self, public=None, private=None, orders=None,
+                 max_wait=None):
+        """
+        Args:
+            public (Optional[TokenBucket]): Defaults to 3/s, burst 6.
+            private (Optional[TokenBucket]): Defaults to 5/s, burst 10.
+            orders (Optional[TokenBucket]): Defaults to 5/s, burst 10.
+            max_wait (Optional[float]): Raise `RateLimitExceeded` instead
+                of waiting longer than this many seconds for a token.
+        """
+        self.public = public or TokenBucket(3, 6)
+        self.private = private or TokenBucket(5, 10)
+        self.orders = orders or TokenBucket(5, 10)
+        self.max_wait = max_wait
+
+    def get_bucket(self, method, endpoint, private):
+        if private and method.lower() in ('post', 'delete') and \
+                endpoint.startswith('/orders'):
+            return self.orders
+        return self.private if private else self.public
+
+    def reserve(self, method, endpoint, private):
+        """ Reserve a token for a request; returns the seconds to wait. """
+        return self.get_bucket(method, endpoint, private).reserve(
+            max_wait=self.max_wait)
+
+    def acquire(self, method, endpoint, private):
+        """ Block until a request may be sent. """
+        wait = self.reserve(method, endpoint, private)
+        if wait:
+            time.sleep(wait)
+
+    def record_throttled(self, method, endpoint, private):
+        """ Count a 429 response against the request's bucket. """
+        bucket = self.get_bucket(method, endpoint, private)
+        with bucket._lock:
+            bucket.throttled += 1
+
+    def get_metrics(self):
+        """ `TokenBucket.get_metrics` for each bucket, by name. """
+        return dict((name, getattr(self, name).get_metrics())
+                    for name in ('public', 'private', 'orders'))
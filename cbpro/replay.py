@@ -0,0 +1,172 @@
+#
+# cbpro/replay.py
+#
+# Rebuild order books from recorded feeds without a network connection
+#
+# Usage:
+#   python -m cbpro.replay btc-usd.log --product BTC-USD [--speed 10]
+
+from __future__ import print_function
+import json
+import pickle
+import time
+
+from cbpro.feed_stats import parse_feed_time
+from cbpro.message_log import read_message_log
+from cbpro.order_book import OrderBook, OrderBookManager
+
+
+def read_pickle_log(path):
+    """ Iterate over a pickle stream written by `OrderBook(log_to=file)`.
+
+    Only replay files you recorded yourself: unpickling runs arbitrary
+    code from the file.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def read_json_lines(path):
+    """ Iterate over a file with one JSON message per line. """
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_messages(path):
+    """ Iterate over a recorded feed, detecting its format.
+
+    Supports `MessageLogWriter` logs (plain or compressed, including
+    rotated segments), `log_to` pickle streams and JSON lines.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(2)
+    if head[:1] == b'\x80':
+        return read_pickle_log(path)
+    if head[:1] in (b'{', b'['):
+        return read_json_lines(path)
+    return read_message_log(path)
+
+
+def replay(messages, book, speed=None, start_empty=True):
+    """ Drive `book` from recorded messages.
+
+    Args:
+        messages (iterable): Feed messages, e.g. from `read_messages`.
+        book: Anything with `process_message`: an `OrderBook`,
+            `L2OrderBook`, `OrderBookManager` or a subclass.
+        speed (Optional[float]): Replay at this multiple of the recorded
+            pace, using each message's `time` field. None replays as fast
+            as possible.
+        start_empty (Optional[bool]): Start level-3 books that have not
+            been synchronized (e.g. with `load_snapshot`) from an empty
+            book at their first recorded sequence number, instead of
+            downloading a snapshot over REST.
+
+    Returns:
+        dict: `messages` processed, elapsed `seconds` and
+            `messages_per_sec`.
+    """
+    if speed is not None:
+        messages = _paced(messages, speed)
+    messages = iter(messages)
+    process = book.process_message
+    count = 0
+    start = time.perf_counter()
+
+    unsynced = {}
+    if start_empty:
+        unsynced = dict((b.product_id, b) for b in _order_books(book)
+                        if b._sequence == -1)
+    # prime unsynchronized books from their first sequenced message; the
+    # plain loop below takes over once none are left
+    for message in messages:
+        b = unsynced.get(message.get('product_id'))
+        if b is not None and 'sequence' in message:
+            b._sequence = message['sequence'] - 1
+            del unsynced[b.product_id]
+        process(message)
+        count += 1
+        if not unsynced:
+            break
+
+    for message in messages:
+        process(message)
+        count += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        'messages': count,
+        'seconds': elapsed,
+        'messages_per_sec': count / elapsed if elapsed else 0.0,
+    }
+
+
+def _order_books(book):
+    if isinstance(book, OrderBookManager):
+        books = [book.get_book(p) for p in book.get_products()]
+    else:
+        books = [book]
+    return [b for b in books if isinstance(b, OrderBook)]
+
+
+def _paced(messages, speed):
+    first = None
+    for message in messages:
+        feed_time = message.get('time')
+        if feed_time is not None:
+            feed_time = parse_feed_time(feed_time)
+            if first is None:
+                first, started = feed_time, time.perf_counter()
+            else:
+                delay = (feed_time - first) / speed - \
+                    (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        yield message
+
+
+if __name__ == '__main__':
+    import argparse
+    from cbpro.order_book import L2OrderBook
+
+    parser = argparse.ArgumentParser(
+        description='Replay a recorded feed into an order book.')
+    parser.add_argument('path', help='MessageLogWriter log, log_to pickle '
+                                     'stream or JSON lines file')
+    parser.add_argument('--product', action='append', required=True,
+                        help='product to build a book for (repeatable)')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='multiple of the recorded pace '
+                             '(default: as fast as possible)')
+    parser.add_argument('--snapshot', default=None,
+                        help='OrderBook.save_snapshot file to start from '
+                             '(single product only)')
+    parser.add_argument('--compact', action='store_true',
+                        help='use compact order storage')
+    parser.add_argument('--level2', action='store_true',
+                        help='replay a level2 feed into L2OrderBook')
+    args = parser.parse_args()
+
+    if args.level2:
+        books = OrderBookManager(args.product, book_class=L2OrderBook)
+    else:
+        books = OrderBookManager(args.product, compact=args.compact)
+        if args.snapshot:
+            books.get_book(args.product[0]).load_snapshot(args.snapshot)
+
+    stats = replay(read_messages(args.path), books, speed=args.speed)
+    print('{messages:,} messages in {seconds:.3f}s '
+          '({messages_per_sec:,.0f} messages/sec)'.format(**stats))
+    for product_id in args.product:
+        book = books.get_book(product_id)
+        try:
+            print('{}: bid {} ask {}'.format(product_id, book.get_bid(),
+                                             book.get_ask()))
+        except IndexError:
+            print('{}: empty book'.format(product_id))
@@ -0,0 +1,86 @@
+#
+# cbpro/retry.py
+#
+# Retry policy for transient REST API failures
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+IDEMPOTENT_METHODS = frozenset(['get', 'head', 'options', 'put', 'delete'])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class RetryPolicy(object):
+    """ When and how long to wait before retrying a REST request.
+
+    A request is retried when the connection fails or times out, or the
+    response status is in `statuses`, as long as its method is in `methods`
+    and fewer than `attempts` requests have been made. Retry number n waits
+    `backoff * 2 ** (n - 1)` seconds, capped at `max_backoff`, of which the
+    upper half is random so that clients which failed together do not retry
+    together. A `Retry-After` header is honored instead, up to
+    `max_retry_after` seconds.
+
+    Placing orders (POST) is not retried by default: a request that timed
+    out may still have been executed.
+
+    Example::
+        client = PublicClient(retry=RetryPolicy(attempts=5, backoff=1))
+        no_retries = PublicClient(retry=None)
+    """
+    def __init__(self, attempts=3, backoff=0.5, max_backoff=10,
+                 max_retry_after=60, statuses=RETRY_STATUSES,
+                 methods=IDEMPOTENT_METHODS):
+        """
+        Args:
+            attempts (Optional[int]): Most requests made, first included.
+            backoff (Optional[float]): Seconds before the first retry.
+            max_backoff (Optional[float]): Longest backoff in seconds.
+            max_retry_after (Optional[float]): Longest `Retry-After` wait
+                honored, in seconds.
+            statuses (Optional[iterable]): HTTP statuses to retry.
+            methods (Optional[iterable]): HTTP methods that may be retried.
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(m.lower() for m in methods)
+
+    def can_retry(self, method, attempt):
+        """ Whether request number `attempt` (from 1) may be followed by
+        another one. """
+        return attempt < self.attempts and method.lower() in self.methods
+
+    def get_delay(self, attempt, retry_after=None):
+        """ Seconds to wait after failed request number `attempt`.
+
+        Args:
+            attempt (int): Requests made so far.
+            retry_after (Optional[str]): The response's `Retry-After`
+                header, in seconds or as an HTTP date.
+        """
+        if retry_after is not None:
+            seconds = parse_retry_after(retry_after)
+            if seconds is not None:
+                return min(seconds, self.max_retry_after)
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+DEFAULT_RETRY = RetryPolicy()
+
+
+def parse_retry_after(value):
+    """ Seconds to wait from a `Retry-After` header, or None if it is not
+    valid. """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
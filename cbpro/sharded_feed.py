@@ -0,0 +1,214 @@
+#
+# cbpro/sharded_feed.py
+#
+# Spread a many-product subscription over several websocket connections
+# and merge them back into one stream
+
+from __future__ import print_function
+import multiprocessing
+import queue
+from threading import Thread, current_thread
+
+from cbpro.websocket_client import WebsocketClient
+
+_MESSAGE = 0
+_ERROR = 1
+_CLOSED = 2
+
+
+class _ShardClient(WebsocketClient):
+    """ Forwards everything it receives to the feed's merged queue. """
+    def __init__(self, shard, output, **kwargs):
+        super(_ShardClient, self).__init__(**kwargs)
+        self.shard = shard
+        self.output = output
+
+    def on_open(self):
+        pass
+
+    def on_close(self):
+        pass
+
+    def _disconnect(self):
+        try:
+            super(_ShardClient, self)._disconnect()
+        finally:
+            if current_thread() is self.thread:
+                # sent once, by the receive thread after its last message,
+                # however the connection ended
+                self.output.put((_CLOSED, self.shard, None))
+
+    def on_reconnect(self):
+        pass
+
+    def on_message(self, msg):
+        self.output.put((_MESSAGE, self.shard, msg))
+
+    def on_error(self, e, data=None):
+        self.error = e
+        self.stop = True
+        self.output.put((_ERROR, self.shard, e))
+
+
+def _run_shard_process(shard, output, stop, kwargs):
+    try:
+        client = _ShardClient(shard, output, **kwargs)
+        client.start()
+    except Exception as e:
+        output.put((_ERROR, shard, e))
+        output.put((_CLOSED, shard, None))
+        return
+    # returns early once the client gave up on its own
+    while not stop.wait(0.1) and client.thread.is_alive():
+        pass
+    client.close()
+
+
+class ShardedWebsocketFeed(object):
+    """ Websocket feed for many products over several connections.
+
+    Products are dealt round-robin over `shards` connections, each
+    receiving on its own `WebsocketClient` thread, or in its own process
+    with `processes=True` so socket reads, TLS and JSON decoding run on
+    separate cores. All connections feed one queue that a single thread
+    drains into `on_message`, so handlers never run concurrently. Each
+    product lives on exactly one connection and every connection enqueues
+    in arrival order, so messages for a product keep their order; there
+    is no ordering between products.
+
+    Messages cross the process boundary pickled, so processes pay off
+    when the feed is busy enough that receiving and decoding, rather than
+    `on_message`, saturate a core.
+
+    Extra keyword arguments (`url`, `auth`, `decoder`, `reconnect`, ...)
+    are passed to every shard's `WebsocketClient`. In process mode they
+    must be picklable.
+
+    Example::
+        class Feed(ShardedWebsocketFeed):
+            def on_open(self):
+                self.books = OrderBookManager(products)
+
+            def on_message(self, msg):
+                self.books.process_message(msg)
+
+        feed = Feed(products, channels=['full'], shards=4)
+        feed.start()
+        ...
+        feed.close()
+    """
+    def __init__(self, products, channels, shards=2, processes=False,
+                 should_print=True, **client_kwargs):
+        """
+        Args:
+            products (list): Product ids to subscribe to.
+            channels (list): Channels, as for `WebsocketClient`.
+            shards (Optional[int]): Number of connections. At most one
+                per product.
+            processes (Optional[bool]): Run each connection in a child
+                process instead of a thread.
+            should_print (Optional[bool]): Print messages and errors from
+                the default handlers.
+        """
+        if isinstance(products, str):
+            products = [products]
+        shards = max(1, min(shards, len(products)))
+        self.products = list(products)
+        self.channels = channels
+        self.processes = processes
+        self.should_print = should_print
+        self.client_kwargs = client_kwargs
+        self.shard_products = [self.products[i::shards]
+                               for i in range(shards)]
+        self.product_shards = dict((product_id, i)
+                                   for i, ps in enumerate(self.shard_products)
+                                   for product_id in ps)
+        self.stop = True
+        self.error = None
+        self.messages_received = [0] * shards
+        self._clients = []
+        self._output = None
+        self._stop_processes = None
+        self._dispatcher = None
+
+    def start(self):
+        """ Open all connections and start dispatching. """
+        self.stop = False
+        self.on_open()
+        if self.processes:
+            self._output = multiprocessing.Queue()
+            self._stop_processes = multiprocessing.Event()
+        else:
+            self._output = queue.Queue()
+        self._clients = []
+        for shard, products in enumerate(self.shard_products):
+            kwargs = dict(self.client_kwargs, products=products,
+                          channels=self.channels, should_print=False)
+            if self.processes:
+                client = multiprocessing.Process(
+                    target=_run_shard_process,
+                    args=(shard, self._output, self._stop_processes, kwargs))
+                client.daemon = True
+            else:
+                client = _ShardClient(shard, self._output, **kwargs)
+            client.start()
+            self._clients.append(client)
+        self._dispatcher = Thread(target=self._dispatch)
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        output = self._output
+        received = self.messages_received
+        closed = set()
+        while len(closed) < len(self._clients):
+            kind, shard, payload = output.get()
+            if kind == _MESSAGE:
+                received[shard] += 1
+                self.on_message(payload)
+            elif kind == _ERROR:
+                self.on_error(payload, shard)
+            else:
+                closed.add(shard)
+        self.stop = True
+        self.on_close()
+
+    def close(self):
+        """ Close all connections and wait for queued messages to be
+        dispatched.
+        """
+        self.stop = True
+        if self.processes:
+            self._stop_processes.set()
+        for client in self._clients:
+            if self.processes:
+                client.join()
+            else:
+                client.close()
+        # every shard has finished and its messages are queued; make sure
+        # the dispatcher stops even if one died without saying so
+        for shard in range(len(self._clients)):
+            self._output.put((_CLOSED, shard, None))
+        self._dispatcher.join()
+
+    def get_queue_depth(self):
+        """ Messages received but not yet passed to `on_message`. """
+        return self._output.qsize() if self._output is not None else 0
+
+    def on_open(self):
+        if self.should_print:
+            print("-- Subscribed! --\n")
+
+    def on_close(self):
+        if self.should_print:
+            print("\n-- Socket Closed --")
+
+    def on_message(self, msg):
+        if self.should_print:
+            print(msg)
+
+    def on_error(self, e, shard=None):
+        """ A connection failed. The other shards keep running. """
+        self.error = e
+        print('{} - shard: {} products: {}'.format(
+            e, shard, self.shard_products[shard]))
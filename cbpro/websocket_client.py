@@ -10,11 +10,76 @@ import json
 import base64
 import hmac
 import hashlib
+import random
 import time
-from threading import Thread
-from websocket import create_connection, WebSocketConnectionClosedException
-from pymongo import MongoClient
+from queue import Queue, Full, Empty
+from threading import Event, Thread
+from websocket import create_connection, WebSocketConnectionClosedException, \
+    WebSocketException, WebSocketTimeoutException, ABNF
 from cbpro.cbpro_auth import get_auth_headers
+from cbpro.feed_stats import FeedStats
+
+
+# Feed fields holding decimal numbers as strings
+NUMBER_FIELDS = ('price', 'size', 'remaining_size', 'old_size', 'new_size',
+                 'funds', 'old_funds', 'new_funds', 'stop_price',
+                 'best_bid', 'best_ask', 'last_size', 'open_24h',
+                 'volume_24h', 'low_24h', 'high_24h', 'volume_30d')
+
+
+def get_json_decoder(name=None):
+    """ Return a `loads` function by name, or the fastest one installed.
+
+    Args:
+        name (Optional[str]): 'orjson', 'ujson' or 'json'. None tries them
+            in that order.
+    """
+    for candidate in ([name] if name else ['orjson', 'ujson', 'json']):
+        try:
+            return __import__(candidate).loads
+        except ImportError:
+            if name:
+                raise
+    return json.loads
+
+
+def _channel_names(channels):
+    # channels are given as names or {'name': ..., 'product_ids': ...}
+    return set(c['name'] if isinstance(c, dict) else c
+               for c in channels or ())
+
+
+def _make_decoder(decoder, parse_numbers):
+    if decoder is None or isinstance(decoder, str):
+        decoder = get_json_decoder(decoder)
+    if parse_numbers is None:
+        return decoder
+
+    if isinstance(parse_numbers, dict):
+        converters = list(parse_numbers.items())
+        convert_levels = None
+    else:
+        converters = [(field, parse_numbers) for field in NUMBER_FIELDS]
+        convert_levels = parse_numbers
+
+    def decode(data):
+        msg = decoder(data)
+        for field, convert in converters:
+            if field in msg:
+                value = msg[field]
+                if value is not None:
+                    msg[field] = convert(value)
+        if convert_levels is not None:
+            # level2 snapshot and l2update price levels
+            for key in ('bids', 'asks'):
+                for level in msg.get(key, ()):
+                    level[0] = convert_levels(level[0])
+                    level[1] = convert_levels(level[1])
+            for change in msg.get('changes', ()):
+                change[1] = convert_levels(change[1])
+                change[2] = convert_levels(change[2])
+        return msg
+    return decode
 
 
 class WebsocketClient(object):
@@ -32,7 +97,47 @@ class WebsocketClient(object):
             # Make channels a required keyword-only argument; see pep3102
             *,
             # Channel options: ['ticker', 'user', 'matches', 'level2', 'full']
-            channels):
+            channels,
+            # Decouple receiving from on_message with a bounded queue of
+            # raw frames handled by `workers` threads. None dispatches
+            # inline on the receiving thread.
+            queue_size=None,
+            workers=1,
+            # What to do when the queue is full: 'block' the receiving
+            # thread, 'drop_oldest' queued frame, or 'raise' queue.Full
+            # (reported through on_error)
+            overflow='block',
+            # JSON decoder: 'orjson', 'ujson', 'json', a callable, or None
+            # for the fastest one installed
+            decoder=None,
+            # Convert numeric string fields (price, size, ...) while
+            # decoding: a callable such as Decimal applied to all of them,
+            # or a dict of field name -> callable
+            parse_numbers=None,
+            # Reconnect and resubscribe when the connection drops, waiting
+            # a random delay of up to reconnect_delay * 2**attempt seconds
+            # (capped at reconnect_max_delay) between attempts
+            reconnect=False,
+            reconnect_delay=1.0,
+            reconnect_max_delay=60.0,
+            max_reconnects=None,
+            # Record latency histograms, message rates and sequence gaps;
+            # see stats()
+            stats=False,
+            # Seconds between keepalive pings
+            heartbeat_interval=30,
+            # Treat the connection as dead (reconnect, or on_error) when
+            # nothing, not even a pong, arrived for this many seconds.
+            # Should exceed heartbeat_interval.
+            stale_timeout=None,
+            # Also subscribe to the heartbeat channel, so a feed that keeps
+            # answering pings but stopped sending messages counts as stale.
+            # Heartbeat messages are kept in last_heartbeat, not passed to
+            # on_message.
+            heartbeat=False):
+        if overflow not in ('block', 'drop_oldest', 'raise'):
+            raise ValueError('overflow must be one of block, drop_oldest, '
+                             'raise, not {}'.format(overflow))
         self.url = url
         self.products = products
         self.channels = channels
@@ -47,20 +152,81 @@ class WebsocketClient(object):
         self.api_passphrase = api_passphrase
         self.should_print = should_print
         self.mongo_collection = mongo_collection
+        self.queue_size = queue_size
+        self.workers = workers
+        self.overflow = overflow
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+        self._frames = None
+        self._worker_threads = []
+        self._decode = _make_decoder(decoder, parse_numbers)
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.max_reconnects = max_reconnects
+        self.reconnect_count = 0
+        self.downtime = 0.0
+        self._closing = Event()
+        self.feed_stats = FeedStats(
+            check_sequences='full' in _channel_names(channels)) \
+            if stats else None
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_timeout = stale_timeout
+        self.heartbeat = heartbeat
+        self.last_heartbeat = {}  # product_id -> latest heartbeat message
+        self.last_message = None  # when the last data frame arrived
+        self.last_pong = None
 
     def start(self):
         def _go():
-            self._connect()
-            self._listen()
+            if self._connect_first():
+                self._listen()
             self._disconnect()
 
         self.stop = False
+        self._closing.clear()
         self.on_open()
+        if self.queue_size:
+            self._frames = Queue(self.queue_size)
+            self._worker_threads = [Thread(target=self._work)
+                                    for _ in range(self.workers)]
+            for worker in self._worker_threads:
+                worker.start()
         self.thread = Thread(target=_go)
         self.keepalive = Thread(target=self._keepalive)
         self.thread.start()
 
+    def _connect_first(self):
+        """ Connect and start the keepalive thread. A failed first connect
+        is retried like a dropped connection when `reconnect` is set, and
+        otherwise reported through `on_error`.
+
+        Returns:
+            bool: True once connected.
+        """
+        try:
+            self._connect()
+        except Exception as e:
+            if self.reconnect and self._reconnect():
+                return True
+            if not self.stop:
+                self.on_error(e)
+            return False
+        self.keepalive.start()
+        return True
+
     def _connect(self):
+        sub_params = self._subscribe_params()
+
+        # the timeout applies to every socket read, so a connection that
+        # goes silent fails within stale_timeout instead of blocking until
+        # TCP gives up
+        self.ws = create_connection(self.url, timeout=self.stale_timeout)
+        self.last_message = time.time()
+
+        self.ws.send(json.dumps(sub_params))
+
+    def _subscribe_params(self):
         if self.products is None:
             self.products = ["BTC-USD"]
         elif not isinstance(self.products, list):
@@ -75,6 +241,12 @@ class WebsocketClient(object):
         else:
             sub_params = {'type': 'subscribe', 'product_ids': self.products, 'channels': self.channels}
 
+        if self.heartbeat and 'heartbeat' not in [
+                c if isinstance(c, str) else c.get('name')
+                for c in sub_params['channels']]:
+            sub_params['channels'] = list(sub_params['channels']) + \
+                ['heartbeat']
+
         if self.auth:
             timestamp = str(time.time())
             message = timestamp + 'GET' + '/users/self/verify'
@@ -84,41 +256,198 @@ class WebsocketClient(object):
             sub_params['passphrase'] = auth_headers['CB-ACCESS-PASSPHRASE']
             sub_params['timestamp'] = auth_headers['CB-ACCESS-TIMESTAMP']
 
-        self.ws = create_connection(self.url)
-
-        self.ws.send(json.dumps(sub_params))
+        return sub_params
 
-    def _keepalive(self, interval=30):
-        while self.ws.connected:
-            self.ws.ping("keepalive")
-            time.sleep(interval)
+    def _keepalive(self, interval=None):
+        if interval is None:
+            interval = self.heartbeat_interval
+        ws = self.ws
+        # a reconnect replaces self.ws and starts a new keepalive thread
+        while ws.connected and ws is self.ws:
+            try:
+                ws.ping("keepalive")
+            except WebSocketException:
+                return
+            if self._closing.wait(interval):
+                return
 
     def _listen(self):
-        self.keepalive.start()
         while not self.stop:
             try:
-                data = self.ws.recv()
-                msg = json.loads(data)
+                data = self._recv()
+                received = self.last_message
+                if not data:
+                    # recv() returns an empty frame once the server closed
+                    raise WebSocketConnectionClosedException(
+                        'Connection closed by the server')
+                if self._frames is not None:
+                    self._enqueue((received, data))
+                    continue
+                msg = self._decode(data)
             except ValueError as e:
                 self.on_error(e)
+            except (WebSocketException, OSError) as e:
+                if self.stop:
+                    # closed by close()
+                    break
+                if not (self.reconnect and self._reconnect()):
+                    self.on_error(e)
             except Exception as e:
                 self.on_error(e)
             else:
-                self.on_message(msg)
+                self._dispatch(msg, received)
+
+    def _recv(self):
+        """ Next data frame, noting pongs on the way. Returns an empty
+        frame once the server closed the connection.
+        """
+        ws = self.ws
+        while True:
+            opcode, data = ws.recv_data(control_frame=True)
+            now = time.time()
+            if opcode == ABNF.OPCODE_TEXT:
+                self.last_message = now
+                return data.decode('utf-8')
+            elif opcode == ABNF.OPCODE_BINARY:
+                self.last_message = now
+                return data
+            elif opcode == ABNF.OPCODE_PONG:
+                self.last_pong = now
+                if self.heartbeat and self.stale_timeout is not None and \
+                        now - self.last_message > self.stale_timeout:
+                    raise WebSocketTimeoutException(
+                        'No messages for {:.1f}s'.format(
+                            now - self.last_message))
+            elif opcode == ABNF.OPCODE_CLOSE:
+                return ''
+
+    def _dispatch(self, msg, received):
+        if self.feed_stats is not None:
+            self.feed_stats.record(msg, received)
+        if self.heartbeat and msg.get('type') == 'heartbeat':
+            self.last_heartbeat[msg.get('product_id')] = msg
+            return
+        self.on_message(msg)
+
+    def _reconnect(self):
+        """ Reconnect and resubscribe with exponential backoff and jitter.
+
+        Returns:
+            bool: True once reconnected, False if the client was closed or
+                `max_reconnects` attempts failed.
+        """
+        down_since = time.time()
+        attempt = 0
+        while not self.stop:
+            if self.max_reconnects is not None and \
+                    attempt >= self.max_reconnects:
+                return False
+            delay = min(self.reconnect_max_delay,
+                        self.reconnect_delay * 2 ** attempt)
+            if self._closing.wait(random.uniform(0, delay)):
+                return False
+            attempt += 1
+            if self.ws is not None:
+                try:
+                    # the connection is gone; skip the closing handshake
+                    self.ws.shutdown()
+                except Exception:
+                    pass
+            try:
+                self._connect()  # signs a fresh auth timestamp
+            except Exception:
+                continue
+            self.reconnect_count += 1
+            self.downtime += time.time() - down_since
+            self.keepalive = Thread(target=self._keepalive)
+            self.keepalive.start()
+            self.on_reconnect()
+            return True
+        return False
+
+    def _enqueue(self, data):
+        frames = self._frames
+        if self.overflow == 'block':
+            frames.put(data)
+        elif self.overflow == 'raise':
+            frames.put_nowait(data)
+        else:
+            while True:
+                try:
+                    frames.put_nowait(data)
+                    break
+                except Full:
+                    try:
+                        frames.get_nowait()
+                        frames.task_done()
+                        self.frames_dropped += 1
+                    except Empty:
+                        pass
+        depth = frames.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def _work(self):
+        frames = self._frames
+        while True:
+            item = frames.get()
+            try:
+                if item is None:
+                    return
+                received, data = item
+                try:
+                    msg = self._decode(data)
+                except ValueError as e:
+                    self.on_error(e, data)
+                else:
+                    self._dispatch(msg, received)
+            finally:
+                frames.task_done()
+
+    def _stop_workers(self):
+        workers, self._worker_threads = self._worker_threads, []
+        for _ in workers:
+            self._frames.put(None)
+        for worker in workers:
+            worker.join()
+
+    def get_queue_depth(self):
+        """ Frames received but not yet handled by a worker. """
+        return self._frames.qsize() if self._frames is not None else 0
+
+    def stats(self):
+        """ Feed statistics (see `FeedStats.snapshot`), or None unless the
+        client was created with `stats=True`. `feed_stats.to_prometheus()`
+        renders them for a Prometheus scrape.
+        """
+        if self.feed_stats is None:
+            return None
+        stats = self.feed_stats.snapshot()
+        stats['queue_depth'] = self.get_queue_depth()
+        stats['frames_dropped'] = self.frames_dropped
+        stats['reconnects'] = self.reconnect_count
+        return stats
 
     def _disconnect(self):
         try:
             if self.ws:
-                self.ws.close()
+                # don't wait longer for the server's close frame than we
+                # would for any other frame
+                self.ws.close(timeout=self.stale_timeout
+                              if self.stale_timeout is not None else 3)
         except WebSocketConnectionClosedException as e:
             pass
         finally:
-            self.keepalive.join()
+            if self.keepalive.ident is not None:
+                # not started if the connection was never established
+                self.keepalive.join()
 
+        self._stop_workers()
         self.on_close()
 
     def close(self):
         self.stop = True   # will only disconnect after next msg recv
+        self._closing.set()
         self._disconnect() # force disconnect so threads can join
         self.thread.join()
 
@@ -130,10 +459,18 @@ class WebsocketClient(object):
         if self.should_print:
             print("\n-- Socket Closed --")
 
+    def on_reconnect(self):
+        """ Called after the connection was re-established and the
+        subscription replayed. Messages sent while disconnected are lost,
+        so order books should resynchronize here.
+        """
+        if self.should_print:
+            print("-- Reconnected --")
+
     def on_message(self, msg):
         if self.should_print:
             print(msg)
-        if self.mongo_collection:  # dump JSON to given mongo collection
+        if self.mongo_collection is not None:  # dump JSON to given mongo collection
             self.mongo_collection.insert_one(msg)
 
     def on_error(self, e, data=None):
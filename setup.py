@@ -7,7 +7,6 @@ install_requires = [
     'requests>=2.25.0',
     'six>=1.10.0',
     'websocket-client>=0.40.0',
-    'pymongo>=3.5.1',
 ]
 
 tests_require = [
@@ -30,6 +29,8 @@ setup(
     tests_require=tests_require,
     extras_require={
         'test': tests_require,
+        'async': ['websockets>=8.0', 'aiohttp>=3.7'],
+        'mongo': ['pymongo>=3.5.1'],
     },
     description='The unofficial Python client for the Coinbase Pro API',
     long_description=long_description,
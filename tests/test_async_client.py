@@ -0,0 +1,186 @@
+import pytest
+import asyncio
+import json
+import time
+from cbpro.cbpro_auth import get_auth_headers
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from cbpro.async_client import AsyncPublicClient, AsyncAuthenticatedClient
+
+SECRET = 'c2VjcmV0'
+
+
+def verify_signature(request, body):
+    headers = get_auth_headers(request.headers['CB-ACCESS-TIMESTAMP'],
+                               request.headers['CB-ACCESS-TIMESTAMP'] +
+                               request.method + request.path_qs + body,
+                               'key', SECRET, 'pass')
+    return headers['CB-ACCESS-SIGN'] == request.headers['CB-ACCESS-SIGN']
+
+
+async def ticker(request):
+    await asyncio.sleep(0.1)
+    return web.json_response({'product_id': request.match_info['product_id']})
+
+
+async def trades(request):
+    page = int(request.query.get('after', 0))
+    headers = {'cb-after': str(page + 1)} if page < 2 else {}
+    return web.json_response([{'trade_id': page * 2 + i} for i in range(2)],
+                             headers=headers)
+
+
+async def orders(request):
+    body = await request.text()
+    return web.json_response({'signed': verify_signature(request, body),
+                              'order': json.loads(body)})
+
+
+async def fills(request):
+    return web.json_response([{'signed': verify_signature(request, ''),
+                               'query': dict(request.query)}])
+
+
+def run(test, handlers=None):
+    """Run `test(url)` against a local API server; `handlers` replaces GET
+    handlers by route."""
+    routes = {'/products/{product_id}/ticker': ticker,
+              '/products/{product_id}/trades': trades,
+              '/fills': fills}
+    routes.update(handlers or {})
+
+    async def main():
+        app = web.Application()
+        for path, handler in routes.items():
+            app.router.add_get(path, handler)
+        app.router.add_post('/orders', orders)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, 'localhost', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await test('http://localhost:{}'.format(port))
+        finally:
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests():
+    products = ['P{}-USD'.format(i) for i in range(50)]
+
+    async def test(url):
+        async with AsyncPublicClient(api_url=url) as client:
+            start = time.time()
+            tickers = await asyncio.gather(
+                *[client.get_product_ticker(p) for p in products])
+            return tickers, time.time() - start
+
+    tickers, elapsed = run(test)
+    assert [t['product_id'] for t in tickers] == products
+    # 50 requests of 0.1s each, in parallel
+    assert elapsed < 2
+
+
+def test_pagination():
+    async def test(url):
+        async with AsyncPublicClient(api_url=url) as client:
+            return [t['trade_id']
+                    async for t in client.get_product_trades('BTC-USD')]
+
+    assert run(test) == list(range(6))
+
+
+def test_authenticated_requests_are_signed():
+    async def test(url):
+        async with AsyncAuthenticatedClient('key', SECRET, 'pass',
+                                            api_url=url) as client:
+            order = await client.place_limit_order('BTC-USD', 'buy',
+                                                   '100.00', '0.01')
+            fills = [f async for f in client.get_fills(product_id='BTC-USD')]
+            return order, fills
+
+    order, fills = run(test)
+    assert order['signed']
+    assert order['order']['price'] == '100.00'
+    assert fills[0]['signed']
+    assert fills[0]['query'] == {'product_id': 'BTC-USD'}
+
+
+def test_shared_session_stays_open():
+    async def test(url):
+        async with aiohttp.ClientSession() as session:
+            clients = [AsyncPublicClient(api_url=url, session=session)
+                       for _ in range(2)]
+            for client in clients:
+                await client.get_product_ticker('BTC-USD')
+                await client.close()
+            return session.closed
+
+    assert run(test) is False
+
+
+def test_rate_limiter_signs_after_waiting():
+    from cbpro.rate_limiter import RateLimiter, TokenBucket
+    limiter = RateLimiter(private=TokenBucket(rate=10, burst=1))
+
+    async def test(url):
+        async with AsyncAuthenticatedClient('key', SECRET, 'pass',
+                                            api_url=url,
+                                            rate_limiter=limiter) as client:
+            start = time.time()
+            pages = await asyncio.gather(
+                *[_collect(client.get_fills(product_id='BTC-USD'))
+                  for _ in range(4)])
+            return pages, time.time() - start
+
+    pages, elapsed = run(test)
+    assert all(page[0]['signed'] for page in pages)
+    assert elapsed > 0.25
+    assert limiter.get_metrics()['private']['waited'] == 3
+
+
+async def _collect(generator):
+    return [item async for item in generator]
+
+
+def test_retry_resumes_pagination():
+    from cbpro.retry import RetryPolicy
+    failures = []
+
+    async def flaky_trades(request):
+        if request.query.get('after') == '1' and not failures:
+            failures.append(request.path_qs)
+            return web.json_response({'message': 'down'}, status=503,
+                                     headers={'Retry-After': '0'})
+        return await trades(request)
+
+    async def test(url):
+        async with AsyncPublicClient(
+                api_url=url, retry=RetryPolicy(backoff=0.01)) as client:
+            return await _collect(client.get_product_trades('BTC-USD'))
+
+    results = run(test, {'/products/{product_id}/trades': flaky_trades})
+    assert [t['trade_id'] for t in results] == list(range(6))
+    assert failures == ['/products/BTC-USD/trades?after=1']
+
+
+def test_historic_rates_range():
+    from datetime import datetime
+
+    async def candles(request):
+        start, end = (datetime.fromisoformat(request.query[k]).timestamp()
+                      for k in ('start', 'end'))
+        times = range(int(end), int(start) - 1, -300)
+        return web.json_response([[t, 1, 3, 2, 2.5, 10] for t in times])
+
+    async def test(url):
+        async with AsyncPublicClient(api_url=url) as client:
+            return await client.get_historic_rates_range(
+                'BTC-USD', 1577836800, 1577836800 + 300 * 450, 300)
+
+    rates = run(test, {'/products/{product_id}/candles': candles})
+    assert list(rates['time']) == list(range(1577836800,
+                                             1577836800 + 300 * 451, 300))
+    assert list(rates['close']) == [2.5] * 451
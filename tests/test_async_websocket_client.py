@@ -0,0 +1,85 @@
+import pytest
+import asyncio
+import json
+from cbpro.async_websocket_client import AsyncWebsocketClient
+
+websockets = pytest.importorskip('websockets')
+
+
+class RecordingClient(AsyncWebsocketClient):
+    async def on_open(self):
+        self.messages = []
+        self.closed = False
+
+    async def on_message(self, msg):
+        self.messages.append(msg)
+
+    async def on_close(self):
+        self.closed = True
+
+
+def test_subscribe_receive_and_close():
+    subscriptions = []
+
+    async def feed(ws):
+        subscriptions.append(json.loads(await ws.recv()))
+        for sequence in range(3):
+            await ws.send(json.dumps({'type': 'ticker', 'sequence': sequence,
+                                      'product_id': 'BTC-USD'}))
+        await ws.wait_closed()
+
+    async def main():
+        async with websockets.serve(feed, 'localhost', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            clients = [RecordingClient(url='ws://localhost:{}/'.format(port),
+                                       products=product_id,
+                                       channels=['ticker'],
+                                       auth=True, api_key='key',
+                                       api_secret='c2VjcmV0',
+                                       api_passphrase='pass')
+                       for product_id in ('BTC-USD', 'ETH-USD')]
+            for client in clients:
+                await client.start()
+            while sum(len(c.messages) for c in clients) < 6:
+                await asyncio.sleep(0.01)
+            for client in clients:
+                await client.close()
+            return clients
+
+    clients = asyncio.run(main())
+    assert [m['sequence'] for m in clients[0].messages] == [0, 1, 2]
+    assert all(c.closed and c.error is None for c in clients)
+    assert sorted(s['product_ids'][0] for s in subscriptions) == \
+        ['BTC-USD', 'ETH-USD']
+    assert subscriptions[0]['channels'] == ['ticker']
+    assert subscriptions[0]['key'] == 'key'
+    assert 'signature' in subscriptions[0]
+
+
+def test_heartbeats_and_stalled_feed():
+    subscriptions = []
+
+    async def feed(ws):
+        subscriptions.append(json.loads(await ws.recv()))
+        await ws.send(json.dumps({'type': 'heartbeat', 'sequence': 5,
+                                  'product_id': 'BTC-USD'}))
+        await ws.send(json.dumps({'type': 'ticker', 'sequence': 6,
+                                  'product_id': 'BTC-USD'}))
+        await ws.wait_closed()
+
+    async def main():
+        async with websockets.serve(feed, 'localhost', 0,
+                                    close_timeout=0.1) as server:
+            port = server.sockets[0].getsockname()[1]
+            client = RecordingClient(url='ws://localhost:{}'.format(port),
+                                     channels=['ticker'], heartbeat=True,
+                                     stale_timeout=0.2, should_print=False)
+            await client.start()
+            await asyncio.wait_for(client.task, 5)
+            return client
+
+    client = asyncio.run(main())
+    assert [m['type'] for m in client.messages] == ['ticker']
+    assert client.last_heartbeat['BTC-USD']['sequence'] == 5
+    assert isinstance(client.error, asyncio.TimeoutError)
+    assert subscriptions[0]['channels'] == ['ticker', 'heartbeat']
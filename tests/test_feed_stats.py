@@ -0,0 +1,112 @@
+import pytest
+import calendar
+import random
+from cbpro.feed_stats import LatencyHistogram, FeedStats, parse_feed_time
+
+
+def test_histogram_percentiles_within_precision():
+    rng = random.Random(1)
+    samples = [rng.expovariate(1 / 0.02) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for sample in samples:
+        histogram.record(sample)
+    samples.sort()
+    for p in (50, 90, 99, 99.9):
+        exact = samples[int(p / 100.0 * len(samples)) - 1]
+        assert histogram.percentile(p) == pytest.approx(exact, rel=0.02)
+    summary = histogram.summary()
+    assert summary['count'] == 20000
+    assert summary['max'] == pytest.approx(samples[-1], abs=1e-6)
+    assert len(histogram._counts) < 1000
+
+
+def test_histogram_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for us in (0, 1, 5, 100):
+        histogram.record(us / 1000000.0)
+    histogram.record(-1)
+    assert histogram.percentile(50) == 1e-6
+    assert histogram.percentile(100) == 100e-6
+    assert histogram.min == 0
+
+
+def test_parse_feed_time():
+    expected = calendar.timegm((2014, 11, 7, 8, 19, 27)) + 0.028459
+    assert parse_feed_time('2014-11-07T08:19:27.028459Z') == \
+        pytest.approx(expected)
+    assert parse_feed_time('2014-11-07T08:19:27Z') == expected - 0.028459
+    assert parse_feed_time('1970-01-01T00:00:01.5Z') == 1.5
+    assert parse_feed_time('2018-01-01T00:00:00Z') == 1514764800
+
+
+def full(sequence, product_id='BTC-USD', **kwargs):
+    kwargs.update(type='open', sequence=sequence, product_id=product_id)
+    return kwargs
+
+
+def test_feed_stats():
+    stats = FeedStats()
+    feed_time = parse_feed_time('2020-01-01T00:00:00.000000Z')
+    for sequence in (1, 2, 5, 6, 10, 3):
+        stats.record(full(sequence, time='2020-01-01T00:00:00.000000Z'),
+                     received=feed_time + 0.25,
+                     dispatched=feed_time + 0.251)
+    stats.record(full(7, product_id='ETH-USD'), received=0, dispatched=0)
+    # ticker sequence numbers skip the full channel's; not a gap
+    stats.record({'type': 'ticker', 'sequence': 100, 'product_id': 'BTC-USD',
+                  'time': '2020-01-01T00:00:01.000000Z'},
+                 received=feed_time, dispatched=feed_time)
+    snapshot = stats.snapshot()
+    assert snapshot['messages'] == 8
+    assert snapshot['message_counts'] == {'open': 7, 'ticker': 1}
+    assert snapshot['sequence_gaps'] == {'BTC-USD': 2}
+    assert snapshot['messages_missed'] == {'BTC-USD': 5}
+    assert snapshot['clock_skew'] == 1
+    assert snapshot['exchange_latency']['count'] == 7
+    assert snapshot['exchange_latency']['p50'] == pytest.approx(0.25,
+                                                                rel=0.01)
+    assert snapshot['dispatch_latency']['max'] == pytest.approx(0.001,
+                                                                rel=0.01)
+    stats.reset()
+    assert stats.snapshot()['messages'] == 0
+
+
+def test_prometheus_text():
+    stats = FeedStats()
+    stats.record(full(1), received=1.0, dispatched=1.5)
+    stats.record(full(3), received=1.0, dispatched=1.5)
+    text = stats.to_prometheus(labels={'feed': 'a"b'})
+    lines = text.splitlines()
+    assert '# TYPE cbpro_feed_dispatch_latency_seconds summary' in lines
+    assert 'cbpro_feed_dispatch_latency_seconds{feed="a\\"b",' \
+           'quantile="0.5"} 0.5' in lines
+    assert 'cbpro_feed_dispatch_latency_seconds_count{feed="a\\"b"} 2.0' \
+        in lines
+    assert 'cbpro_feed_messages_total{feed="a\\"b",type="open"} 2.0' in lines
+    assert 'cbpro_feed_sequence_gaps_total{feed="a\\"b",' \
+           'product_id="BTC-USD"} 1.0' in lines
+    assert text.endswith('\n')
+
+
+def test_matches_channel_sequences_are_not_gaps():
+    # the matches channel carries the full channel's sequence numbers
+    stats = FeedStats(check_sequences=False)
+    for sequence in (100, 117, 140):
+        stats.record({'type': 'match', 'sequence': sequence,
+                      'product_id': 'BTC-USD'}, received=1.0, dispatched=1.0)
+    snapshot = stats.snapshot()
+    assert snapshot['message_counts'] == {'match': 3}
+    assert snapshot['sequence_gaps'] == {}
+    assert snapshot['messages_missed'] == {}
+
+
+def test_client_checks_sequences_only_on_full():
+    from cbpro.websocket_client import WebsocketClient
+    matches = WebsocketClient(products=['BTC-USD'], channels=['matches'],
+                              stats=True)
+    full = WebsocketClient(products=['BTC-USD'],
+                           channels=[{'name': 'full',
+                                      'product_ids': ['BTC-USD']}],
+                           stats=True)
+    assert not matches.feed_stats.check_sequences
+    assert full.feed_stats.check_sequences
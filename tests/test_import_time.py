@@ -0,0 +1,41 @@
+import pytest
+import subprocess
+import sys
+
+
+def run(code):
+    return subprocess.check_output([sys.executable, '-c', code],
+                                   universal_newlines=True)
+
+
+def test_optional_dependencies_not_imported():
+    loaded = run('import sys, cbpro; '
+                 'print(" ".join(m for m in ("pymongo", "sortedcontainers", '
+                 '"websocket", "websockets", "aiohttp", "cbpro.order_book", '
+                 '"cbpro.websocket_client") if m in sys.modules))')
+    assert loaded.split() == []
+
+
+def test_lazy_attributes():
+    out = run('import sys, cbpro; '
+              'print(cbpro.OrderBook.__module__, '
+              '"sortedcontainers" in sys.modules, '
+              '"pymongo" in sys.modules)')
+    assert out.split() == ['cbpro.order_book', 'True', 'False']
+
+
+def test_unknown_attribute():
+    import cbpro
+    with pytest.raises(AttributeError):
+        cbpro.NoSuchClient
+
+
+def test_import_time():
+    # generous bound: requests alone takes a few tens of milliseconds, the
+    # eager pymongo import this guards against added a few hundred
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import cbpro'],
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    cumulative = [int(line.split('|')[1]) for line in output.splitlines()
+                  if line.rstrip().endswith('| cbpro')]
+    assert cumulative and cumulative[0] < 500000  # microseconds
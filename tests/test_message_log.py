@@ -0,0 +1,92 @@
+import pytest
+import pickle
+from decimal import Decimal
+from cbpro.message_log import MessageLogWriter, read_message_log
+from cbpro.order_book import OrderBook
+
+
+def messages(n):
+    return [{'type': 'open', 'sequence': i, 'product_id': 'BTC-USD',
+             'price': '100.00'} for i in range(n)]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmpdir, compress):
+    path = str(tmpdir.join('feed.log'))
+    log = MessageLogWriter(path, batch_size=10, compress=compress)
+    for message in messages(25):
+        log.log(message)
+    log.close()
+    assert list(read_message_log(path)) == messages(25)
+    assert log.messages_written == 25
+
+
+def test_rotation_by_size(tmpdir):
+    path = str(tmpdir.join('feed.log'))
+    log = MessageLogWriter(path, max_bytes=200)
+    for message in messages(30):
+        log.log(message)
+        log.flush()
+    log.close()
+    assert len(log.paths) > 1
+    assert log.paths[1] == path + '.1'
+    assert list(read_message_log(path)) == messages(30)
+
+
+def test_new_log_removes_old_segments(tmpdir):
+    path = str(tmpdir.join('feed.log'))
+    log = MessageLogWriter(path, max_bytes=200)
+    for message in messages(30):
+        log.log(message)
+        log.flush()
+    log.close()
+    assert tmpdir.join('feed.log.2').check()
+    log = MessageLogWriter(path, max_bytes=200)
+    log.log({'type': 'new'})
+    log.close()
+    assert list(read_message_log(path)) == [{'type': 'new'}]
+    assert not tmpdir.join('feed.log.1').check()
+
+
+def test_truncated_frame_is_ignored(tmpdir):
+    path = str(tmpdir.join('feed.log'))
+    log = MessageLogWriter(path)
+    for message in messages(3):
+        log.log(message)
+    log.close()
+    with open(path, 'rb+') as f:
+        f.truncate(f.seek(0, 2) - 5)
+    assert list(read_message_log(path)) == messages(2)
+
+
+def test_decimal_values_are_logged_as_strings(tmpdir):
+    path = str(tmpdir.join('feed.log'))
+    log = MessageLogWriter(path)
+    log.log({'price': Decimal('100.01')})
+    log.close()
+    assert list(read_message_log(path)) == [{'price': '100.01'}]
+
+
+def test_order_book_log_to(tmpdir):
+    path = str(tmpdir.join('feed.log'))
+    log = MessageLogWriter(path)
+    book = OrderBook(product_id='BTC-USD', log_to=log)
+    book._sequence = 10
+    book.process_message({'type': 'open', 'sequence': 11,
+                          'product_id': 'BTC-USD', 'order_id': 'b1',
+                          'side': 'buy', 'price': '100.00',
+                          'remaining_size': '1'})
+    book.process_message({'type': 'open', 'sequence': 1,
+                          'product_id': 'ETH-USD'})
+    log.close()
+    assert [m['sequence'] for m in read_message_log(path)] == [11]
+
+
+def test_order_book_pickle_log_to(tmpdir):
+    with open(str(tmpdir.join('feed.pickle')), 'wb') as f:
+        book = OrderBook(product_id='BTC-USD', log_to=f)
+        book._sequence = 10
+        book.process_message({'type': 'received', 'sequence': 11,
+                              'product_id': 'BTC-USD'})
+    with open(str(tmpdir.join('feed.pickle')), 'rb') as f:
+        assert pickle.load(f)['sequence'] == 11
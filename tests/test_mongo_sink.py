@@ -0,0 +1,114 @@
+import pytest
+import threading
+import time
+from cbpro.mongo_sink import MongoSink
+from cbpro.websocket_client import WebsocketClient
+
+
+class Collection(object):
+    """ Records insert_many batches, optionally holding them up. """
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert_many(self, documents, ordered=True):
+        assert not ordered
+        self.release.wait()
+        self.batches.append(list(documents))
+
+
+def messages(n):
+    return [{'type': 'match', 'sequence': i} for i in range(n)]
+
+
+def test_writes_in_batches():
+    collection = Collection()
+    sink = MongoSink(collection, batch_size=10, flush_interval=60)
+    for message in messages(25):
+        sink.insert_one(message)
+    sink.close()
+    assert [len(b) for b in collection.batches] == [10, 10, 5]
+    assert sum(collection.batches, []) == messages(25)
+    assert sink.inserted == 25
+    assert sink.get_pending() == 0
+
+
+def test_flush_interval():
+    collection = Collection()
+    sink = MongoSink(collection, batch_size=1000, flush_interval=0.05)
+    sink.insert_one({'sequence': 1})
+    deadline = time.time() + 5
+    while not collection.batches and time.time() < deadline:
+        time.sleep(0.01)
+    assert collection.batches == [[{'sequence': 1}]]
+    sink.close()
+
+
+def test_drop_when_full():
+    collection = Collection()
+    collection.release.clear()
+    sink = MongoSink(collection, batch_size=2, flush_interval=60,
+                     max_pending=3, overflow='drop')
+    sink.insert_one({'sequence': 0})
+    sink.insert_one({'sequence': 1})
+    # wait for the writer to take the first batch and stall on it
+    deadline = time.time() + 5
+    while sink.get_pending() and time.time() < deadline:
+        time.sleep(0.01)
+    for message in messages(5):
+        sink.insert_one(message)
+    assert sink.dropped == 2
+    collection.release.set()
+    sink.close()
+    assert sink.inserted == 5
+
+
+def test_block_when_full():
+    collection = Collection()
+    collection.release.clear()
+    sink = MongoSink(collection, batch_size=2, flush_interval=60,
+                     max_pending=2, overflow='block')
+    producer = threading.Thread(
+        target=lambda: [sink.insert_one(m) for m in messages(6)])
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()
+    collection.release.set()
+    producer.join(5)
+    sink.close()
+    assert sink.inserted == 6
+    assert sink.dropped == 0
+    assert sink.blocked > 0
+
+
+def test_failed_batch_is_counted():
+    class Failing(object):
+        def insert_many(self, documents, ordered=True):
+            error = Exception('duplicate key')
+            error.details = {'nInserted': len(documents) - 1}
+            raise error
+
+    sink = MongoSink(Failing(), batch_size=4, flush_interval=60)
+    for message in messages(4):
+        sink.insert_one(message)
+    sink.close()
+    assert sink.inserted == 3
+    assert sink.failed == 1
+    assert str(sink.last_error) == 'duplicate key'
+
+
+def test_invalid_overflow():
+    with pytest.raises(ValueError):
+        MongoSink(Collection(), overflow='spill')
+
+
+def test_websocket_client_uses_sink():
+    collection = Collection()
+    sink = MongoSink(collection, flush_interval=60)
+    client = WebsocketClient(channels=['matches'], mongo_collection=sink,
+                             should_print=False)
+    for message in messages(3):
+        client.on_message(message)
+    sink.close()
+    assert collection.batches == [messages(3)]
@@ -0,0 +1,397 @@
+import pytest
+import threading
+import uuid
+from decimal import Decimal
+from cbpro.order_book import OrderBook, L2OrderBook, OrderBookManager, \
+    OrderRecord
+
+
+@pytest.fixture(params=[False, True], ids=['dict', 'compact'])
+def book(request):
+    """Order book seeded with a small resting book (no REST call)."""
+    book = OrderBook(product_id='BTC-USD', compact=request.param)
+    for order_id, side, price, size in [('b1', 'buy', '100.00', '1.0'),
+                                        ('b2', 'buy', '100.00', '2.0'),
+                                        ('b3', 'buy', '99.00', '3.0'),
+                                        ('a1', 'sell', '101.00', '1.5'),
+                                        ('a2', 'sell', '102.00', '0.5')]:
+        book.add({'id': order_id, 'side': side, 'price': price,
+                  'size': size})
+    book._sequence = 10
+    return book
+
+
+def msg(sequence, **kwargs):
+    kwargs.update(sequence=sequence, product_id='BTC-USD')
+    return kwargs
+
+
+@pytest.mark.usefixtures('book')
+class TestOrderBook(object):
+    def test_open(self, book):
+        book.process_message(msg(11, type='open', order_id='b4', side='buy',
+                                 price='100.00', remaining_size='0.25'))
+        assert [o['id'] for o in book.get_bids(Decimal('100.00'))] == \
+            ['b1', 'b2', 'b4']
+        assert book._sequence == 11
+
+    def test_done_removes_order_and_empty_level(self, book):
+        book.process_message(msg(11, type='done', order_id='b3', side='buy',
+                                 price='99.00', reason='canceled'))
+        assert book.get_bids(Decimal('99.00')) is None
+        assert 'b3' not in book._orders
+
+    def test_done_for_unknown_order_is_ignored(self, book):
+        book.process_message(msg(11, type='done', order_id='x', side='buy',
+                                 price='100.00', reason='filled'))
+        assert len(book.get_bids(Decimal('100.00'))) == 2
+
+    def test_partial_match(self, book):
+        book.process_message(msg(11, type='match', maker_order_id='a1',
+                                 side='sell', price='101.00', size='0.5'))
+        assert book.get_asks(Decimal('101.00'))[0]['size'] == Decimal('1.0')
+
+    def test_full_match_removes_maker(self, book):
+        book.process_message(msg(11, type='match', maker_order_id='b1',
+                                 side='buy', price='100.00', size='1.0'))
+        assert [o['id'] for o in book.get_bids(Decimal('100.00'))] == ['b2']
+        assert 'b1' not in book._orders
+
+    def test_change(self, book):
+        book.process_message(msg(11, type='change', order_id='b2',
+                                 side='buy', price='100.00', old_size='2.0',
+                                 new_size='1.25'))
+        assert book.get_bids(Decimal('100.00'))[1]['size'] == Decimal('1.25')
+
+    def test_old_messages_are_ignored(self, book):
+        book.process_message(msg(10, type='done', order_id='b1', side='buy',
+                                 price='100.00', reason='canceled'))
+        assert 'b1' in book._orders
+
+    def test_get_current_book(self, book):
+        r = book.get_current_book()
+        assert r['sequence'] == 10
+        assert r['bids'][0] == [Decimal('99.00'), Decimal('3.0'), 'b3']
+        assert r['asks'][-1] == [Decimal('102.00'), Decimal('0.5'), 'a2']
+        assert book.get_bid() == Decimal('100.00')
+        assert book.get_ask() == Decimal('101.00')
+
+    def test_top_of_book_aggregates(self, book):
+        assert book.best_bid_size() == Decimal('3.0')
+        assert book.best_ask_size() == Decimal('1.5')
+        assert book.spread() == Decimal('1.00')
+        assert book.mid() == Decimal('100.50')
+        assert book.get_depth('buy') == [[Decimal('100.00'), Decimal('3.0'), 2],
+                                         [Decimal('99.00'), Decimal('3.0'), 1]]
+        book.add({'id': 'b5', 'side': 'buy', 'price': '98.00', 'size': '1'})
+        assert book.get_depth('buy', 2) == [
+            [Decimal('100.00'), Decimal('3.0'), 2],
+            [Decimal('99.00'), Decimal('3.0'), 1]]
+        assert book.get_depth('buy', 0) == []
+        assert book.get_depth('sell', 1) == [[Decimal('101.00'),
+                                              Decimal('1.5'), 1]]
+
+    def test_aggregates_follow_mutations(self, book):
+        for m in [msg(11, type='open', order_id='b4', side='buy',
+                      price='100.00', remaining_size='0.5'),
+                  msg(12, type='match', maker_order_id='b1', side='buy',
+                      price='100.00', size='0.25'),
+                  msg(13, type='change', order_id='b2', side='buy',
+                      price='100.00', new_size='1.0'),
+                  msg(14, type='done', order_id='b4', side='buy',
+                      price='100.00', reason='canceled'),
+                  msg(15, type='match', maker_order_id='a1', side='sell',
+                      price='101.00', size='1.5')]:
+            book.process_message(m)
+        assert book.best_bid_size() == Decimal('1.75')
+        assert book.get_ask() == Decimal('102.00')
+        assert book.best_ask_size() == Decimal('0.5')
+        assert Decimal('101.00') not in book._ask_sizes
+
+
+def test_compact_levels_share_price_objects():
+    book = OrderBook(compact=True)
+    book.add({'id': 'b1', 'side': 'buy', 'price': '100.00', 'size': '1'})
+    book.add({'id': 'b2', 'side': 'buy', 'price': '100.00', 'size': '2'})
+    b1, b2 = book.get_bids(Decimal('100.00'))
+    assert b1.price is b2.price
+    assert b2['size'] == Decimal('2')
+    with pytest.raises(KeyError):
+        b1['remaining_size']
+
+
+@pytest.fixture
+def fixed_book():
+    product = {'id': 'BTC-USD', 'quote_increment': '0.01',
+               'base_increment': '0.00000001'}
+    book = OrderBook(product_id='BTC-USD', fixed_point=product)
+    book.add({'id': 'b1', 'side': 'buy', 'price': '100.00',
+              'size': '1.50000000'})
+    book.add({'id': 'a1', 'side': 'sell', 'price': '100.25', 'size': '2'})
+    book._sequence = 10
+    return book
+
+
+@pytest.mark.usefixtures('fixed_book')
+class TestFixedPointOrderBook(object):
+    def test_keys_are_ticks(self, fixed_book):
+        assert list(fixed_book._bids) == [10000]
+        assert fixed_book.get_asks(10025)[0]['size'] == 200000000
+
+    def test_boundary_returns_decimal(self, fixed_book):
+        assert fixed_book.get_bid() == Decimal('100.00')
+        assert fixed_book.get_ask() == Decimal('100.25')
+        r = fixed_book.get_current_book()
+        assert r['bids'] == [[Decimal('100.00'), Decimal('1.5'), 'b1']]
+        assert str(r['asks'][0][0]) == '100.25'
+        assert fixed_book.best_bid_size() == Decimal('1.5')
+        assert fixed_book.spread() == Decimal('0.25')
+        assert fixed_book.get_depth('sell') == [[Decimal('100.25'),
+                                                 Decimal('2'), 1]]
+
+    def test_match_and_change(self, fixed_book):
+        fixed_book.process_message(msg(11, type='match', maker_order_id='b1',
+                                       side='buy', price='100.00',
+                                       size='0.50000000'))
+        fixed_book.process_message(msg(12, type='change', order_id='a1',
+                                       side='sell', price='100.25',
+                                       new_size='1.25'))
+        assert fixed_book.get_bids(10000)[0]['size'] == 100000000
+        assert fixed_book.get_asks(10025)[0]['size'] == 125000000
+
+    def test_rejects_sub_increment_values(self, fixed_book):
+        with pytest.raises(ValueError):
+            fixed_book.add({'id': 'b2', 'side': 'buy', 'price': '100.001',
+                            'size': '1'})
+
+
+class SlowSnapshotClient(object):
+    """Stands in for PublicClient; the snapshot is held until released."""
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.release = threading.Event()
+
+    def get_product_order_book(self, product_id, level):
+        assert level == 3
+        self.release.wait(5)
+        return self.snapshot
+
+
+def test_buffered_resync_replays_messages_newer_than_snapshot():
+    book = OrderBook(product_id='BTC-USD', buffered_resync=True)
+    book._client = SlowSnapshotClient({
+        'sequence': 11,
+        'bids': [['100.00', '1.0', 'b1']],
+        'asks': [['101.00', '1.0', 'a1']]})
+
+    book.process_message(msg(10, type='open', order_id='b0', side='buy',
+                             price='99.00', remaining_size='1.0'))
+    book.process_message(msg(11, type='open', order_id='b1', side='buy',
+                             price='100.00', remaining_size='1.0'))
+    book.process_message(msg(12, type='open', order_id='b2', side='buy',
+                             price='100.00', remaining_size='2.0'))
+    assert book._sequence == -1
+    assert len(book._resync_buffer) == 3
+
+    book._client.release.set()
+    book._resync_thread.join()
+    book.process_message(msg(13, type='done', order_id='a1', side='sell',
+                             price='101.00', reason='canceled'))
+
+    assert book._sequence == 13
+    assert book._resync_thread is None
+    assert [o['id'] for o in book.get_bids(Decimal('100.00'))] == ['b1', 'b2']
+    assert book.get_bids(Decimal('99.00')) is None
+    assert not book._asks
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_buffered_resync_builds_book_off_the_websocket_thread(compact):
+    class RecordingBook(OrderBook):
+        def _build_book(self, res):
+            self.built_on = threading.current_thread()
+            return super(RecordingBook, self)._build_book(res)
+
+    book = RecordingBook(product_id='BTC-USD', buffered_resync=True,
+                         compact=compact)
+    book._client = SlowSnapshotClient({
+        'sequence': 5,
+        'bids': [['100.00', '1.0', 'b1'], ['100.00', '2.0', 'b2'],
+                 ['99.00', '3.0', 'b3']],
+        'asks': [['101.00', '1.5', 'a1']]})
+    book.process_message(msg(5, type='received', order_id='x'))
+    book._client.release.set()
+    book._resync_thread.join()
+    assert book.built_on is not threading.current_thread()
+    # built, but only swapped in by the next message
+    assert book._sequence == -1
+    book.process_message(msg(6, type='open', order_id='a2', side='sell',
+                             price='101.00', remaining_size='0.5'))
+    assert book._sequence == 6
+    assert book.get_depth('buy') == [[Decimal('100.00'), Decimal('3.0'), 2],
+                                     [Decimal('99.00'), Decimal('3.0'), 1]]
+    b1, b2 = book.get_bids(Decimal('100.00'))
+    assert b1['price'] is b2['price']
+    assert book.best_ask_size() == Decimal('2.0')
+    assert set(book._orders) == {'b1', 'b2', 'b3', 'a1', 'a2'}
+
+
+@pytest.fixture
+def l2_book():
+    book = L2OrderBook(product_id='BTC-USD')
+    book.process_message({'type': 'snapshot', 'product_id': 'BTC-USD',
+                          'bids': [['99.00', '3'], ['100.00', '1']],
+                          'asks': [['102.00', '4'], ['101.00', '2']]})
+    return book
+
+
+@pytest.mark.usefixtures('l2_book')
+class TestL2OrderBook(object):
+    def test_snapshot(self, l2_book):
+        assert l2_book.get_bid() == Decimal('100.00')
+        assert l2_book.get_ask() == Decimal('101.00')
+        assert l2_book.best_bid_size() == Decimal('1')
+        assert l2_book.best_ask_size() == Decimal('2')
+
+    def test_l2update(self, l2_book):
+        l2_book.process_message({'type': 'l2update', 'product_id': 'BTC-USD',
+                                 'changes': [['buy', '100.50', '0.5'],
+                                             ['buy', '100.00', '0'],
+                                             ['sell', '101.00', '1.5'],
+                                             ['sell', '103.00', '0']]})
+        assert l2_book.get_depth('buy') == [[Decimal('100.50'), Decimal('0.5')],
+                                            [Decimal('99.00'), Decimal('3')]]
+        assert l2_book.get_depth('sell', 1) == [[Decimal('101.00'),
+                                                 Decimal('1.5')]]
+
+    def test_other_products_are_ignored(self, l2_book):
+        l2_book.process_message({'type': 'l2update', 'product_id': 'ETH-USD',
+                                 'changes': [['buy', '100.00', '0']]})
+        assert l2_book.get_bid() == Decimal('100.00')
+
+    def test_cumulative_depth(self, l2_book):
+        assert l2_book.get_cumulative_depth('sell') == \
+            [[Decimal('101.00'), Decimal('2')], [Decimal('102.00'), Decimal('6')]]
+        assert l2_book.get_size_to_price('buy', '99.00') == Decimal('4')
+        assert l2_book.get_size_to_price('sell', '101.50') == Decimal('2')
+
+
+def test_order_book_manager_routes_by_product():
+    manager = OrderBookManager(['BTC-USD', 'ETH-USD'], book_class=L2OrderBook)
+    manager.process_message({'type': 'snapshot', 'product_id': 'ETH-USD',
+                             'bids': [['10.00', '1']], 'asks': []})
+    manager.process_message({'type': 'snapshot', 'product_id': 'LTC-USD',
+                             'bids': [['1.00', '1']], 'asks': []})
+    manager.process_message({'type': 'subscriptions', 'channels': []})
+    assert manager.get_book('ETH-USD').get_bid() == Decimal('10.00')
+    assert manager.get_book('BTC-USD').get_depth('buy') == []
+
+    rates = manager.get_message_rates()
+    assert set(rates) == {'BTC-USD', 'ETH-USD'}
+    assert rates['ETH-USD'] > 0 and rates['BTC-USD'] == 0
+    assert manager.get_message_rates()['ETH-USD'] == 0
+
+
+def test_order_book_manager_resyncs_one_book():
+    manager = OrderBookManager(['BTC-USD', 'ETH-USD'], compact=True)
+    for book in (manager.get_book('BTC-USD'), manager.get_book('ETH-USD')):
+        assert book._new_order is OrderRecord
+        book._sequence = 5
+    manager.resync('ETH-USD')
+    assert manager.get_book('ETH-USD')._sequence == -1
+    assert manager.get_book('BTC-USD')._sequence == 5
+
+
+def test_l2_order_book_manager_resync_waits_for_snapshot():
+    manager = OrderBookManager(['BTC-USD'], book_class=L2OrderBook)
+    snapshot = {'type': 'snapshot', 'product_id': 'BTC-USD',
+                'bids': [['100.00', '1']], 'asks': [['101.00', '2']]}
+    update = {'type': 'l2update', 'product_id': 'BTC-USD',
+              'changes': [['buy', '100.50', '0.5']]}
+    manager.process_message(snapshot)
+    manager.resync()
+    book = manager.get_book('BTC-USD')
+    assert book.get_depth('buy') == []
+    manager.process_message(update)
+    assert book.get_depth('buy') == []
+    manager.process_message(snapshot)
+    manager.process_message(update)
+    assert book.get_bid() == Decimal('100.50')
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'compact': True},
+                                    {'fixed_point': {'quote_increment': '0.01',
+                                                     'base_increment': '0.00000001'}}])
+def test_snapshot_round_trip(tmpdir, kwargs):
+    book = OrderBook(product_id='BTC-USD', **kwargs)
+    for i, (side, price, size) in enumerate([('buy', '100.00', '1.5'),
+                                             ('buy', '100.00', '0.00000001'),
+                                             ('buy', '99.50', '3'),
+                                             ('sell', '100.25', '2.25')]):
+        book.add({'id': str(uuid.UUID(int=i)), 'side': side, 'price': price,
+                  'size': size})
+    book._sequence = 1234
+    path = str(tmpdir.join('book.bin'))
+    book.save_snapshot(path)
+
+    restored = OrderBook(product_id='BTC-USD', **kwargs)
+    restored.load_snapshot(path)
+    assert restored.get_current_book() == book.get_current_book()
+    assert restored._sequence == 1234
+    assert restored.best_bid_size() == Decimal('1.50000001')
+    assert restored._orders.keys() == book._orders.keys()
+
+    with pytest.raises(ValueError):
+        OrderBook(product_id='ETH-USD').load_snapshot(path)
+
+
+def test_snapshot_across_storage_modes(tmpdir):
+    book = OrderBook(product_id='BTC-USD')
+    book.add({'id': str(uuid.UUID(int=1)), 'side': 'sell', 'price': '100.5',
+              'size': '0.1'})
+    path = str(tmpdir.join('book.bin'))
+    book.save_snapshot(path)
+    fixed = OrderBook(product_id='BTC-USD', fixed_point={
+        'quote_increment': '0.01', 'base_increment': '0.00000001'})
+    fixed.load_snapshot(path)
+    assert list(fixed._asks) == [10050]
+    assert fixed.get_current_book() == book.get_current_book()
+
+
+def test_subclass_attributes_do_not_clash():
+    class ConsoleBook(OrderBook):
+        # the names the README/__main__ console example caches its depths in
+        def __init__(self, **kwargs):
+            super(ConsoleBook, self).__init__(**kwargs)
+            self._bid_depth = Decimal('1')
+            self._ask_depth = Decimal('2')
+
+    book = ConsoleBook(product_id='BTC-USD')
+    book._sequence = 10
+    book.process_message(msg(11, type='open', order_id='b1', side='buy',
+                             price='100.00', remaining_size='2'))
+    book.process_message(msg(12, type='match', maker_order_id='b1',
+                             side='buy', price='100.00', size='0.5'))
+    book.process_message(msg(13, type='change', order_id='b1', side='buy',
+                             price='100.00', new_size='1'))
+    assert book.best_bid_size() == Decimal('1')
+
+
+def test_deep_level_keeps_queue_order():
+    book = OrderBook(product_id='BTC-USD')
+    ids = [str(uuid.UUID(int=i)) for i in range(100)]
+    for order_id in ids:
+        book.add({'id': order_id, 'side': 'sell', 'price': '101.00',
+                  'size': '1'})
+    book._sequence = 0
+    book.process_message(msg(1, type='done', order_id=ids[50], side='sell',
+                             price='101.00', reason='canceled'))
+    book.process_message(msg(2, type='match', maker_order_id=ids[0],
+                             side='sell', price='101.00', size='1'))
+    book.process_message(msg(3, type='open', order_id=ids[50], side='sell',
+                             price='101.00', remaining_size='2'))
+    level = book.get_asks(Decimal('101.00'))
+    assert [o['id'] for o in level] == ids[1:50] + ids[51:] + [ids[50]]
+    assert book.best_ask_size() == Decimal('100')
+    level.pop()
+    assert len(book.get_asks(Decimal('101.00'))) == 99
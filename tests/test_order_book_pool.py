@@ -0,0 +1,145 @@
+import pytest
+import json
+import math
+import time
+import uuid
+from cbpro.order_book import OrderBook, L2OrderBook
+from cbpro.order_book_pool import FrameRing, TopOfBookTable, OrderBookPool, \
+    PooledWebsocketClient
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(64)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def test_ring_wraps_and_keeps_order(ring):
+    reader = FrameRing(name=ring.name)
+    received = []
+    for i in range(200):
+        frame = ('frame-%d' % i).encode() * (i % 3 + 1)
+        if not ring.put(frame):
+            received.extend(reader.get_many())
+            assert ring.put(frame)
+    received.extend(reader.get_many())
+    reader.close()
+    assert received == [('frame-%d' % i).encode() * (i % 3 + 1)
+                        for i in range(200)]
+    assert ring.get_used() == 0
+
+
+def test_ring_full(ring):
+    assert ring.put(b'x' * 26)
+    assert ring.put(b'y' * 26)
+    assert not ring.put(b'z')
+    assert ring.get_many(1) == [b'x' * 26]
+    # the freed space is at the front; the tail is skipped
+    assert ring.put(b'z' * 26)
+    assert ring.get_many() == [b'y' * 26, b'z' * 26]
+    with pytest.raises(ValueError):
+        ring.put(b'w' * 61)
+
+
+def test_top_of_book_table():
+    table = TopOfBookTable(['BTC-USD', 'ETH-USD'])
+    reader = TopOfBookTable(['BTC-USD', 'ETH-USD'], name=table.name)
+    try:
+        assert reader.get('ETH-USD')['sequence'] == -1
+        assert math.isnan(reader.get('ETH-USD')['bid'])
+        table.publish('ETH-USD', 7, 100.5, 1.0, 101.0, 2.0)
+        top = reader.get('ETH-USD')
+        assert (top['sequence'], top['bid'], top['ask_size']) == \
+            (7, 100.5, 2.0)
+        assert top['time'] > 0
+        assert reader.get('BTC-USD')['sequence'] == -1
+    finally:
+        reader.close()
+        table.close()
+        table.unlink()
+
+
+def test_level2_pool():
+    pool = OrderBookPool(['BTC-USD', 'ETH-USD', 'LTC-USD'], workers=2,
+                         book_class=L2OrderBook, ring_size=4096)
+    pool.start()
+    try:
+        for product_id in pool.product_ids:
+            pool.put_message({'type': 'snapshot', 'product_id': product_id,
+                              'bids': [['99.00', '3']],
+                              'asks': [['101.00', '2']]})
+        # more than fits in a ring at once: put_frame waits for the worker
+        for i in range(1, 200):
+            pool.put_frame(json.dumps(
+                {'type': 'l2update', 'product_id': 'ETH-USD',
+                 'changes': [['buy', '{}.00'.format(99 + i), '1']]}))
+        pool.put_frame('{"type":"subscriptions","channels":[]}')
+        pool.put_frame('{"type":"ticker","product_id":"XRP-USD"}')
+        wait_for(lambda: pool.get_top('ETH-USD')['bid'] == 298.0)
+        wait_for(lambda: pool.get_top('LTC-USD')['bid'] == 99.0)
+        assert pool.get_top('LTC-USD')['ask_size'] == 2.0
+        assert pool.frames_unrouted == 2
+    finally:
+        pool.close()
+
+
+def test_level3_pool_from_snapshot(tmpdir):
+    book = OrderBook(product_id='BTC-USD')
+    book.add({'id': str(uuid.UUID(int=1)), 'side': 'buy',
+              'price': '100.00', 'size': '1.5'})
+    book.add({'id': str(uuid.UUID(int=2)), 'side': 'sell',
+              'price': '101.00', 'size': '2'})
+    book._sequence = 10
+    path = str(tmpdir.join('book.bin'))
+    book.save_snapshot(path)
+
+    pool = OrderBookPool(['BTC-USD'], workers=1,
+                         snapshots={'BTC-USD': path}, compact=True)
+    pool.start()
+    try:
+        wait_for(lambda: pool.get_top('BTC-USD')['sequence'] == 10)
+        pool.put_message({'type': 'open', 'sequence': 11,
+                          'product_id': 'BTC-USD',
+                          'order_id': str(uuid.UUID(int=3)), 'side': 'buy',
+                          'price': '100.50', 'remaining_size': '0.25'})
+        wait_for(lambda: pool.get_top('BTC-USD')['sequence'] == 11)
+        top = pool.get_top('BTC-USD')
+        assert (top['bid'], top['bid_size'], top['ask']) == \
+            (100.5, 0.25, 101.0)
+    finally:
+        pool.close()
+
+
+def test_pooled_websocket_client_passes_raw_frames():
+    class Pool(object):
+        def __init__(self):
+            self.frames = []
+
+        def put_frame(self, frame):
+            self.frames.append(frame)
+
+    pool = Pool()
+    client = PooledWebsocketClient(pool, channels=['full'])
+    frame = '{"type":"open","product_id":"BTC-USD"}'
+    client.on_message(client._decode(frame))
+    assert pool.frames == [frame]
+
+
+@pytest.mark.parametrize('option', ['stats', 'heartbeat'])
+def test_pooled_websocket_client_rejects_decoded_options(option):
+    with pytest.raises(ValueError):
+        PooledWebsocketClient(object(), channels=['full'], **{option: True})
+
+
+def test_invalid_overflow():
+    with pytest.raises(ValueError):
+        OrderBookPool(['BTC-USD'], overflow='spill')
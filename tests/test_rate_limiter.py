@@ -0,0 +1,58 @@
+import pytest
+import threading
+import time
+from cbpro.rate_limiter import TokenBucket, RateLimiter, RateLimitExceeded
+
+
+def test_burst_then_rate():
+    bucket = TokenBucket(rate=50, burst=5)
+    start = time.monotonic()
+    for _ in range(10):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+    # 5 from the burst, 5 more at 50/s
+    assert 0.08 < elapsed < 0.5
+    metrics = bucket.get_metrics()
+    assert metrics['acquired'] == 10
+    assert metrics['waited'] == 5
+    assert metrics['wait_time'] == pytest.approx(0.1, abs=0.03)
+
+
+def test_shared_between_threads():
+    bucket = TokenBucket(rate=100, burst=1)
+    start = time.monotonic()
+
+    def worker():
+        for _ in range(10):
+            bucket.acquire()
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 40 tokens at 100/s, whatever the number of threads
+    assert time.monotonic() - start > 0.35
+    assert bucket.acquired == 40
+
+
+def test_max_wait_rejects():
+    bucket = TokenBucket(rate=1, burst=1)
+    assert bucket.reserve(max_wait=0) == 0
+    with pytest.raises(RateLimitExceeded):
+        bucket.reserve(max_wait=0.5)
+    assert bucket.rejected == 1
+    assert bucket.acquired == 1
+
+
+def test_buckets_by_endpoint():
+    limiter = RateLimiter()
+    assert limiter.get_bucket('get', '/products', False) is limiter.public
+    assert limiter.get_bucket('get', '/orders', True) is limiter.private
+    assert limiter.get_bucket('post', '/orders', True) is limiter.orders
+    assert limiter.get_bucket('delete', '/orders/abc', True) is \
+        limiter.orders
+    shared = TokenBucket(5, 10)
+    limiter = RateLimiter(private=shared, orders=shared)
+    assert limiter.get_bucket('post', '/orders', True) is \
+        limiter.get_bucket('get', '/fills', True)
+    assert set(limiter.get_metrics()) == {'public', 'private', 'orders'}
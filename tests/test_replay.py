@@ -0,0 +1,87 @@
+import pytest
+import json
+import pickle
+from decimal import Decimal
+from cbpro.message_log import MessageLogWriter
+from cbpro.order_book import OrderBook, OrderBookManager
+from cbpro.replay import read_messages, replay
+
+B1 = '00000000-0000-0000-0000-0000000000b1'
+A1 = '00000000-0000-0000-0000-0000000000a1'
+FEED = [
+    {'type': 'open', 'sequence': 101, 'product_id': 'BTC-USD',
+     'order_id': B1, 'side': 'buy', 'price': '100.00',
+     'remaining_size': '1.0', 'time': '2018-01-01T00:00:00.000000Z'},
+    {'type': 'open', 'sequence': 51, 'product_id': 'ETH-USD',
+     'order_id': 'e1', 'side': 'sell', 'price': '10.00',
+     'remaining_size': '2.0', 'time': '2018-01-01T00:00:00.010000Z'},
+    {'type': 'open', 'sequence': 102, 'product_id': 'BTC-USD',
+     'order_id': A1, 'side': 'sell', 'price': '101.00',
+     'remaining_size': '0.5', 'time': '2018-01-01T00:00:00.020000Z'},
+    {'type': 'match', 'sequence': 103, 'product_id': 'BTC-USD',
+     'maker_order_id': B1, 'side': 'buy', 'price': '100.00',
+     'size': '0.25', 'time': '2018-01-01T00:00:00.030000Z'},
+    {'type': 'done', 'sequence': 104, 'product_id': 'BTC-USD',
+     'order_id': 'x', 'side': 'sell', 'price': '99.00',
+     'reason': 'filled', 'time': '2018-01-01T00:00:00.040000Z'},
+]
+
+
+def write_framed(path):
+    log = MessageLogWriter(path)
+    for message in FEED:
+        log.log(message)
+    log.close()
+
+
+def write_pickle(path):
+    with open(path, 'wb') as f:
+        for message in FEED:
+            pickle.dump(message, f)
+
+
+def write_json_lines(path):
+    with open(path, 'w') as f:
+        for message in FEED:
+            f.write(json.dumps(message) + '\n')
+
+
+@pytest.mark.parametrize('write', [write_framed, write_pickle,
+                                   write_json_lines])
+def test_read_messages_detects_format(tmpdir, write):
+    path = str(tmpdir.join('feed'))
+    write(path)
+    assert list(read_messages(path)) == FEED
+
+
+def test_replay_starts_empty_books_at_first_sequence():
+    books = OrderBookManager(['BTC-USD', 'ETH-USD'])
+    stats = replay(FEED, books)
+    assert stats['messages'] == len(FEED)
+    btc = books.get_book('BTC-USD')
+    assert btc._sequence == 104
+    assert btc.best_bid_size() == Decimal('0.75')
+    assert btc.get_ask() == Decimal('101.00')
+    assert books.get_book('ETH-USD').get_ask() == Decimal('10.00')
+
+
+def test_replay_on_top_of_snapshot(tmpdir):
+    book = OrderBook(product_id='BTC-USD')
+    replay(FEED[:2], book)
+    path = str(tmpdir.join('book.bin'))
+    book.save_snapshot(path)
+
+    restored = OrderBook(product_id='BTC-USD')
+    restored.load_snapshot(path)
+    replay(FEED, restored)
+    assert restored._sequence == 104
+    assert restored.get_ask() == Decimal('101.00')
+    assert restored.best_bid_size() == Decimal('0.75')
+
+
+def test_replay_speed(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('time.sleep', sleeps.append)
+    replay(FEED, OrderBookManager(['BTC-USD', 'ETH-USD']), speed=0.5)
+    assert len(sleeps) == 4
+    assert max(sleeps) == pytest.approx(0.08, abs=0.01)
@@ -0,0 +1,271 @@
+import pytest
+import json
+import requests
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from cbpro.public_client import PublicClient, create_session
+from cbpro.authenticated_client import AuthenticatedClient
+from cbpro.rate_limiter import RateLimiter, TokenBucket
+from cbpro.retry import RetryPolicy
+
+
+class APIServer(object):
+    """Local REST API. `responses` maps a path to a list of
+    (status, headers, body) replies, served in turn; the last one repeats.
+    Every request is recorded as (method, path, query), and the client port
+    of every connection in `connections`.
+    """
+    def __init__(self, responses):
+        self.responses = dict((path, list(replies))
+                              for path, replies in responses.items())
+        self.requests = []
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self):
+                server.connections.add(self.client_address[1])
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                parts = urlsplit(self.path)
+                server.requests.append((self.command, parts.path,
+                                        parse_qs(parts.query)))
+                replies = server.responses.get(parts.path)
+                if not replies:
+                    status, headers, body = 404, {}, {'message': 'NotFound'}
+                else:
+                    status, headers, body = replies[0]
+                    if len(replies) > 1:
+                        replies.pop(0)
+                if callable(body):
+                    body = body(parse_qs(parts.query))
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_DELETE = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('localhost', 0), Handler)
+        self.url = 'http://localhost:{}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def api():
+    servers = []
+
+    def start(responses):
+        servers.append(APIServer(responses))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_rate_limiter_is_shared_between_clients(api):
+    server = api({'/time': [(200, {}, {'epoch': 1})]})
+    limiter = RateLimiter(public=TokenBucket(rate=50, burst=2))
+    clients = [PublicClient(api_url=server.url, rate_limiter=limiter)
+               for _ in range(3)]
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda c=c: [c.get_time()
+                                                    for _ in range(4)])
+               for c in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 12 requests, 2 from the burst and 10 at 50/s
+    assert time.monotonic() - start > 0.18
+    metrics = limiter.get_metrics()
+    assert metrics['public']['acquired'] == 12
+    assert metrics['public']['waited'] == 10
+    assert metrics['private']['acquired'] == 0
+
+
+def test_rate_limiter_buckets_and_throttled_count(api):
+    server = api({'/orders': [(429, {}, {'message': 'Slow down'})],
+                  '/fills': [(200, {}, [])]})
+    limiter = RateLimiter()
+    client = AuthenticatedClient('key', 'c2VjcmV0', 'pass',
+                                 api_url=server.url, rate_limiter=limiter)
+    assert client.place_limit_order('BTC-USD', 'buy', '1.00', '1') == \
+        {'message': 'Slow down'}
+    assert list(client.get_fills(product_id='BTC-USD')) == []
+    metrics = limiter.get_metrics()
+    assert metrics['orders']['acquired'] == 1
+    assert metrics['orders']['throttled'] == 1
+    assert metrics['private']['acquired'] == 1
+
+
+def test_retry_on_server_errors(api):
+    server = api({'/time': [(503, {}, {'message': 'down'}),
+                            (429, {'Retry-After': '0'}, {'message': 'slow'}),
+                            (200, {}, {'epoch': 1})]})
+    client = PublicClient(api_url=server.url,
+                          retry=RetryPolicy(attempts=3, backoff=0.01))
+    assert client.get_time() == {'epoch': 1}
+    assert len(server.requests) == 3
+
+
+def test_retries_run_out(api):
+    server = api({'/time': [(503, {}, {'message': 'down'})]})
+    client = PublicClient(api_url=server.url,
+                          retry=RetryPolicy(attempts=2, backoff=0.01))
+    assert client.get_time() == {'message': 'down'}
+    assert len(server.requests) == 2
+    client = PublicClient(api_url=server.url, retry=None)
+    client.get_time()
+    assert len(server.requests) == 3
+
+
+def test_orders_are_not_retried(api):
+    server = api({'/orders': [(503, {}, {'message': 'down'}),
+                              (200, {}, {'id': 'a'})]})
+    client = AuthenticatedClient('key', 'c2VjcmV0', 'pass',
+                                 api_url=server.url,
+                                 retry=RetryPolicy(backoff=0.01))
+    assert client.place_limit_order('BTC-USD', 'buy', '1.00', '1') == \
+        {'message': 'down'}
+    assert len(server.requests) == 1
+
+
+def test_pagination_resumes_after_retry(api):
+    server = api({'/products/BTC-USD/trades': [
+        (200, {'cb-after': '2'}, [{'trade_id': 1}, {'trade_id': 2}]),
+        (502, {}, {'message': 'bad gateway'}),
+        (200, {}, [{'trade_id': 3}])]})
+    client = PublicClient(api_url=server.url,
+                          retry=RetryPolicy(backoff=0.01))
+    trades = [t['trade_id'] for t in client.get_product_trades('BTC-USD')]
+    assert trades == [1, 2, 3]
+    assert [query.get('after') for _, _, query in server.requests] == \
+        [None, ['2'], ['2']]
+
+
+def test_retry_connection_errors():
+    server = APIServer({})
+    url = server.url
+    server.shutdown()
+    client = PublicClient(api_url=url,
+                          retry=RetryPolicy(attempts=3, backoff=0.1))
+    start = time.monotonic()
+    with pytest.raises(requests.ConnectionError):
+        client.get_time()
+    # two backoffs of at least 0.05s and 0.1s
+    assert time.monotonic() - start >= 0.15
+
+
+def test_read_timeout(api):
+    def slow(query):
+        time.sleep(0.5)
+        return {'epoch': 1}
+    server = api({'/time': [(200, {}, slow)]})
+    client = PublicClient(api_url=server.url, timeout=(1, 0.1), retry=None)
+    start = time.monotonic()
+    with pytest.raises(requests.ReadTimeout):
+        client.get_time()
+    assert time.monotonic() - start < 0.4
+    assert PublicClient(api_url=server.url, timeout=2).get_time() == \
+        {'epoch': 1}
+
+
+def test_shared_session_keeps_connections_alive(api):
+    server = api({'/time': [(200, {}, {'epoch': 1})],
+                  '/fills': [(200, {}, [])]})
+    session = create_session(pool_size=4)
+    public = PublicClient(api_url=server.url, session=session)
+    private = AuthenticatedClient('key', 'c2VjcmV0', 'pass',
+                                  api_url=server.url, session=session)
+    assert public.session is private.session is session
+    for _ in range(3):
+        public.get_time()
+        list(private.get_fills(product_id='BTC-USD'))
+    assert len(server.connections) == 1
+
+
+def test_keep_alive_off(api):
+    server = api({'/time': [(200, {}, {'epoch': 1})]})
+    client = PublicClient(api_url=server.url, keep_alive=False)
+    for _ in range(3):
+        client.get_time()
+    assert len(server.connections) == 3
+
+
+def test_pool_size_and_adapter():
+    client = PublicClient(pool_size=32)
+    adapter = client.session.get_adapter('https://api.pro.coinbase.com')
+    assert adapter._pool_maxsize == 32
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=7)
+    client = AuthenticatedClient('key', 'c2VjcmV0', 'pass', adapter=adapter)
+    assert client.session.get_adapter('https://api.pro.coinbase.com') is \
+        adapter
+
+
+def candles(query):
+    """Candles for the requested range, newest first, as the exchange
+    sends them."""
+    start, end = (datetime.fromisoformat(query[k][0]).timestamp()
+                  for k in ('start', 'end'))
+    granularity = int(query['granularity'][0])
+    assert (end - start) / granularity < 200
+    # one candle before the range, to be deduplicated
+    times = range(int(end), int(start) - granularity - 1, -granularity)
+    return [[t, 1.0, 3.0, 2.0, 2.5, t / 60.0] for t in times]
+
+
+def test_historic_rates_range(api):
+    server = api({'/products/BTC-USD/candles': [(200, {}, candles)]})
+    limiter = RateLimiter(public=TokenBucket(rate=100, burst=2))
+    client = PublicClient(api_url=server.url, rate_limiter=limiter)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    rates = client.get_historic_rates_range(
+        'BTC-USD', start, start + timedelta(minutes=999), 60)
+    assert len(server.requests) == 5
+    assert limiter.get_metrics()['public']['acquired'] == 5
+    first = int(start.timestamp())
+    # 999 minutes, plus the candle before the range
+    assert list(rates['time']) == list(range(first - 60, first + 999 * 60 + 1,
+                                             60))
+    assert rates['time'].typecode == 'q'
+    assert rates['close'].typecode == 'd'
+    assert list(rates['volume'][:2]) == [(first - 60) / 60.0, first / 60.0]
+    assert set(rates) == {'time', 'low', 'high', 'open', 'close', 'volume'}
+
+
+def test_historic_rates_range_is_paced_without_limiter(api):
+    server = api({'/products/BTC-USD/candles': [(200, {}, candles)]})
+    client = PublicClient(api_url=server.url)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    began = time.monotonic()
+    client.get_historic_rates_range(
+        'BTC-USD', start, start + timedelta(minutes=1599), 60, workers=8)
+    assert len(server.requests) == 8
+    # a burst of 6, then 2 more at the public rate of 3/s
+    assert time.monotonic() - began > 0.6
+
+
+def test_historic_rates_range_error(api):
+    server = api({'/products/XXX-USD/candles': [
+        (404, {}, {'message': 'NotFound'})]})
+    client = PublicClient(api_url=server.url)
+    with pytest.raises(ValueError):
+        client.get_historic_rates_range('XXX-USD', '2020-01-01T00:00:00Z',
+                                        '2020-01-02T00:00:00Z', 3600)
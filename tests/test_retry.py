@@ -0,0 +1,32 @@
+import pytest
+import time
+from email.utils import formatdate
+from cbpro.retry import RetryPolicy, parse_retry_after
+
+
+def test_backoff_grows_with_jitter():
+    retry = RetryPolicy(backoff=1, max_backoff=5)
+    for attempt, delay in [(1, 1), (2, 2), (3, 4), (4, 5), (10, 5)]:
+        delays = [retry.get_delay(attempt) for _ in range(200)]
+        assert all(delay / 2 <= d <= delay for d in delays)
+        assert len(set(delays)) > 1
+
+
+def test_retry_after():
+    retry = RetryPolicy(max_retry_after=60)
+    assert retry.get_delay(1, '7') == 7
+    assert retry.get_delay(1, '3600') == 60
+    assert retry.get_delay(1, formatdate(time.time() + 30, usegmt=True)) == \
+        pytest.approx(30, abs=2)
+    # invalid header falls back to backoff
+    assert retry.get_delay(1, 'soon') <= retry.backoff
+    assert parse_retry_after(formatdate(0, usegmt=True)) == 0
+
+
+def test_only_idempotent_methods():
+    retry = RetryPolicy(attempts=3)
+    assert retry.can_retry('GET', 1)
+    assert retry.can_retry('delete', 2)
+    assert not retry.can_retry('get', 3)
+    assert not retry.can_retry('post', 1)
+    assert RetryPolicy(methods=['get', 'post']).can_retry('POST', 1)
@@ -0,0 +1,106 @@
+import pytest
+import json
+import time
+from cbpro.sharded_feed import ShardedWebsocketFeed
+
+websockets = pytest.importorskip('websockets')
+
+from test_websocket_client import FeedServer, wait_for
+
+PRODUCTS = ['BTC-USD', 'ETH-USD', 'LTC-USD', 'BCH-USD', 'ETC-USD']
+
+
+class ProductFeedServer(FeedServer):
+    """Sends `count` sequenced messages for each subscribed product."""
+    def __init__(self, count):
+        self.count = count
+        super(ProductFeedServer, self).__init__([])
+
+    async def _handler(self, ws):
+        subscription = json.loads(await ws.recv())
+        self.subscriptions.append(subscription)
+        for i in range(self.count):
+            for product_id in subscription['product_ids']:
+                await ws.send(json.dumps({'type': 'ticker', 'sequence': i,
+                                          'product_id': product_id}))
+        await ws.wait_closed()
+
+
+@pytest.fixture
+def server():
+    server = ProductFeedServer(50)
+    yield server
+    server.shutdown()
+
+
+class RecordingFeed(ShardedWebsocketFeed):
+    def on_open(self):
+        self.messages = []
+        self.errors = []
+        self.closed = 0
+
+    def on_message(self, msg):
+        self.messages.append(msg)
+
+    def on_error(self, e, shard=None):
+        self.errors.append((shard, e))
+
+    def on_close(self):
+        self.closed += 1
+
+
+def test_products_are_dealt_over_shards():
+    feed = ShardedWebsocketFeed(PRODUCTS, channels=['full'], shards=2)
+    assert feed.shard_products == [['BTC-USD', 'LTC-USD', 'ETC-USD'],
+                                   ['ETH-USD', 'BCH-USD']]
+    assert feed.product_shards['BCH-USD'] == 1
+    # never more connections than products
+    feed = ShardedWebsocketFeed('BTC-USD', channels=['full'], shards=4)
+    assert feed.shard_products == [['BTC-USD']]
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_merged_stream_is_ordered_per_product(server, processes):
+    feed = RecordingFeed(PRODUCTS, channels=['ticker'], shards=3,
+                         processes=processes, url=server.url)
+    feed.start()
+    wait_for(lambda: len(feed.messages) == 50 * len(PRODUCTS), timeout=10)
+    feed.close()
+    assert feed.errors == []
+    assert feed.closed == 1
+    assert sorted(s['product_ids'] for s in server.subscriptions) == \
+        sorted(feed.shard_products)
+    for product_id in PRODUCTS:
+        sequences = [m['sequence'] for m in feed.messages
+                     if m['product_id'] == product_id]
+        assert sequences == list(range(50))
+    assert feed.messages_received == [100, 100, 50]
+
+
+def test_failed_shard_is_reported(server):
+    feed = RecordingFeed(PRODUCTS, channels=['ticker'], shards=2,
+                         url=server.url)
+    feed.start()
+    wait_for(lambda: len(feed.messages) == 50 * len(PRODUCTS))
+    server.shutdown()
+    wait_for(lambda: len(feed.errors) == 2)
+    start = time.time()
+    feed.close()
+    assert time.time() - start < 5
+    assert sorted(shard for shard, _ in feed.errors) == [0, 1]
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_unreachable_url(processes):
+    from test_websocket_client import unreachable_url
+    feed = RecordingFeed(PRODUCTS, channels=['ticker'], shards=2,
+                         processes=processes, url=unreachable_url())
+    feed.start()
+    wait_for(lambda: len(feed.errors) == 2, timeout=10)
+    wait_for(lambda: feed.closed == 1)
+    start = time.time()
+    feed.close()
+    assert time.time() - start < 5
+    assert not feed._dispatcher.is_alive()
+    assert sorted(shard for shard, _ in feed.errors) == [0, 1]
+    assert feed.closed == 1
@@ -0,0 +1,391 @@
+import pytest
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+from decimal import Decimal
+from queue import Full
+from cbpro.order_book import OrderBook, fixed_point_parser
+from websocket import WebSocketTimeoutException
+from cbpro.websocket_client import WebsocketClient, get_json_decoder
+
+websockets = pytest.importorskip('websockets')
+
+
+class FeedServer(object):
+    """Local websocket feed: records subscriptions, then sends `frames`.
+
+    `sessions` lists the frames sent on successive connections; the server
+    drops every connection but the last after sending them.
+    """
+    def __init__(self, frames=None, sessions=None):
+        self.sessions = sessions or [frames]
+        self.subscriptions = []
+        self.started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        self.started.wait(5)
+
+    @property
+    def url(self):
+        return 'ws://localhost:{}'.format(self.port)
+
+    async def _handler(self, ws):
+        self.subscriptions.append(json.loads(await ws.recv()))
+        session = len(self.subscriptions) - 1
+        for frame in self.sessions[min(session, len(self.sessions) - 1)]:
+            await ws.send(frame)
+        if session < len(self.sessions) - 1:
+            await ws.close()
+        else:
+            await ws.wait_closed()
+
+    def _run(self):
+        async def serve():
+            async with websockets.serve(self._handler, 'localhost', 0,
+                                        close_timeout=0.1) as srv:
+                self.port = srv.sockets[0].getsockname()[1]
+                self.stopped = asyncio.Event()
+                self.started.set()
+                await self.stopped.wait()
+        self.loop.run_until_complete(serve())
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join(5)
+
+
+@pytest.fixture
+def feed():
+    servers = []
+
+    def start(frames=None, sessions=None):
+        servers.append(FeedServer(frames, sessions))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def ticks(n):
+    return [json.dumps({'type': 'ticker', 'sequence': i}) for i in range(n)]
+
+
+class RecordingClient(WebsocketClient):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('channels', ['ticker'])
+        kwargs.setdefault('should_print', False)
+        super(RecordingClient, self).__init__(*args, **kwargs)
+        self.messages = []
+        self.errors = []
+        self.reconnected = 0
+        self.handler_delay = 0
+
+    def _keepalive(self, interval=0.05):
+        super(RecordingClient, self)._keepalive(interval)
+
+    def on_message(self, msg):
+        time.sleep(self.handler_delay)
+        self.messages.append(msg)
+
+    def on_reconnect(self):
+        self.reconnected += 1
+
+    def on_error(self, e, data=None):
+        self.errors.append(e)
+        super(RecordingClient, self).on_error(e, data)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_inline_dispatch(feed):
+    server = feed(ticks(5))
+    client = RecordingClient(url=server.url, products='BTC-USD')
+    client.start()
+    wait_for(lambda: len(client.messages) == 5)
+    client.close()
+    assert [m['sequence'] for m in client.messages] == list(range(5))
+    assert server.subscriptions[0]['product_ids'] == ['BTC-USD']
+
+
+def test_queued_dispatch_keeps_order_with_one_worker(feed):
+    server = feed(ticks(200))
+    client = RecordingClient(url=server.url, queue_size=1000)
+    client.start()
+    wait_for(lambda: len(client.messages) == 200)
+    client.close()
+    assert [m['sequence'] for m in client.messages] == list(range(200))
+    assert client.get_queue_depth() == 0
+    assert client.frames_dropped == 0
+
+
+def test_drop_oldest_overflow(feed):
+    server = feed(ticks(50))
+    client = RecordingClient(url=server.url, queue_size=5,
+                             overflow='drop_oldest')
+    client.handler_delay = 0.02
+    client.start()
+    wait_for(lambda: client.frames_dropped + len(client.messages) == 50)
+    client.close()
+    assert client.frames_dropped > 0
+    assert client.max_queue_depth <= 5
+    assert client.messages[-1]['sequence'] == 49
+
+
+def test_raise_overflow_reports_error(feed):
+    server = feed(ticks(50))
+    client = RecordingClient(url=server.url, queue_size=2, overflow='raise')
+    client.handler_delay = 0.05
+    client.start()
+    wait_for(lambda: client.errors)
+    client.close()
+    assert isinstance(client.errors[0], Full)
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        WebsocketClient(channels=['ticker'], overflow='ignore')
+
+
+OPEN = json.dumps({'type': 'open', 'sequence': 11, 'product_id': 'BTC-USD',
+                   'order_id': 'b1', 'side': 'buy', 'price': '100.01',
+                   'remaining_size': '1.50000000'})
+
+
+@pytest.mark.parametrize('name', ['json', 'orjson', 'ujson'])
+def test_get_json_decoder(name):
+    try:
+        loads = get_json_decoder(name)
+    except ImportError:
+        pytest.skip('{} is not installed'.format(name))
+    assert loads(OPEN)['price'] == '100.01'
+
+
+def test_default_decoder_is_fastest_installed():
+    client = WebsocketClient(channels=['ticker'])
+    assert client._decode is get_json_decoder()
+
+
+def test_parse_numbers_decimal():
+    decode = WebsocketClient(channels=['full'], parse_numbers=Decimal)._decode
+    msg = decode(OPEN)
+    assert msg['price'] == Decimal('100.01')
+    assert msg['remaining_size'] == Decimal('1.5')
+    assert msg['sequence'] == 11
+    msg = decode(json.dumps({'type': 'l2update', 'changes': [
+        ['buy', '100.01', '0.5']]}))
+    assert msg['changes'] == [['buy', Decimal('100.01'), Decimal('0.5')]]
+
+
+def test_parse_numbers_into_order_book_ticks():
+    product = {'quote_increment': '0.01', 'base_increment': '0.00000001'}
+    to_ticks = fixed_point_parser(product['quote_increment'])
+    to_lots = fixed_point_parser(product['base_increment'])
+    decode = WebsocketClient(channels=['full'], parse_numbers={
+        'price': to_ticks, 'remaining_size': to_lots, 'size': to_lots,
+        'new_size': to_lots})._decode
+    msg = decode(OPEN)
+    assert (msg['price'], msg['remaining_size']) == (10001, 150000000)
+
+    book = OrderBook(product_id='BTC-USD', fixed_point=product)
+    book._sequence = 10
+    book.process_message(msg)
+    assert book.get_current_book()['bids'] == [[Decimal('100.01'),
+                                                Decimal('1.5'), 'b1']]
+
+
+def test_queued_dispatch_uses_decoder(feed):
+    server = feed([OPEN])
+    client = RecordingClient(url=server.url, queue_size=10,
+                             parse_numbers=Decimal)
+    client.start()
+    wait_for(lambda: client.messages)
+    client.close()
+    assert client.messages[0]['price'] == Decimal('100.01')
+
+
+def test_reconnect_resubscribes(feed):
+    server = feed(sessions=[ticks(3), ticks(2)])
+    client = RecordingClient(url=server.url, products=['BTC-USD'],
+                             auth=True, api_key='key', api_secret='c2VjcmV0',
+                             api_passphrase='pass', reconnect=True,
+                             reconnect_delay=0.01)
+    client.start()
+    wait_for(lambda: len(client.messages) == 5)
+    client.close()
+    assert client.reconnected == client.reconnect_count == 1
+    assert client.errors == []
+    assert client.downtime > 0
+    assert len(server.subscriptions) == 2
+    assert server.subscriptions[1]['product_ids'] == ['BTC-USD']
+    assert server.subscriptions[1]['signature']
+
+
+def test_reconnect_gives_up_after_max_reconnects(feed):
+    server = feed(ticks(1))
+    client = RecordingClient(url=server.url, reconnect=True,
+                             reconnect_delay=0.01, max_reconnects=2)
+    client.start()
+    wait_for(lambda: client.messages)
+    server.shutdown()
+    wait_for(lambda: client.errors)
+    client.close()
+    assert client.reconnect_count == 0
+
+
+@pytest.mark.parametrize('queue_size', [None, 100])
+def test_stats(feed, queue_size):
+    frames = [json.dumps({'type': 'open', 'sequence': i,
+                          'product_id': 'BTC-USD',
+                          'time': '2020-01-01T00:00:00.000000Z'})
+              for i in (1, 2, 4)]
+    server = feed(frames)
+    client = RecordingClient(url=server.url, queue_size=queue_size,
+                             channels=['full'], stats=True)
+    assert client.stats()['messages'] == 0
+    client.start()
+    wait_for(lambda: len(client.messages) == 3)
+    client.close()
+    stats = client.stats()
+    assert stats['message_counts'] == {'open': 3}
+    assert stats['sequence_gaps'] == {'BTC-USD': 1}
+    # recorded years after the message times
+    assert stats['exchange_latency']['min'] > 3600
+    assert stats['dispatch_latency']['count'] == 3
+    assert stats['queue_depth'] == 0
+    assert RecordingClient().stats() is None
+
+
+class SilentServer(object):
+    """Completes the websocket handshake, then never sends a byte: a
+    half-open connection as seen from the client.
+    """
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('localhost', 0))
+        self.sock.listen(5)
+        self.url = 'ws://localhost:{}'.format(self.sock.getsockname()[1])
+        self.connections = []
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            request = b''
+            while b'\r\n\r\n' not in request:
+                request += conn.recv(4096)
+            key = re.search(rb'Sec-WebSocket-Key: (\S+)', request).group(1)
+            accept = base64.b64encode(hashlib.sha1(
+                key + b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11').digest())
+            conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\n'
+                         b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                         b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+    def shutdown(self):
+        self.sock.close()
+        for conn in self.connections:
+            conn.close()
+
+
+def test_half_open_connection_is_detected():
+    server = SilentServer()
+    client = RecordingClient(url=server.url, stale_timeout=0.2,
+                             heartbeat_interval=0.05)
+    start = time.time()
+    client.start()
+    wait_for(lambda: client.errors)
+    assert time.time() - start < 2
+    assert isinstance(client.errors[0], WebSocketTimeoutException)
+    assert client.last_pong is None
+    client.close()
+    server.shutdown()
+
+
+def test_stalled_feed_reconnects(feed):
+    heartbeat = json.dumps({'type': 'heartbeat', 'sequence': 90,
+                            'last_trade_id': 20, 'product_id': 'BTC-USD'})
+    # the first session goes quiet but keeps answering pings
+    server = feed(sessions=[ticks(3) + [heartbeat], ticks(2)])
+    client = RecordingClient(url=server.url, heartbeat=True, reconnect=True,
+                             reconnect_delay=0.01, stale_timeout=0.3,
+                             heartbeat_interval=0.05)
+    client.start()
+    wait_for(lambda: len(client.messages) == 5)
+    client.close()
+    assert client.reconnect_count == 1
+    assert client.errors == []
+    assert client.last_pong is not None
+    assert client.last_heartbeat['BTC-USD']['sequence'] == 90
+    assert all(m['type'] == 'ticker' for m in client.messages)
+    assert server.subscriptions[0]['channels'] == ['ticker', 'heartbeat']
+
+
+def test_pongs_keep_quiet_connection_alive(feed):
+    server = feed(ticks(1))
+    client = RecordingClient(url=server.url, stale_timeout=0.2,
+                             heartbeat_interval=0.05)
+    client.start()
+    time.sleep(0.6)
+    client.close()
+    assert client.errors == []
+    assert len(client.messages) == 1
+    assert client.last_pong > client.last_message
+
+
+def unreachable_url():
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'ws://localhost:{}'.format(port)
+
+
+@pytest.mark.parametrize('reconnect', [False, True])
+def test_failed_first_connect_is_reported(reconnect):
+    client = RecordingClient(url=unreachable_url(), reconnect=reconnect,
+                             reconnect_delay=0.01, max_reconnects=2)
+    client.start()
+    wait_for(lambda: client.errors)
+    client.thread.join(5)
+    assert not client.thread.is_alive()
+    assert isinstance(client.error, OSError)
+    assert client.reconnect_count == 0
+    client.close()
+
+
+def test_failed_first_connect_is_retried(feed):
+    server = feed(ticks(3))
+
+    class FlakyClient(RecordingClient):
+        attempts = 0
+
+        def _connect(self):
+            self.attempts += 1
+            if self.attempts == 1:
+                raise ConnectionRefusedError('not yet')
+            super(FlakyClient, self)._connect()
+
+    client = FlakyClient(url=server.url, reconnect=True, reconnect_delay=0.01)
+    client.start()
+    wait_for(lambda: len(client.messages) == 3)
+    client.close()
+    assert client.attempts == 2
+    assert client.errors == []
+    assert client.reconnect_count == 1